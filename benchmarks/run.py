@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+""" Performance benchmarks
+
+This module is used to track the cost of the data fetching and
+analytics paths. Each benchmark is registered by name and prints its
+own measurements, so regressions show up when comparing runs.
+
+Usage:
+    python -m benchmarks.run [name ...]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from tests.feeds import CountingClient, SnapshotClient, full_feed, random_walk_panel, replay
+
+BENCHMARKS = {}
+""" dict: Benchmark name to callable mapping
+"""
+
+
+def benchmark(name: str):
+    """ Register a benchmark under `name` """
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+def timed(fn, *args, repeat: int = 3, **kwargs) -> float:
+    """ Best wall-clock time in seconds of `repeat` calls to `fn` """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@benchmark('candle-requests')
+def candle_requests():
+    """ HTTP calls per (range, granularity) for the legacy fixed 300 minute
+    window against granularity-aware window sizing.
+    """
+    from plotr_signal.modules.backfill import CandleBackfill, TokenBucket
+
+    backfill = CandleBackfill(client_factory=CountingClient, limiter=TokenBucket(rate=1e9, capacity=1e9))
+    end = datetime(2021, 1, 1)
+
+    print(f"{'range':>8} {'granularity':>12} {'legacy':>8} {'sized':>8} {'reduction':>10}")
+    for days in (1, 30, 365):
+        start = end - timedelta(days=days)
+        for granularity in (60, 300, 900, 3600, 21600, 86400):
+            CountingClient.calls = 0
+            backfill.fetch('BTC-USD', start, end, granularity=granularity, delta=timedelta(minutes=300))
+            legacy = CountingClient.calls
+
+            CountingClient.calls = 0
+            backfill.fetch('BTC-USD', start, end, granularity=granularity)
+            sized = CountingClient.calls
+
+            print(f"{str(days) + 'd':>8} {granularity:>12} {legacy:>8} {sized:>8} {legacy / sized:>9.1f}x")
+
+
+@benchmark('indicator-panel')
+def indicator_panel():
+    """ MACD/RSI/STOCH for a whole watchlist in one vectorized pass against
+    looping the per-symbol QuantLib classmethods.
+    """
+    from pandas import DataFrame
+    from plotr_signal.modules.quantlib import QuantLib
+
+    for bars, symbols in ((1440, 100), (1440, 1000)):
+        high, low, close = random_walk_panel(bars, symbols)
+
+        def looped():
+            for symbol in close.columns:
+                frame = DataFrame({"high": high[symbol], "low": low[symbol], "close": close[symbol]}).dropna()
+                QuantLib.MACD(frame)
+                QuantLib.RSI(frame)
+                QuantLib.STOCH(frame)
+
+        def panel():
+            QuantLib.MACD_panel(close)
+            QuantLib.RSI_panel(close)
+            QuantLib.STOCH_panel(high, low, close)
+
+        loop_t, panel_t = timed(looped, repeat=1), timed(panel, repeat=1)
+        print(f"{bars} bars x {symbols} symbols: looped {loop_t:.3f}s  panel {panel_t:.3f}s  "
+              f"speedup {loop_t / panel_t:.1f}x")
+
+
+@benchmark('indicator-graph')
+def indicator_graph():
+    """ 20 indicators over one series through the shared-node graph against
+    20 independent QuantLib calls.
+    """
+    import numpy as np
+    from pandas import DataFrame
+    from plotr_signal.modules.quantlib import QuantLib
+    from plotr_signal.modules.indicator_graph import IndicatorGraph
+
+    high, low, close = random_walk_panel(200_000, 1)
+    frame = DataFrame({"high": high.iloc[:, 0], "low": low.iloc[:, 0], "close": close.iloc[:, 0]}).dropna()
+
+    macds = [(short, long, 9) for short in (5, 8, 12) for long in (21, 26, 34)]
+    rsis, stochs = (7, 14, 21, 28), (5, 9, 14, 21, 28, 34, 55)
+
+    def independent():
+        for short, long, signal in macds:
+            QuantLib.MACD(frame, short, long, signal)
+        for period in rsis:
+            QuantLib.RSI(frame, period)
+        for period in stochs:
+            QuantLib.STOCH(frame, period)
+
+    graph = IndicatorGraph()
+    for short, long, signal in macds:
+        graph.macd(short, long, signal)
+    for period in rsis:
+        graph.rsi(period)
+    for period in stochs:
+        graph.stoch(period)
+
+    independent_t, graph_t = timed(independent, repeat=1), timed(graph.evaluate, frame, repeat=1)
+    result = graph.evaluate(frame)
+    error = np.nanmax(np.abs(result["macd_12_26_9"].to_numpy() - QuantLib.MACD(frame)["macd"].to_numpy()))
+    print(f"{len(macds) + len(rsis) + len(stochs)} indicators, {len(graph.outputs)} outputs, "
+          f"{graph.evaluations} distinct nodes")
+    print(f"independent {independent_t:.3f}s  graph {graph_t:.3f}s  speedup {independent_t / graph_t:.1f}x  "
+          f"macd_12_26_9 max abs diff {error:.2e}")
+
+
+@benchmark('indicator-sweep')
+def indicator_sweep():
+    """ MACD/RSI parameter grids through the batched sweep against nested
+    loops of QuantLib calls.
+    """
+    import numpy as np
+    from pandas import DataFrame
+    from plotr_signal.modules.quantlib import QuantLib
+    from plotr_signal.modules.sweep import macd_grid, sweep_macd, sweep_rsi
+
+    _, _, close = random_walk_panel(20_000, 1)
+    close = close.iloc[:, 0].dropna().to_numpy()
+    frame = DataFrame({"close": close})
+    grid = macd_grid(range(4, 20), range(20, 60, 2), (5, 9, 13))
+    periods = list(range(5, 41))
+
+    def looped():
+        for short, long, signal in grid:
+            QuantLib.MACD(frame, short, long, signal)
+
+    looped_t = timed(looped, repeat=1)
+    swept_t = timed(sweep_macd, close, grid, repeat=1)
+    pooled_t = timed(sweep_macd, close, grid, processes=4, repeat=1)
+    swept = sweep_macd(close, grid)
+    error = max(np.nanmax(np.abs(swept["macd"][:, i] - QuantLib.MACD(frame, *params)["macd"].to_numpy()))
+                for i, params in enumerate(grid[:20]))
+    print(f"MACD {len(grid)} sets x {len(close)} bars: looped {looped_t:.3f}s  sweep {swept_t:.3f}s  "
+          f"sweep x4 processes {pooled_t:.3f}s ({os.cpu_count()} cpus)  max abs diff {error:.2e}")
+
+    looped_t = timed(lambda: [QuantLib.RSI(frame.iloc[:2000], period) for period in periods], repeat=1)
+    swept_t = timed(sweep_rsi, close[:2000], periods, repeat=1)
+    print(f"RSI {len(periods)} periods x 2000 bars: looped {looped_t:.3f}s  sweep {swept_t:.3f}s")
+
+
+@benchmark('rsi-long')
+def rsi_long():
+    """ RSI over long series through the blocked recursive-filter kernel,
+    next to the legacy power-vector smoothing it replaced. Accuracy against
+    a plain Wilder loop is covered by tests/test_quantlib.py.
+    """
+    import numpy as np
+    from pandas import DataFrame
+    from plotr_signal.modules.quantlib import QuantLib
+
+    def legacy(close, n):
+        change = np.diff(close)[n:]
+        a = (n - 1) / n
+        ak = a ** np.arange(len(change) - 1, -1, -1)
+        return np.cumsum(ak * np.clip(change, 0.0, None)) / ak / n
+
+    for bars in (100_000, 1_000_000):
+        _, _, close = random_walk_panel(bars, 1)
+        close = close.iloc[:, 0].dropna().to_numpy() + 1000
+        rsi_t = timed(QuantLib.RSI, DataFrame({"close": close}), repeat=3)
+        with np.errstate(all='ignore'):
+            broken = np.mean(~np.isfinite(legacy(close, 14)))
+        print(f"{len(close)} bars: RSI {rsi_t * 1000:.1f}ms  legacy smoothing non-finite {broken:.1%}")
+
+
+@benchmark('rolling-extrema')
+def rolling_extrema_benchmark():
+    """ Rolling highs and lows for many windows through the shared doubling
+    table against one pandas rolling max/min per window.
+    """
+    import numpy as np
+    from plotr_signal.modules.quantlib import rolling_extrema
+
+    windows = [5, 9, 14, 20, 21, 28, 34, 55, 100, 200]
+    for bars, symbols in ((1_000_000, 1), (1440, 1000)):
+        high, low, _ = random_walk_panel(bars, symbols)
+
+        def pandas():
+            return ({window: high.rolling(window).max().to_numpy() for window in windows},
+                    {window: low.rolling(window).min().to_numpy() for window in windows})
+
+        def shared():
+            return (rolling_extrema(high.to_numpy(), windows, np.maximum),
+                    rolling_extrema(low.to_numpy(), windows, np.minimum))
+
+        pandas_t, shared_t = timed(pandas, repeat=1), timed(shared, repeat=1)
+        expected, result = pandas(), shared()
+        matches = all(np.array_equal(expected[side][window], result[side][window], equal_nan=True)
+                      for side in (0, 1) for window in windows)
+        print(f"{bars} bars x {symbols} symbols, {len(windows)} windows: pandas {pandas_t:.3f}s  "
+              f"shared {shared_t:.3f}s  speedup {pandas_t / shared_t:.1f}x  identical {matches}")
+
+
+@benchmark('compact-panel')
+def compact_panel():
+    """ Memory and accuracy of compact float32 panels against the float64
+    DataFrame panels.
+    """
+    import numpy as np
+    from plotr_signal.modules.quantlib import QuantLib, CompactPanel
+
+    high, low, close = random_walk_panel(10_080, 2000)
+    close += 1000
+    high += 1000
+    low += 1000
+
+    full = {**QuantLib.MACD_panel(close), "rsi": QuantLib.RSI_panel(close), "stoch": QuantLib.STOCH_panel(high, low, close)}
+    compact_close = CompactPanel.from_frame(close)
+    compact = {**QuantLib.MACD_panel(compact_close), "rsi": QuantLib.RSI_panel(compact_close),
+               "stoch": QuantLib.STOCH_panel(high, low, compact_close)}
+
+    full_bytes = sum(frame.memory_usage(index=True, deep=True).sum() for frame in full.values())
+    compact_bytes = sum(panel.nbytes for panel in compact.values()) + compact_close.index.nbytes
+    print(f"{len(close)} bars x {len(close.columns)} symbols: float64 frames {full_bytes / 2 ** 20:.0f}MiB  "
+          f"compact {compact_bytes / 2 ** 20:.0f}MiB")
+    for name, frame in full.items():
+        expected = frame.to_numpy()
+        values = compact[name].to_frame(full=True).to_numpy(dtype=float)
+        error = np.abs(values - expected)
+        print(f"{name:>6}: offset {compact[name].offset:>5}  max abs diff {np.nanmax(error):.2e}  "
+              f"99.9th pct {np.nanpercentile(error, 99.9):.2e}  "
+              f"NaN layout matches {np.array_equal(np.isnan(values), np.isnan(expected))}")
+
+
+@benchmark('indicator-library')
+def indicator_library():
+    """ Batch kernels over a long series and per-bar cost of their streaming
+    forms, which must reproduce the batch output.
+    """
+    import numpy as np
+    from pandas import DataFrame, date_range
+    from plotr_signal.modules import quantlib
+    from plotr_signal.modules.quantlib import QuantLib
+
+    high, low, close = random_walk_panel(1_000_000, 1)
+    frame = DataFrame({"high": high.iloc[:, 0], "low": low.iloc[:, 0], "close": close.iloc[:, 0]}).dropna()
+    frame["close"] += 1000
+    frame["high"] += 1000
+    frame["low"] += 1000
+    frame["volume"] = np.random.default_rng(1).random(len(frame)) * 10
+    frame.index = date_range("2021-01-01", periods=len(frame), freq="min")
+    frame["time"] = np.asarray(frame.index, dtype="datetime64[s]").astype(np.int64)
+
+    # name: (batch, streaming indicator, streaming input columns, batch output columns)
+    indicators = {
+        "BBANDS": (lambda f: QuantLib.BBANDS(f), quantlib.IncrementalBBANDS(), ["close"], None),
+        "ATR": (lambda f: QuantLib.ATR(f), quantlib.IncrementalATR(), ["high", "low", "close"], None),
+        "ADX": (lambda f: QuantLib.ADX(f), quantlib.IncrementalADX(), ["high", "low", "close"], None),
+        "VWAP": (lambda f: QuantLib.VWAP(f, anchor=86400), quantlib.IncrementalVWAP(anchor=86400),
+                 ["high", "low", "close", "volume", "time"], None),
+        "OBV": (lambda f: QuantLib.OBV(f), quantlib.IncrementalOBV(), ["close", "volume"], None),
+        "ICHIMOKU": (lambda f: QuantLib.ICHIMOKU(f), quantlib.IncrementalIchimoku(), ["high", "low"],
+                     ["tenkan", "kijun", "senkou_a", "senkou_b"]),
+    }
+    bars = 20_000
+    print(f"batch over {len(frame)} bars, streaming over the first {bars}")
+    for name, (batch, indicator, inputs, outputs) in indicators.items():
+        batch_t = timed(batch, frame, repeat=1)
+        expected = batch(frame.iloc[:bars])
+        expected = (expected[outputs] if outputs else expected).to_numpy()
+        started = time.perf_counter()
+        streamed = indicator.update_many(*[frame[column].to_numpy()[:bars] for column in inputs])
+        stream_t = time.perf_counter() - started
+        error = np.nanmax(np.abs(streamed.reshape(expected.shape) - expected))
+        print(f"{name:>9}: batch {batch_t * 1000:7.1f}ms  streaming {stream_t / bars * 1e6:5.1f}us/bar  "
+              f"max abs diff {error:.2e}")
+
+
+@benchmark('backtest-sweep')
+def backtest_sweep():
+    """ MACD crossover backtests over a parameter grid on a month of minute
+    bars, extrapolated to 10k strategies over a year.
+    """
+    from plotr_signal.modules.backtest import sweep_backtest
+    from plotr_signal.modules.sweep import macd_grid
+
+    _, _, close = random_walk_panel(43_200, 1)
+    close = close.iloc[:, 0].dropna().to_numpy() + 1000
+    open_ = close.copy()
+    open_[1:] = close[:-1]
+    grid = macd_grid(range(4, 20), range(20, 60, 2), (5, 9, 13))
+
+    swept_t = timed(sweep_backtest, 'macd_crossover', open_, close, grid, fee=0.005, repeat=1)
+    pooled_t = timed(sweep_backtest, 'macd_crossover', open_, close, grid, fee=0.005, processes=4, repeat=1)
+    rate = len(grid) * len(close) / swept_t
+    year = 10_000 * 525_600 / rate
+    print(f"{len(grid)} strategies x {len(close)} bars: {swept_t:.2f}s ({rate / 1e6:.0f}M strategy-bars/s)  "
+          f"x4 processes {pooled_t:.2f}s ({os.cpu_count()} cpus)")
+    print(f"10k strategies x 1 year of 1m bars: ~{year / 60:.0f} min on one core, "
+          f"~{year / 60 / max(os.cpu_count(), 1):.0f} min across {os.cpu_count()} cores")
+
+
+@benchmark('signal-engine')
+def signal_engine():
+    """ Match messages for 500 products stamped with the wall clock as they
+    are fed, measuring throughput and exchange-to-signal latency on 1s bars.
+    """
+    from datetime import timezone
+    import numpy as np
+    from plotr_signal.modules.signals import SignalEngine
+
+    products = [f"P{i}-USD" for i in range(500)]
+    engine = SignalEngine(products=products, interval=1)
+    rng = np.random.default_rng(0)
+    prices = dict(zip(products, 100 + rng.random(len(products))))
+    moves = rng.normal(scale=0.05, size=1 << 20)
+    signals = []
+    engine.on_signal = signals.append
+
+    messages, started = 0, time.perf_counter()
+    while time.perf_counter() - started < 5:
+        for product in products:
+            prices[product] += moves[messages % len(moves)]
+            messages += 1
+            stamp = datetime.fromtimestamp(time.time(), timezone.utc).isoformat()
+            engine.on_message({"type": "match", "product_id": product, "trade_id": messages, "time": stamp,
+                               "price": str(prices[product]), "size": "0.01"})
+    elapsed = time.perf_counter() - started
+    print(f"{len(products)} products: {messages / elapsed:,.0f} msgs/s  {len(signals)} signals  "
+          f"latency {engine.latency_stats()}")
+
+
+@benchmark('bar-aggregator')
+def bar_aggregator():
+    """ Trades per second through 1s/1m/5m/1h bar aggregation with a grace
+    window, with trades arriving slightly out of order.
+    """
+    import numpy as np
+    from plotr_signal.modules.bars import BarAggregator, INTERVALS
+
+    rng = np.random.default_rng(0)
+    products = [f"P{i}-USD" for i in range(200)]
+    trades = 1_000_000
+    times = np.sort(rng.uniform(0, 6 * 3600, trades)) + 1_609_459_200
+    arrival = np.argsort(times + rng.exponential(0.2, trades), kind='stable')
+    symbol = rng.integers(0, len(products), trades)
+    prices = 100 + np.cumsum(rng.normal(scale=0.01, size=trades))
+
+    aggregator = BarAggregator(INTERVALS, grace=1.0)
+    finished = 0
+    started = time.perf_counter()
+    for i in arrival.tolist():
+        finished += len(aggregator.add_trade(products[symbol[i]], times[i], prices[i], 0.01))
+    finished += len(aggregator.flush(float('inf')))
+    elapsed = time.perf_counter() - started
+    print(f"{trades} trades x {len(products)} products: {trades / elapsed:,.0f} trades/s  {finished} bars  "
+          f"{aggregator.late} late trades dropped")
+
+
+@benchmark('order-book-replay')
+def order_book_replay():
+    """ Messages per second through the Decimal OrderBook and the integer
+    TickOrderBook replaying the same synthetic full feed, and whether both
+    end on the same book.
+    """
+    from plotr_signal.modules.cbpro.order_book import OrderBook
+    from plotr_signal.modules.cbpro.tick_order_book import TickOrderBook
+
+    snapshot, feed = full_feed(500_000)
+    books = [OrderBook('SYN-USD'), TickOrderBook('SYN-USD', quote_increment='0.01', base_increment='0.00000001')]
+    for book in books:
+        elapsed = replay(book, snapshot, feed)
+        print(f"{type(book).__name__}: {len(feed) / elapsed:,.0f} msgs/s")
+    legacy, ticks = (book.get_current_book() for book in books)
+    print(f"same book: {legacy == ticks}  ({len(ticks['bids'])} bids, {len(ticks['asks'])} asks)")
+
+
+@benchmark('order-book-deep-level')
+def order_book_deep_level():
+    """ Cancels and size changes per second against a single price level
+    as the level gets deeper; with the order index the rate stays flat.
+    """
+    import random
+    from plotr_signal.modules.cbpro.order_book import OrderBook
+
+    rng = random.Random(0)
+    for depth in (10, 1_000, 100_000):
+        ids = [str(i) for i in range(depth)]
+        snapshot = {'sequence': 0, 'bids': [['100.00', '1.00000000', order_id] for order_id in ids], 'asks': []}
+        feed = []
+        for sequence, order_id in enumerate(rng.sample(ids, min(depth, 10_000)), start=1):
+            if sequence % 2:
+                feed.append({'type': 'change', 'sequence': sequence, 'side': 'buy', 'order_id': order_id,
+                             'price': '100.00', 'new_size': '0.50000000'})
+            else:
+                feed.append({'type': 'done', 'sequence': sequence, 'side': 'buy', 'order_id': order_id,
+                             'reason': 'canceled', 'price': '100.00', 'remaining_size': '1.00000000'})
+        elapsed = replay(OrderBook('SYN-USD'), snapshot, feed)
+        print(f"{depth:>7} orders at one price: {len(feed) / elapsed:,.0f} msgs/s")
+
+
+class SlowSnapshotClient(object):
+    """ Offline stand-in for PublicClient whose level 3 snapshot of
+    `exchange` is taken when requested and returned `delay` seconds later
+    """
+
+    def __init__(self, exchange, lock, delay: float):
+        self.exchange = exchange
+        self.lock = lock
+        self.delay = delay
+
+    def get_product_order_book(self, product_id, level=1):
+        with self.lock:
+            book = self.exchange.get_current_book()
+        time.sleep(self.delay)
+        return {'sequence': book['sequence'],
+                'bids': [[str(price), str(size), order_id] for price, size, order_id in book['bids']],
+                'asks': [[str(price), str(size), order_id] for price, size, order_id in book['asks']]}
+
+
+@benchmark('order-book-resync')
+def order_book_resync():
+    """ A book resyncing from a 0.2s snapshot while the feed keeps arriving,
+    once at start-up and once after a dropped message. Every message after
+    the snapshot is buffered and replayed, so the book ends identical to
+    one that saw the whole feed.
+    """
+    import threading
+    from plotr_signal.modules.cbpro.order_book import OrderBook
+
+    snapshot, feed = full_feed(200_000)
+    reference = OrderBook('SYN-USD')
+    replay(reference, snapshot, feed)
+
+    # The exchange side: a book that has seen every message sent so far
+    exchange, lock = OrderBook('SYN-USD'), threading.Lock()
+    exchange._client = SnapshotClient(snapshot)
+    exchange.reset_book()
+    book = OrderBook('SYN-USD')
+    book._client = SlowSnapshotClient(exchange, lock, delay=0.2)
+
+    dropped = feed[len(feed) // 2]['sequence']
+    started = time.perf_counter()
+    for message in feed:
+        with lock:
+            exchange.on_message(message)
+        if message['sequence'] != dropped:
+            book.on_message(message)
+        # Pace the feed so snapshots overlap live traffic
+        if message['sequence'] % 1000 == 0:
+            time.sleep(0.001)
+    book.wait_for_resync()
+    elapsed = time.perf_counter() - started
+    print(f"{len(feed)} msgs in {elapsed:.2f}s  same book: {book.get_current_book() == reference.get_current_book()}")
+    print({name: value for name, value in book.metrics().items() if name not in ("connected", "downtime")})
+
+
+@benchmark('order-book-depth')
+def order_book_depth():
+    """ Cost of depth queries on a live book: walking get_current_book for
+    the touch and cumulative size against the maintained level aggregates,
+    and a feed where every message is followed by the signal-side queries.
+    """
+    from decimal import Decimal
+    from plotr_signal.modules.cbpro.order_book import OrderBook
+
+    snapshot, feed = full_feed(100_000)
+    book = OrderBook('SYN-USD')
+    replay(book, snapshot, feed)
+
+    def walked():
+        current = book.get_current_book()
+        bid = max(price for price, _, _ in current['bids'])
+        bid_size = sum(size for price, size, _ in current['bids'] if price == bid)
+        return bid_size, sum(size for price, size, _ in current['bids'] if price >= Decimal('99.5'))
+
+    for name, query, repeat in (('get_current_book walk', walked, 20),
+                                ('top_of_book', book.top_of_book, 100_000),
+                                ('depth(10)', lambda: book.depth(10), 10_000),
+                                ('cumulative_depth (cached)', lambda: book.cumulative_depth('buy', 99.5), 100_000)):
+        elapsed = timed(lambda: [query() for _ in range(repeat)], repeat=1)
+        print(f"{name:>26}: {elapsed / repeat * 1e6:10.2f} us/query")
+
+    for every in (1, 10):
+        book = OrderBook('SYN-USD')
+        replay(book, snapshot, [])
+        started = time.perf_counter()
+        for i, message in enumerate(feed):
+            book.on_message(message)
+            if i % every == 0:
+                book.microprice(), book.imbalance()
+                book.cumulative_depth('buy', 99.5), book.cumulative_depth('sell', 100.5)
+        print(f"microprice, imbalance and two cumulative depths every {every:>2} messages: "
+              f"{len(feed) / (time.perf_counter() - started):,.0f} msgs/s")
+
+
+@benchmark('order-book-manager')
+def order_book_manager():
+    """ 50 synthetic products interleaved on one feed and routed to their
+    books, with the combined top-of-book table refreshed every 1,000
+    messages, against building the same table from every book's
+    get_current_book.
+    """
+    import random
+    import numpy as np
+    from plotr_signal.modules.backfill import TokenBucket
+    from plotr_signal.modules.cbpro.order_book_manager import OrderBookManager
+
+    products = [f"P{i}-USD" for i in range(50)]
+    manager = OrderBookManager(products, limiter=TokenBucket(rate=1e9, capacity=1e9))
+    streams = []
+    for seed, product in enumerate(products):
+        snapshot, messages = full_feed(10_000, orders=1000, seed=seed)
+        replay(manager.books[product], snapshot, [])
+        streams.append(iter([{**message, 'product_id': product} for message in messages]))
+    # Interleave products at random while keeping each product's messages in order
+    order = [i for i, stream in enumerate(streams) for _ in range(10_000)]
+    random.Random(0).shuffle(order)
+    feed = [next(streams[i]) for i in order]
+
+    started = time.perf_counter()
+    refresh = 0.0
+    for i, message in enumerate(feed):
+        manager.on_message(message)
+        if i % 1000 == 0:
+            refreshed = time.perf_counter()
+            manager.top_of_book()
+            refresh += time.perf_counter() - refreshed
+    elapsed = time.perf_counter() - started
+    print(f"{len(products)} books: {len(feed) / elapsed:,.0f} msgs/s routed, "
+          f"top table refresh {refresh / (len(feed) // 1000 + 1) * 1e6:.0f} us")
+
+    def walked():
+        rows = []
+        for book in manager.books.values():
+            current = book.get_current_book()
+            rows.append((max(price for price, _, _ in current['bids']), min(price for price, _, _ in current['asks'])))
+        return rows
+
+    table = manager.top_table()
+    walk = timed(walked, repeat=1)
+    ok = np.allclose(np.array(walked(), dtype=float), table[['bid', 'ask']].to_numpy())
+    print(f"full table: top_table {timed(manager.top_table) * 1e3:.2f} ms  "
+          f"get_current_book walk {walk * 1e3:.0f} ms  same touch: {ok}")
+
+
+def main(names: list = None):
+    for name in names or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -27,11 +27,15 @@ class Config(object):
     INFLUXDB_V2_ORG_ID = os.environ.get('INFLUXDB_V2_ORG_ID')
     INFLUXDB_V2_TOKEN = os.environ.get('INFLUXDB_V2_TOKEN')
     DRUID_HOST = os.environ.get('DRUID_HOST')
+    DRUID_INGESTION_CHUNK_ROWS = int(os.environ.get('DRUID_INGESTION_CHUNK_ROWS') or 50000)
+    CANDLE_STORE_DIR = os.environ.get('CANDLE_STORE_DIR') or \
+        os.path.join(basedir, 'tmp/candles')
 
     REDIS_HOST = os.environ.get('REDIS_HOST')
     REDIS_PORT = os.environ.get('REDIS_PORT') or '6379'
     CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}"
     CELERY_RESULT_BACKEND = f"redis://{REDIS_HOST}:{REDIS_PORT}"
+    BACKFILL_WINDOWS_PER_TASK = int(os.environ.get('BACKFILL_WINDOWS_PER_TASK') or 50)
 
     KAFKA_HOSTS = os.environ.get('KAFKA_SERVERS')
     KAFKA_CONF = { 'bootstrap.servers': os.environ.get('KAFKA_SERVERS'),
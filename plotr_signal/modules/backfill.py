@@ -0,0 +1,230 @@
+""" Historic candle backfill
+
+This module is used to fetch historic candles from Coinbase Pro over
+arbitrary time ranges. The range is split into request windows which
+are fetched on a bounded worker pool that shares a single token-bucket
+rate limiter, so concurrent backfills stay inside the exchange's public
+request budget.
+"""
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from requests.exceptions import HTTPError
+
+from plotr_signal.modules import cbpro
+from plotr_signal.modules.candles import CandleBuffer
+
+
+PUBLIC_RATE_LIMIT = 10
+""" int: Sustained requests per second allowed on public endpoints
+"""
+PUBLIC_RATE_BURST = 15
+""" int: Requests allowed in a single burst on public endpoints
+"""
+MAX_WORKERS = 8
+""" int: Default number of concurrent candle requests
+"""
+MAX_CANDLES = 200
+""" int: Maximum number of candles returned by a single candles request
+"""
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket used to pace outgoing requests.
+
+    Attributes:
+        rate (float): Tokens added to the bucket per second
+        capacity (float): Maximum number of tokens the bucket can hold
+    """
+    def __init__(self, rate: float = PUBLIC_RATE_LIMIT, capacity: float = PUBLIC_RATE_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """ Block until `tokens` are available and take them from the bucket
+
+        Args:
+            tokens (float): Number of tokens to take
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+public_rate_limiter = TokenBucket()
+""" TokenBucket: Process-wide limiter shared by every backfill by default
+"""
+
+
+def candle_window(granularity: int) -> timedelta:
+    """ Length of a request window holding a full page of candles
+
+    Window bounds are inclusive on the exchange, so a window spanning
+    MAX_CANDLES - 1 intervals returns exactly MAX_CANDLES candles.
+
+    Args:
+        granularity (int): Candle size in seconds
+
+    Returns:
+        timedelta: Window length for `granularity`
+    """
+    return timedelta(seconds=int(granularity) * (MAX_CANDLES - 1))
+
+
+def split_windows(start: datetime, end: datetime, delta: timedelta) -> list:
+    """ Split a time range into consecutive request windows
+
+    Args:
+        start (datetime): Start of the range
+        end (datetime): End of the range
+        delta (timedelta): Length of each window
+
+    Returns:
+        list: (window_start, window_end) tuples in time order, with the
+        final window clipped to `end`
+    """
+    windows = []
+    current = start
+    while current < end:
+        windows.append((current, min(current + delta, end)))
+        current = current + delta
+    return windows
+
+
+class CandleBackfill(object):
+    """ Concurrent, rate-limited fetcher for historic candles
+
+    Attributes:
+        limiter (TokenBucket): Rate limiter shared by all workers
+        max_workers (int): Size of the worker pool
+        max_retries (int): Attempts per window when rate limited
+    """
+    def __init__(self, client_factory=cbpro.PublicClient, limiter: TokenBucket = None,
+                 max_workers: int = MAX_WORKERS, max_retries: int = 5):
+        self.client_factory = client_factory
+        self.limiter = limiter or public_rate_limiter
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        """ PublicClient owned by the calling worker thread """
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.client_factory()
+        return self._local.client
+
+    def fetch_window(self, product: str, start: datetime, end: datetime, granularity: int) -> list:
+        """ Fetch a single window of candles
+
+        Args:
+            product (str): Product id, e.g. BTC-USD
+            start (datetime): Window start
+            end (datetime): Window end
+            granularity (int): Candle size in seconds
+
+        Returns:
+            list: Candles as [time, low, high, open, close, volume]
+
+        Raises:
+            HTTPError: The exchange rejected the request
+        """
+        for attempt in range(self.max_retries):
+            self.limiter.acquire()
+            rates = self.client.get_product_historic_rates(
+                product_id=product, start=start, end=end, granularity=granularity)
+            if isinstance(rates, list):
+                return rates
+
+            message = rates.get('message', '') if isinstance(rates, dict) else str(rates)
+            if 'rate limit' not in message.lower():
+                raise HTTPError(f"Unable to fetch candles for {product} {start} - {end}: {message}")
+            time.sleep((2 ** attempt) * 0.25 + random.uniform(0, 0.25))
+
+        raise HTTPError(f"Rate limit retries exhausted for {product} {start} - {end}")
+
+    def fetch(self, product: str, start: datetime, end: datetime, granularity: int = 60,
+              delta: timedelta = None, buffer: CandleBuffer = None) -> CandleBuffer:
+        """ Fetch all candles between `start` and `end`
+
+        Args:
+            product (str): Product id, e.g. BTC-USD
+            start (datetime): Start of the range
+            end (datetime): End of the range
+            granularity (int): Candle size in seconds
+            delta (timedelta): Length of each request window. Defaults to
+                a full page of candles at `granularity`
+            buffer (CandleBuffer): Buffer to append to. A buffer sized for
+                the range is allocated when omitted
+
+        Returns:
+            CandleBuffer: Candles in arrival order; use
+            `CandleBuffer.sorted_columns` or `to_dataframe` for time order
+        """
+        delta = delta or candle_window(granularity)
+        windows = split_windows(start, end, delta)
+        if buffer is None:
+            buffer = CandleBuffer(capacity=len(windows) * (delta.total_seconds() // int(granularity) + 1))
+
+        def _fetch(window):
+            return self.fetch_window(product, window[0], window[1], granularity)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for page in executor.map(_fetch, windows):
+                buffer.append(page)
+
+        return buffer
+
+    def iter_windows(self, product: str, windows: list, granularity: int = 60):
+        """ Fetch request windows concurrently and yield their pages in
+        window order as soon as each one is available
+
+        At most twice the pool size is fetched ahead of the consumer, so
+        memory stays bounded however many windows are requested.
+
+        Args:
+            product (str): Product id, e.g. BTC-USD
+            windows (list): (window_start, window_end) pairs in time order
+            granularity (int): Candle size in seconds
+
+        Yields:
+            CandleBuffer: Candles of one window
+        """
+        windows = iter(windows)
+        pending = deque()
+
+        def _fetch(window):
+            page = self.fetch_window(product, window[0], window[1], granularity)
+            buffer = CandleBuffer(capacity=len(page))
+            buffer.append(page)
+            return buffer
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                for window in windows:
+                    pending.append(executor.submit(_fetch, window))
+                    if len(pending) >= self.max_workers * 2:
+                        break
+                while pending:
+                    buffer = pending.popleft().result()
+                    for window in windows:
+                        pending.append(executor.submit(_fetch, window))
+                        break
+                    yield buffer
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,234 @@
+""" Vectorized backtests
+
+This module is used to check whether an indicator rule would have made
+money. Entry and exit signals are boolean (time x strategy) arrays, where
+a strategy column can be a symbol, a parameter set, or both. Signals are
+read at the close of a bar and filled at the next bar's open, with a
+proportional fee on the traded notional. Every column is simulated at
+once with array operations over time; nothing loops per bar or per
+strategy.
+
+Positions are long-only: an entry goes fully long, an exit goes flat, and
+when both fire on the same bar the exit wins.
+
+Parameter sweeps (`sweep_backtest`) compute the indicators and simulate
+in chunks of strategies, so a grid of thousands of strategies over a year
+of minute bars never holds more than one chunk of (time x strategy)
+arrays. Chunks can be spread over a process pool that reads prices from
+shared memory.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from plotr_signal.modules.sweep import attach_shared, macd_columns, rsi_columns
+
+BACKTEST_CHUNK_COLUMNS = 256
+""" int: Strategies simulated together by `sweep_backtest`
+"""
+
+STATS = ("total_return", "max_drawdown", "trades", "exposure")
+""" tuple: Per-strategy statistics returned by `backtest` and `sweep_backtest`
+"""
+
+
+def crossover(a, b) -> np.ndarray:
+    """ True on the bars where `a` closes above `b` after being at or below it """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    out = np.zeros(a.shape, dtype=bool)
+    out[1:] = (a[1:] > b[1:]) & (a[:-1] <= b[:-1])
+    return out
+
+
+def crossunder(a, b) -> np.ndarray:
+    """ True on the bars where `a` closes below `b` after being at or above it """
+    return crossover(b, a)
+
+
+def positions(entries, exits) -> np.ndarray:
+    """
+    Position (1 long, 0 flat) chosen at each bar's close. The latest entry
+    or exit signal holds until the next one. Strategies start flat.
+    """
+    entries, exits = np.broadcast_arrays(np.asarray(entries, dtype=bool), np.asarray(exits, dtype=bool))
+    return _positions(_time_last(entries), _time_last(exits)).T.astype(np.int8)
+
+
+def _time_last(values: np.ndarray) -> np.ndarray:
+    """
+    (strategy x time) contiguous copy of a (time x strategy) array.
+    Accumulating along a contiguous time axis is several times faster than
+    down the strided columns of the original layout.
+    """
+    return np.ascontiguousarray(values.T)
+
+
+def _positions(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    rows = np.arange(entries.shape[-1], dtype=np.int32)
+    # Long while the latest entry is more recent than the latest exit
+    last_entry = np.maximum.accumulate(np.where(entries, rows, -1), axis=-1)
+    last_exit = np.maximum.accumulate(np.where(exits, rows, -1), axis=-1)
+    return last_entry > last_exit
+
+
+def _simulate(open_, close, entries, exits, fee: float, initial: float) -> tuple:
+    """ (held position, equity) with fills at the next bar's open, both
+    (strategy x time)
+    """
+    open_, close = _time_last(open_), _time_last(close)
+    target = _positions(_time_last(entries), _time_last(exits))
+    held = np.zeros_like(target)
+    held[:, 1:] = target[:, :-1]
+    previous = np.zeros_like(held)
+    previous[:, 1:] = held[:, :-1]
+
+    gap = np.ones_like(close)
+    gap[:, 1:] = open_[:, 1:] / close[:, :-1]
+    intrabar = close / open_
+    if np.isnan(gap).any() or np.isnan(intrabar).any():
+        # Missing bars leave the equity unchanged
+        gap, intrabar = np.nan_to_num(gap, nan=1.0), np.nan_to_num(intrabar, nan=1.0)
+    # Carry the old position into the open, trade, then hold the new one to the close
+    growth = np.where(previous, gap, 1.0)
+    growth *= np.where(held, intrabar, 1.0)
+    growth[held != previous] *= 1 - fee
+    equity = np.cumprod(growth, axis=-1, out=growth)
+    equity *= initial
+    return held, equity
+
+
+def _stats(held: np.ndarray, equity: np.ndarray, initial: float) -> dict:
+    return {
+        "total_return": equity[:, -1] / initial - 1,
+        "max_drawdown": (equity / np.maximum.accumulate(equity, axis=-1) - 1).min(axis=-1),
+        "trades": (held[:, 1:] & ~held[:, :-1]).sum(axis=-1).astype(np.int64),
+        "exposure": held.mean(axis=-1),
+    }
+
+
+def _prices(prices) -> np.ndarray:
+    prices = np.asarray(prices, dtype=float)
+    return prices if prices.ndim > 1 else prices[:, None]
+
+
+def backtest(open_, close, entries, exits, fee: float = 0.0, initial: float = 1.0) -> dict:
+    """ Simulate entry/exit rules over many strategies at once
+
+    Args:
+        open_: Bar opens, (time,) shared by every strategy or (time x strategy)
+        close: Bar closes shaped like `open_`
+        entries: Boolean (time x strategy) entry signals, read at the close
+        exits: Boolean (time x strategy) exit signals, read at the close
+        fee (float): Fee per unit of traded notional, e.g. 0.005 for 0.5%
+        initial (float): Starting equity of every strategy
+
+    Returns:
+        dict: "position" held during each bar and "equity" marked at each
+        close, both (time x strategy), plus one array per name in `STATS`
+    """
+    entries, exits = np.asarray(entries, dtype=bool), np.asarray(exits, dtype=bool)
+    squeeze = entries.ndim == 1
+    if squeeze:
+        entries, exits = entries[:, None], exits[:, None]
+    open_, close = _prices(open_), _prices(close)
+
+    held, equity = _simulate(open_, close, entries, exits, fee, initial)
+    result = {"position": held.T.astype(np.int8), "equity": equity.T, **_stats(held, equity, initial)}
+    if squeeze:
+        result = {name: value[..., 0] if name in ("position", "equity") else value[0] for name, value in result.items()}
+    return result
+
+
+def _macd_crossover(close: np.ndarray, params: list, adjust: bool = True) -> tuple:
+    macd, signal = macd_columns(close, params, adjust)
+    return crossover(macd, signal), crossunder(macd, signal)
+
+
+def _rsi_threshold(close: np.ndarray, params: list) -> tuple:
+    """ Enter when RSI crosses up through `lower`, exit when it crosses down through `upper` """
+    periods = sorted({period for period, _, _ in params})
+    column = {period: i for i, period in enumerate(periods)}
+    rsi = rsi_columns(close, periods)[:, [column[period] for period, _, _ in params]]
+    lower = np.array([lower for _, lower, _ in params], dtype=float)
+    upper = np.array([upper for _, _, upper in params], dtype=float)
+    return crossover(rsi, lower), crossunder(rsi, upper)
+
+
+STRATEGIES = {
+    'macd_crossover': _macd_crossover,
+    'rsi_threshold': _rsi_threshold,
+}
+""" dict: Strategy name to signal builder mapping. Builders take the close
+series and a list of parameter sets and return (entries, exits) arrays with
+one column per parameter set. MACD parameter sets are (span_short,
+span_long, signal_span) and RSI ones are (period, lower, upper).
+"""
+
+
+def _backtest_chunk(strategy: str, open_: np.ndarray, close: np.ndarray, params: list, fee: float,
+                    initial: float) -> dict:
+    entries, exits = STRATEGIES[strategy](close, params)
+    held, equity = _simulate(open_[:, None], close[:, None], entries, exits, fee, initial)
+    return _stats(held, equity, initial)
+
+
+def _backtest_shared(strategy: str, names: list, rows: int, params: list, fee: float, initial: float) -> dict:
+    """ Process pool worker: backtest one chunk against prices in shared memory """
+    memories = []
+    try:
+        prices = []
+        for name in names:
+            memory, values = attach_shared(name, (rows,))
+            memories.append(memory)
+            prices.append(values)
+        return _backtest_chunk(strategy, prices[0], prices[1], params, fee, initial)
+    finally:
+        for memory in memories:
+            memory.close()
+
+
+def sweep_backtest(strategy: str, open_, close, params: list, fee: float = 0.0, initial: float = 1.0,
+                   processes: int = None) -> dict:
+    """ Backtest one strategy over a grid of parameter sets on one symbol
+
+    Args:
+        strategy (str): Name in `STRATEGIES`
+        open_: Bar opens as a 1-D array or Series
+        close: Bar closes as a 1-D array or Series
+        params (list): Parameter sets for the strategy, e.g. from
+            `sweep.macd_grid` for 'macd_crossover'
+        fee (float): Fee per unit of traded notional
+        initial (float): Starting equity of every strategy
+        processes (int): Spread chunks over this many processes
+
+    Returns:
+        dict: "params" as given plus one array per name in `STATS`, one
+        entry per parameter set
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy}")
+    open_ = np.ascontiguousarray(open_, dtype=np.float64)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    params = [tuple(p) for p in params]
+    chunks = [params[i:i + BACKTEST_CHUNK_COLUMNS] for i in range(0, len(params), BACKTEST_CHUNK_COLUMNS)]
+
+    if not processes:
+        results = [_backtest_chunk(strategy, open_, close, chunk, fee, initial) for chunk in chunks]
+    else:
+        memories = [shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1)) for prices in (open_, close)]
+        try:
+            for memory, prices in zip(memories, (open_, close)):
+                np.ndarray(prices.shape, dtype=np.float64, buffer=memory.buf)[:] = prices
+            names = [memory.name for memory in memories]
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [pool.submit(_backtest_shared, strategy, names, len(close), chunk, fee, initial)
+                           for chunk in chunks]
+                results = [future.result() for future in futures]
+        finally:
+            for memory in memories:
+                memory.close()
+                memory.unlink()
+
+    return {"params": params, **{name: np.concatenate([result[name] for result in results]) if results
+                                 else np.empty(0) for name in STATS}}
@@ -0,0 +1,327 @@
+""" Live trade bars
+
+This module is used to build OHLCV+VWAP bars from the Coinbase trade
+feed instead of polling the rate-limited candles endpoint. The smallest
+interval is aggregated from trades; every larger interval is rolled up
+from finished bars of the interval below it (1s -> 1m -> 5m -> 1h by
+default), never recomputed from trades.
+
+A bar covers [start, start + interval) in exchange time. It stays open
+for `grace` seconds after its end, so trades that arrive slightly out of
+order still land in the right bar. A bar finishes when a later trade for
+the product, or a `flush` of the feed clock, moves past end + grace.
+Trades for bars that have already finished are counted in `late` and
+dropped. Intervals without trades produce no bar.
+
+Finished bars can be published to Kafka in batches through
+`BarPublisher`, and `BarFeed` wires all of it to the websocket feed.
+"""
+import json
+import time
+from datetime import datetime
+
+from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
+
+INTERVALS = (1, 60, 300, 3600)
+""" tuple: Default bar intervals in seconds. Each must divide the next.
+"""
+
+FLUSH_INTERVAL = 1.0
+""" float: Seconds of feed time between sweeps that finish bars of
+products with no new trades
+"""
+
+
+class Bar(object):
+    """ OHLCV bar for one product and interval
+
+    Attributes:
+        product_id (str): Product the trades belong to
+        start (int): Bar start in epoch seconds
+        interval (int): Bar length in seconds
+        open (float): First trade price
+        high (float): Highest trade price
+        low (float): Lowest trade price
+        close (float): Last trade price
+        volume (float): Traded size
+        notional (float): Traded price * size, for the VWAP
+        trades (int): Number of trades
+        first_time (float): Exchange time of the earliest trade
+        last_time (float): Exchange time of the latest trade
+    """
+    __slots__ = ('product_id', 'start', 'interval', 'open', 'high', 'low', 'close', 'volume', 'notional', 'trades',
+                 'first_time', 'last_time')
+
+    def __init__(self, product_id: str, start: int, interval: int, price: float, size: float, time: float):
+        self.product_id = product_id
+        self.start = start
+        self.interval = interval
+        self.open = self.high = self.low = self.close = price
+        self.volume = size
+        self.notional = price * size
+        self.trades = 1
+        self.first_time = self.last_time = time
+
+    @property
+    def end(self) -> int:
+        return self.start + self.interval
+
+    @property
+    def vwap(self) -> float:
+        return self.notional / self.volume if self.volume else self.close
+
+    def add(self, price: float, size: float, time: float):
+        """ Add a trade; the open and close follow trade time, not arrival order """
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        if time >= self.last_time:
+            self.close, self.last_time = price, time
+        elif time < self.first_time:
+            self.open, self.first_time = price, time
+        self.volume += size
+        self.notional += price * size
+        self.trades += 1
+
+    def rollup(self, interval: int):
+        """ A new `interval` bar starting from this finished bar """
+        bar = Bar(self.product_id, self.start // interval * interval, interval, self.open, 0.0, self.first_time)
+        bar.merge(self)
+        bar.trades -= 1
+        return bar
+
+    def merge(self, other):
+        """ Fold a later finished bar of a smaller interval into this one """
+        self.high = max(self.high, other.high)
+        self.low = min(self.low, other.low)
+        self.close, self.last_time = other.close, other.last_time
+        self.volume += other.volume
+        self.notional += other.notional
+        self.trades += other.trades
+
+    def to_dict(self) -> dict:
+        return {**{name: getattr(self, name) for name in self.__slots__}, "vwap": self.vwap}
+
+
+class BarAggregator(object):
+    """ Aggregate trades for many products into bars of several intervals
+
+    Args:
+        intervals: One bar length in seconds, or several where each divides
+            the next
+        grace (float): Seconds a bar stays open after its end for late trades
+
+    Attributes:
+        late (int): Trades dropped because their bar had already finished
+    """
+
+    def __init__(self, intervals=INTERVALS, grace: float = 0.0):
+        self.intervals = sorted(intervals) if isinstance(intervals, (list, tuple)) else [intervals]
+        for smaller, larger in zip(self.intervals, self.intervals[1:]):
+            if larger % smaller:
+                raise ValueError(f"Bar interval {larger} is not a multiple of {smaller}")
+        self.grace = grace
+        self.late = 0
+        # product -> {start: open base bar}
+        self.bars = {}
+        # product -> [rolled-up bar in progress or None per larger interval]
+        self.rollups = {}
+        # product -> end of the last finished base bar
+        self.finished = {}
+
+    @property
+    def interval(self) -> int:
+        return self.intervals[0]
+
+    def add_trade(self, product_id: str, time: float, price: float, size: float) -> list:
+        """ Add one trade and return the bars it finished
+
+        Args:
+            product_id (str): Product id, e.g. BTC-USD
+            time (float): Exchange time of the trade in epoch seconds
+            price (float): Trade price
+            size (float): Trade size
+
+        Returns:
+            list: Finished `Bar`s of every interval, oldest first
+        """
+        start = int(time // self.interval) * self.interval
+        if start < self.finished.get(product_id, start):
+            self.late += 1
+            return []
+
+        bars = self.bars.get(product_id)
+        if bars is None:
+            bars = self.bars[product_id] = {}
+            self.rollups[product_id] = [None] * (len(self.intervals) - 1)
+        bar = bars.get(start)
+        if bar is None:
+            bars[start] = Bar(product_id, start, self.interval, price, size, time)
+        else:
+            bar.add(price, size, time)
+        return self._finish(product_id, time)
+
+    def flush(self, now: float) -> list:
+        """ Finish every bar of every product that ended `grace` or more
+        seconds before `now`
+        """
+        finished = []
+        for product_id in self.bars:
+            finished.extend(self._finish(product_id, now))
+        return finished
+
+    def _finish(self, product_id: str, now: float) -> list:
+        finished = []
+        bars = self.bars[product_id]
+        for start in sorted(start for start, bar in bars.items() if bar.end + self.grace <= now):
+            bar = bars.pop(start)
+            self.finished[product_id] = bar.end
+            finished.append(bar)
+            self._rollup(product_id, 0, bar, finished)
+
+        # Larger bars whose last smaller bars never traded
+        rollups = self.rollups[product_id]
+        for level, bar in enumerate(rollups):
+            if bar is not None and bar.end + self.grace <= now:
+                rollups[level] = None
+                finished.append(bar)
+                self._rollup(product_id, level + 1, bar, finished)
+        return finished
+
+    def _rollup(self, product_id: str, level: int, bar, finished: list):
+        """ Fold finished `bar` into the next interval up, finishing that
+        bar too when `bar` completes it
+        """
+        rollups = self.rollups[product_id]
+        while level < len(rollups):
+            interval = self.intervals[level + 1]
+            current = rollups[level]
+            if current is not None and current.start != bar.start // interval * interval:
+                # A newer bar started before this one filled; it is done
+                rollups[level] = None
+                finished.append(current)
+                self._rollup(product_id, level + 1, current, finished)
+                current = None
+            if current is None:
+                current = rollups[level] = bar.rollup(interval)
+            else:
+                current.merge(bar)
+            if bar.end != current.end:
+                return
+            rollups[level] = None
+            finished.append(current)
+            bar = current
+            level += 1
+
+
+class BarPublisher(object):
+    """ Publish finished bars to Kafka in batches
+
+    Args:
+        producer (KafkaProducer): Producer from `plotr_signal.modules.kafka`
+        topic (str): Topic the bars are produced to
+        batch_size (int): Publish once this many bars are buffered
+        linger (float): Publish buffered bars at least this often, in seconds
+    """
+
+    def __init__(self, producer, topic: str = 'bars', batch_size: int = 500, linger: float = 1.0):
+        self.producer = producer
+        self.topic = topic
+        self.batch_size = batch_size
+        self.linger = linger
+        self.buffer = []
+        self._since = None
+
+    def add(self, bars: list):
+        if not bars:
+            return
+        if not self.buffer:
+            self._since = time.monotonic()
+        self.buffer.extend(bars)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self._since >= self.linger:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        records = [json.dumps(bar.to_dict()) for bar in self.buffer]
+        self.producer.write_batch(self.topic, records, timestamps=[bar.start * 1000 for bar in self.buffer],
+                                  keys=[f"{bar.product_id}:{bar.interval}" for bar in self.buffer])
+        self.buffer = []
+
+
+def exchange_time(value: str) -> float:
+    """ Epoch seconds of a feed timestamp such as 2021-01-01T00:00:00.123456Z """
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class BarFeed(WebsocketClient):
+    """ Build bars live from the `matches` channel
+
+    Both `matches` and `ticker` report every trade, so trades are
+    de-duplicated by trade id and either channel, or both, can be used.
+
+    Args:
+        products (list): Product ids to follow
+        intervals: Bar intervals in seconds, see `BarAggregator`
+        grace (float): Seconds bars stay open for late trades
+        publisher (BarPublisher): Where finished bars are published
+        channels (list): Feed channels carrying trades
+    """
+
+    def __init__(self, products=None, intervals=INTERVALS, grace: float = 2.0, publisher: BarPublisher = None,
+                 channels: list = None, should_print: bool = False, **kwargs):
+        super(BarFeed, self).__init__(products=products, channels=channels or ['matches'],
+                                      should_print=should_print, **kwargs)
+        self.aggregator = BarAggregator(intervals, grace)
+        self.publisher = publisher
+        self.last_trade = {}
+        self._flushed = 0.0
+
+    def on_message(self, msg):
+        if msg.get('type') not in ('match', 'last_match', 'ticker') or 'time' not in msg:
+            return
+        size = msg.get('size', msg.get('last_size'))
+        trade_id = msg.get('trade_id')
+        product_id = msg['product_id']
+        if size is None or trade_id is None:
+            return
+        if trade_id <= self.last_trade.get(product_id, -1):
+            return
+        self.last_trade[product_id] = trade_id
+
+        now = exchange_time(msg['time'])
+        finished = self.aggregator.add_trade(product_id, now, float(msg['price']), float(size))
+        if now - self._flushed >= FLUSH_INTERVAL:
+            finished.extend(self.aggregator.flush(now))
+            self._flushed = now
+        if finished:
+            self.on_bars(finished, now)
+
+    def on_bars(self, bars: list, now: float):
+        """ Finished bars, oldest first per interval. `now` is the exchange
+        time of the message that finished them.
+        """
+        if self.publisher is not None:
+            self.publisher.add(bars)
+        if self.should_print:
+            for bar in bars:
+                print(bar.to_dict())
+
+    def on_close(self):
+        if self.publisher is not None:
+            self.publisher.flush()
+        super(BarFeed, self).on_close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    feed = BarFeed(products=sys.argv[1:] or ["BTC-USD", "ETH-USD"], should_print=True)
+    feed.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        feed.close()
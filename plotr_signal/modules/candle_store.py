@@ -0,0 +1,206 @@
+""" Local candle store
+
+This module is used to keep historic candles on local disk so repeated
+imports only fetch what is missing from Coinbase Pro. Candles are kept
+per (product, granularity) as columnar NumPy files partitioned by UTC
+day, next to a coverage file recording which time ranges have already
+been fetched. Coverage is tracked separately from the candles because
+the exchange publishes nothing for intervals without trades.
+
+Layout:
+    <root>/<product>/<granularity>/<yyyy-mm-dd>.npz
+    <root>/<product>/<granularity>/coverage.json
+"""
+import os
+import json
+import time
+import fcntl
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from plotr_signal.modules.candles import COLUMNS, VALUE_COLUMNS, CandleBuffer
+
+
+SECONDS_PER_DAY = 86400
+
+
+def to_epoch(dt: datetime) -> int:
+    """ Epoch seconds for `dt`, treating naive datetimes as UTC """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def from_epoch(epoch: int) -> datetime:
+    """ Naive UTC datetime for `epoch` seconds """
+    return datetime.utcfromtimestamp(int(epoch))
+
+
+def merge_intervals(intervals: list, step: int = 0) -> list:
+    """ Merge overlapping or adjacent [start, end] intervals
+
+    Args:
+        intervals (list): [start, end] pairs in any order
+        step (int): Distance at which two intervals count as adjacent
+
+    Returns:
+        list: Disjoint [start, end] pairs in order
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + step:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class CandleStore(object):
+    """ On-disk candle cache keyed by (product, granularity)
+
+    Attributes:
+        root (str): Directory holding the store
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, product: str, granularity: int, name: str = '') -> str:
+        return os.path.join(self.root, product, str(int(granularity)), name)
+
+    @contextmanager
+    def _lock(self, product: str, granularity: int):
+        """ Exclusive lock on a series so concurrent writers don't interleave """
+        os.makedirs(self._path(product, granularity), exist_ok=True)
+        with open(self._path(product, granularity, '.lock'), 'w') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _load_day(self, path: str) -> dict:
+        with np.load(path) as data:
+            return {column: data[column] for column in COLUMNS}
+
+    def _save_day(self, path: str, columns: dict):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **columns)
+        os.replace(tmp, path)
+
+    def coverage(self, product: str, granularity: int) -> list:
+        """ Fetched ranges for a series as disjoint [start, end] candle
+        start times in epoch seconds
+        """
+        path = self._path(product, granularity, 'coverage.json')
+        if not os.path.exists(path):
+            return []
+        with open(path) as fh:
+            return json.load(fh)
+
+    def gaps(self, product: str, granularity: int, start: datetime, end: datetime) -> list:
+        """ Ranges between `start` and `end` that have not been fetched yet
+
+        Args:
+            product (str): Product id, e.g. BTC-USD
+            granularity (int): Candle size in seconds
+            start (datetime): Start of the range
+            end (datetime): End of the range
+
+        Returns:
+            list: (gap_start, gap_end) datetime pairs in time order. Each
+            gap ends one interval after its last missing candle so that
+            single-candle gaps still form a non-empty request window
+        """
+        granularity = int(granularity)
+        first = -(-to_epoch(start) // granularity) * granularity
+        last = to_epoch(end) // granularity * granularity
+
+        gaps = []
+        cursor = first
+        for covered_start, covered_end in self.coverage(product, granularity):
+            if covered_end < cursor:
+                continue
+            if covered_start > last:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = covered_end + granularity
+        if cursor <= last:
+            gaps.append((cursor, last + granularity))
+
+        return [(from_epoch(gap_start), from_epoch(gap_end)) for gap_start, gap_end in gaps]
+
+    def write(self, product: str, granularity: int, candles: CandleBuffer, start: datetime, end: datetime):
+        """ Store candles fetched for [start, end] and record the range as covered
+
+        Candles replace stored candles with the same time. Coverage stops at
+        the last closed candle so an in-progress candle is fetched again.
+
+        Args:
+            product (str): Product id, e.g. BTC-USD
+            granularity (int): Candle size in seconds
+            candles (CandleBuffer): Candles fetched for the range
+            start (datetime): Start of the fetched range
+            end (datetime): End of the fetched range
+        """
+        granularity = int(granularity)
+        times, values = candles.sorted_columns()
+        days = times // SECONDS_PER_DAY
+
+        with self._lock(product, granularity):
+            for day in np.unique(days):
+                mask = days == day
+                columns = {'time': times[mask]}
+                for i, column in enumerate(VALUE_COLUMNS):
+                    columns[column] = values[mask, i]
+
+                path = self._path(product, granularity, f"{from_epoch(day * SECONDS_PER_DAY).date().isoformat()}.npz")
+                if os.path.exists(path):
+                    stored = self._load_day(path)
+                    keep = ~np.isin(stored['time'], columns['time'])
+                    columns = {column: np.concatenate([stored[column][keep], columns[column]]) for column in COLUMNS}
+                order = np.argsort(columns['time'], kind='stable')
+                self._save_day(path, {column: values[order] for column, values in columns.items()})
+
+            last_closed = (int(time.time()) // granularity - 1) * granularity
+            covered_start = -(-to_epoch(start) // granularity) * granularity
+            covered_end = min(to_epoch(end) // granularity * granularity, last_closed)
+            if covered_start <= covered_end:
+                coverage = merge_intervals(self.coverage(product, granularity) + [[covered_start, covered_end]],
+                                           step=granularity)
+                path = self._path(product, granularity, 'coverage.json')
+                with open(path + '.tmp', 'w') as fh:
+                    json.dump(coverage, fh)
+                os.replace(path + '.tmp', path)
+
+    def read(self, product: str, granularity: int, start: datetime, end: datetime,
+             buffer: CandleBuffer = None) -> CandleBuffer:
+        """ Stored candles between `start` and `end`
+
+        Args:
+            product (str): Product id, e.g. BTC-USD
+            granularity (int): Candle size in seconds
+            start (datetime): Start of the range
+            end (datetime): End of the range
+            buffer (CandleBuffer): Buffer to append to
+
+        Returns:
+            CandleBuffer: Stored candles in time order
+        """
+        first, last = to_epoch(start), to_epoch(end)
+        if buffer is None:
+            buffer = CandleBuffer(capacity=(last - first) // int(granularity) + 1)
+
+        day = from_epoch(first // SECONDS_PER_DAY * SECONDS_PER_DAY).date()
+        while day <= from_epoch(last).date():
+            path = self._path(product, granularity, f"{day.isoformat()}.npz")
+            if os.path.exists(path):
+                columns = self._load_day(path)
+                mask = (columns['time'] >= first) & (columns['time'] <= last)
+                buffer.append_columns(columns['time'][mask],
+                                      np.column_stack([columns[column][mask] for column in VALUE_COLUMNS]))
+            day += timedelta(days=1)
+
+        return buffer
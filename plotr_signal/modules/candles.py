@@ -0,0 +1,97 @@
+""" Columnar candle buffers
+
+This module is used to collect historic candles straight into
+preallocated NumPy columns as pages arrive, and to turn them into the
+price history DataFrame without intermediate Python lists.
+"""
+import numpy as np
+from pandas import DataFrame, to_datetime
+
+
+COLUMNS = ['time', 'low', 'high', 'open', 'close', 'volume']
+""" list: Candle columns in exchange order
+"""
+VALUE_COLUMNS = COLUMNS[1:]
+""" list: Float candle columns stored in CandleBuffer.values
+"""
+
+
+class CandleBuffer(object):
+    """ Growable columnar candle storage
+
+    Attributes:
+        time (ndarray): int64 epoch seconds, first `len(self)` entries used
+        values (ndarray): float64 (capacity, 5) low/high/open/close/volume
+    """
+    def __init__(self, capacity: int = 1024):
+        capacity = max(int(capacity), 1)
+        self.time = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, len(VALUE_COLUMNS)), dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size: int):
+        capacity = len(self.time)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        time = np.empty(capacity, dtype=np.int64)
+        time[:self._size] = self.time[:self._size]
+        values = np.empty((capacity, len(VALUE_COLUMNS)), dtype=np.float64)
+        values[:self._size] = self.values[:self._size]
+        self.time, self.values = time, values
+
+    def append(self, page: list):
+        """ Append a page of [time, low, high, open, close, volume] rows """
+        if not len(page):
+            return
+        rows = np.asarray(page, dtype=np.float64)
+        self.append_columns(rows[:, 0].astype(np.int64), rows[:, 1:])
+
+    def append_columns(self, time, values):
+        """ Append candles already split into a time column and an
+        (n, 5) block of low/high/open/close/volume
+        """
+        n = len(time)
+        self._reserve(self._size + n)
+        self.time[self._size:self._size + n] = time
+        self.values[self._size:self._size + n] = values
+        self._size += n
+
+    def columns(self) -> tuple:
+        """ Views of the used part of the buffer as (time, values) """
+        return self.time[:self._size], self.values[:self._size]
+
+    def sorted_columns(self) -> tuple:
+        """ (time, values) sorted by time with duplicate times removed,
+        keeping the most recently appended candle. Views are returned when
+        the buffer is already ordered and unique.
+        """
+        time, values = self.columns()
+        if len(time) > 1 and not np.all(time[1:] > time[:-1]):
+            # Reverse first so a stable sort keeps the latest duplicate in front
+            order = np.argsort(time[::-1], kind='stable')
+            order = len(time) - 1 - order
+            time = time[order]
+            keep = np.empty(len(time), dtype=bool)
+            keep[0] = True
+            np.not_equal(time[1:], time[:-1], out=keep[1:])
+            order = order[keep]
+            time, values = time[keep], values[order]
+        return time, values
+
+    def to_dataframe(self) -> DataFrame:
+        """ Price history frame indexed by candle time
+
+        The OHLCV block is handed to pandas without copying; only the time
+        index and the derived `price` column are newly allocated.
+        """
+        time, values = self.sorted_columns()
+        index = to_datetime(time, unit='s')
+        df = DataFrame(values, index=index, columns=VALUE_COLUMNS, copy=False)
+        df.index.name = 'time'
+        df.insert(0, 'time', index)
+        df['price'] = values[:, :4].mean(axis=1)
+        return df
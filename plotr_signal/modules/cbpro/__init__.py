@@ -1,5 +1,9 @@
 from plotr_signal.modules.cbpro.authenticated_client import AuthenticatedClient
 from plotr_signal.modules.cbpro.public_client import PublicClient
 from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
+from plotr_signal.modules.cbpro.async_websocket_client import AsyncWebsocketClient
+from plotr_signal.modules.cbpro.feed_manager import FeedManager
 from plotr_signal.modules.cbpro.order_book import OrderBook
+from plotr_signal.modules.cbpro.tick_order_book import TickOrderBook
+from plotr_signal.modules.cbpro.order_book_manager import OrderBookManager
 from plotr_signal.modules.cbpro.cbpro_auth import CBProAuth
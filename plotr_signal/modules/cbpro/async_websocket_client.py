@@ -0,0 +1,277 @@
+#
+# cbpro/async_websocket_client.py
+#
+# Websocket client whose receive, parse and handle stages run
+# independently, connected by bounded queues
+
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Thread
+
+from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
+
+BACKPRESSURE_POLICIES = ('block', 'drop_oldest', 'coalesce')
+""" tuple: What a full queue does with a new message: wait for room, evict
+the oldest message, or keep only the newest pending message per product
+"""
+
+LAG_SAMPLES = 10000
+""" int: Recent receive-to-handle lags kept for `metrics`
+"""
+
+
+class Gap(object):
+    """ Marker for a reconnect, passed down the stages so `on_gap` is called
+    on the handle thread between the messages from before and after it
+    """
+    __slots__ = ('disconnected_at', 'reconnected_at')
+
+    def __init__(self, disconnected_at: float, reconnected_at: float):
+        self.disconnected_at = disconnected_at
+        self.reconnected_at = reconnected_at
+
+
+class MessageQueue(object):
+    """ Bounded asyncio queue with a backpressure policy
+
+    Args:
+        maxsize (int): Messages held before the policy applies
+        policy (str): One of `BACKPRESSURE_POLICIES`. 'coalesce' replaces a
+            product's pending message with its newest one, in the pending
+            message's place; messages without a key are never coalesced.
+
+    Items put with `keep` are never dropped or coalesced, wait for no room,
+    and no later message is coalesced into a place ahead of them. Items
+    come out in the order they went in.
+
+    Attributes:
+        dropped (int): Messages evicted by 'drop_oldest'
+        coalesced (int): Messages replaced by a newer one for the same key
+    """
+
+    def __init__(self, maxsize: int = 10000, policy: str = 'block'):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        # One FIFO of slot -> (kept, key, item), and the slot of each key's
+        # pending message that can still be coalesced
+        self._items = OrderedDict()
+        self._slots = {}
+        self._next_slot = count()
+        self._changed = asyncio.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    async def put(self, item, key=None, keep: bool = False):
+        async with self._changed:
+            if keep:
+                # Later messages must not be coalesced into places before this one
+                self._slots.clear()
+                self._items[next(self._next_slot)] = (True, None, item)
+                self._changed.notify_all()
+                return
+            if self.policy != 'coalesce':
+                key = None
+            if key is not None and key in self._slots:
+                self.coalesced += 1
+                self._items[self._slots[key]] = (False, key, item)
+                return
+            while len(self) >= self.maxsize:
+                if not (self.policy == 'drop_oldest' and self._evict()):
+                    await self._changed.wait()
+            slot = next(self._next_slot)
+            self._items[slot] = (False, key, item)
+            if key is not None:
+                self._slots[key] = slot
+            self._changed.notify_all()
+
+    def _evict(self) -> bool:
+        for slot, (kept, key, _) in self._items.items():
+            if not kept:
+                self._pop(slot)
+                self.dropped += 1
+                return True
+        return False
+
+    def _pop(self, slot):
+        _, key, item = self._items.pop(slot)
+        if key is not None and self._slots.get(key) == slot:
+            del self._slots[key]
+        return item
+
+    async def get_batch(self, limit: int = 100) -> list:
+        """ Wait for at least one message and take up to `limit` of them """
+        async with self._changed:
+            while not len(self):
+                await self._changed.wait()
+            batch = []
+            while self._items and len(batch) < limit:
+                batch.append(self._pop(next(iter(self._items))))
+            self._changed.notify_all()
+            return batch
+
+
+class AsyncWebsocketClient(WebsocketClient):
+    """ WebsocketClient with receiving, parsing and handling decoupled
+
+    Three asyncio stages run on the client's event loop:
+    receive pulls raw frames off the socket, parse decodes them, and handle
+    calls `on_message`. Bounded `MessageQueue`s sit between the stages.
+    Blocking socket reads and the user's `on_message` each run on their own
+    worker thread, so a slow handler never stops the socket from being
+    drained. Only the parse-to-handle queue applies `policy`; the raw queue
+    always blocks.
+
+    `on_message` keeps its contract: it is called with each decoded
+    message, one at a time and in arrival order, minus anything the
+    backpressure policy discarded. With 'coalesce', a product's newest
+    message is handled in the place of the one it replaced. `on_gap` is called on the same thread,
+    after every message received before the reconnect and before any
+    received after it.
+
+    Args:
+        queue_size (int): Capacity of each queue
+        policy (str): Backpressure policy of the handle queue, one of
+            `BACKPRESSURE_POLICIES`
+        **kwargs: As for WebsocketClient
+    """
+
+    def __init__(self, *args, queue_size: int = 10000, policy: str = 'block', **kwargs):
+        super(AsyncWebsocketClient, self).__init__(*args, **kwargs)
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.loop = None
+        self.raw = None
+        self.parsed = None
+        self.received = 0
+        self.handled = 0
+        self.lags = deque(maxlen=LAG_SAMPLES)
+
+    def start(self):
+        self.stop = False
+        self.on_open()
+        self.thread = Thread(target=lambda: asyncio.run(self.run()))
+        self.thread.start()
+
+    async def run(self):
+        """ Connect and run the stages until `close` or an error """
+        self.stop = False
+        self.loop = asyncio.get_running_loop()
+        self.raw = MessageQueue(self.queue_size, 'block')
+        self.parsed = MessageQueue(self.queue_size, self.policy)
+        receiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-receive')
+        handler = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-handle')
+        try:
+            await self.loop.run_in_executor(receiver, self._connect)
+            stages = [asyncio.ensure_future(stage) for stage in
+                      (self._receive(receiver), self._parse(), self._handle(handler))]
+            while not self.stop:
+                await asyncio.sleep(0.1)
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+        except Exception as e:
+            self.on_error(e)
+        finally:
+            await self.loop.run_in_executor(handler, self._disconnect)
+            receiver.shutdown(wait=False)
+            handler.shutdown(wait=True)
+
+    async def _receive(self, executor):
+        while not self.stop:
+            try:
+                data = await self.loop.run_in_executor(executor, self._recv)
+            except Exception as e:
+                if self.stop:
+                    return
+                if not self.reconnect:
+                    self.on_error(e)
+                    return
+                # Reconnect on the receive thread; the later stages keep draining meanwhile
+                await self.loop.run_in_executor(executor, self._connection_lost, e)
+                continue
+            self.received += 1
+            await self.raw.put((time.monotonic(), data))
+
+    async def _parse(self):
+        while not self.stop:
+            for received, data in await self.raw.get_batch():
+                if isinstance(data, Gap):
+                    await self.parsed.put((received, data), keep=True)
+                    continue
+                try:
+                    msg = json.loads(data)
+                except ValueError as e:
+                    self.on_error(e, data)
+                    continue
+                if self._hide_heartbeats and isinstance(msg, dict) and msg.get('type') == 'heartbeat':
+                    continue
+                await self.parsed.put((received, msg), key=msg.get('product_id') if isinstance(msg, dict) else None)
+
+    async def _handle(self, executor):
+        while not self.stop:
+            batch = await self.parsed.get_batch()
+            try:
+                await self.loop.run_in_executor(executor, self._handle_batch, batch)
+            except Exception as e:
+                self.on_error(e)
+
+    def _handle_batch(self, batch: list):
+        for received, msg in batch:
+            if isinstance(msg, Gap):
+                self.on_gap(msg.disconnected_at, msg.reconnected_at)
+                continue
+            self.lags.append(time.monotonic() - received)
+            try:
+                self.on_message(msg)
+            except Exception as e:
+                self.on_error(e, msg)
+            self.handled += 1
+
+    def _report_gap(self, disconnected_at, reconnected_at):
+        # Called on the receive thread; queue behind the frames already received
+        gap = Gap(disconnected_at, reconnected_at)
+        asyncio.run_coroutine_threadsafe(self.raw.put((time.monotonic(), gap), keep=True), self.loop).result()
+
+    def metrics(self) -> dict:
+        """ Message counts, queue depths, receive-to-handle lag in seconds and
+        the connection metrics of `WebsocketClient.metrics`
+        """
+        lags = sorted(self.lags)
+        return {
+            **super(AsyncWebsocketClient, self).metrics(),
+            "received": self.received,
+            "handled": self.handled,
+            "raw_depth": len(self.raw) if self.raw is not None else 0,
+            "handle_depth": len(self.parsed) if self.parsed is not None else 0,
+            "dropped": self.parsed.dropped if self.parsed is not None else 0,
+            "coalesced": self.parsed.coalesced if self.parsed is not None else 0,
+            "lag_last": self.lags[-1] if lags else None,
+            "lag_p99": lags[int(0.99 * (len(lags) - 1))] if lags else None,
+            "lag_max": lags[-1] if lags else None,
+        }
+
+
+if __name__ == "__main__":
+    class SlowClient(AsyncWebsocketClient):
+        def on_message(self, msg):
+            time.sleep(0.01)
+
+    client = SlowClient(products=["BTC-USD", "ETH-USD"], channels=["ticker"], policy='coalesce')
+    client.start()
+    try:
+        while True:
+            time.sleep(1)
+            print(client.metrics())
+    except KeyboardInterrupt:
+        client.close()
@@ -0,0 +1,438 @@
+#
+# cbpro/feed_manager.py
+#
+# Spread a product list over several websocket connections, each in its
+# own process, and merge them back into one stream that is ordered per
+# product
+
+import multiprocessing
+import queue
+import time
+from collections import defaultdict
+from threading import Lock, Thread
+
+from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
+
+REBALANCE_INTERVAL = 60.0
+""" float: Seconds of observed message rates between rebalances
+"""
+
+REBALANCE_TOLERANCE = 0.2
+""" float: How far the busiest connection may run above the mean rate before
+products are moved off it
+"""
+
+UNORDERED_TYPES = ('heartbeat', 'subscriptions', 'error')
+""" tuple: Message types passed through without the per-product sequence check
+"""
+
+SHARD_CHECK_INTERVAL = 1.0
+""" float: Seconds between checks for shard processes that have exited
+"""
+
+
+def plan_moves(assignment: dict, rates: dict, shards: int, tolerance: float = REBALANCE_TOLERANCE,
+               max_moves: int = None, targets: list = None) -> list:
+    """ Products to move so no connection carries much more than its share
+
+    Repeatedly moves the busiest product off the busiest connection onto the
+    quietest one, as long as that lowers the busier of the two, until the
+    busiest connection is within `tolerance` of the mean.
+
+    Args:
+        assignment (dict): Product id to connection index
+        rates (dict): Product id to messages per second; missing products
+            count as 0
+        shards (int): Number of connections
+        tolerance (float): Allowed excess of the busiest connection over the
+            mean, e.g. 0.2 for 20%
+        max_moves (int): Stop after this many moves
+        targets (list): Connections that may receive products, all when
+            omitted
+
+    Returns:
+        list: (product_id, from, to) moves in the order they were planned
+    """
+    loads = [0.0] * shards
+    members = [[] for _ in range(shards)]
+    for product, shard in assignment.items():
+        loads[shard] += rates.get(product, 0.0)
+        members[shard].append(product)
+    mean = sum(loads) / shards if shards else 0.0
+    targets = list(range(shards)) if targets is None else list(targets)
+
+    moves = []
+    while targets and (max_moves is None or len(moves) < max_moves):
+        busiest = max(range(shards), key=loads.__getitem__)
+        quietest = min(targets, key=loads.__getitem__)
+        if loads[busiest] <= (1 + tolerance) * mean:
+            break
+        room = loads[busiest] - loads[quietest]
+        candidates = [product for product in members[busiest] if 0 < rates.get(product, 0.0) < room]
+        if not candidates:
+            break
+        product = max(candidates, key=lambda product: rates[product])
+        members[busiest].remove(product)
+        members[quietest].append(product)
+        loads[busiest] -= rates[product]
+        loads[quietest] += rates[product]
+        moves.append((product, busiest, quietest))
+    return moves
+
+
+class _ShardClient(WebsocketClient):
+    """ WebsocketClient run inside a shard process. Messages are sent to the
+    manager in batches; messages for products no longer assigned are dropped.
+    """
+
+    def __init__(self, shard: int, output, batch_size: int, linger: float, **kwargs):
+        super(_ShardClient, self).__init__(should_print=False, **kwargs)
+        self.shard = shard
+        self.output = output
+        self.batch_size = batch_size
+        self.linger = linger
+        self.batch = []
+        self.lock = Lock()
+        self._assigned = set(self.products)
+        self._since = time.monotonic()
+
+    def on_message(self, msg):
+        with self.lock:
+            product = msg.get('product_id')
+            if product is not None and product not in self._assigned:
+                return
+            if not self.batch:
+                self._since = time.monotonic()
+            self.batch.append(msg)
+            if len(self.batch) >= self.batch_size or time.monotonic() - self._since >= self.linger:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.batch:
+            self.output.put((self.shard, 'messages', self.batch))
+            self.batch = []
+
+    def assign(self, products: list):
+        with self.lock:
+            self._assigned.update(products)
+        self.subscribe(products)
+
+    def release(self, products: list):
+        """ Unsubscribe, then mark the end of each product's stream from this
+        shard. Nothing for those products follows the marker.
+        """
+        with self.lock:
+            self._assigned.difference_update(products)
+            self._flush()
+            for product in products:
+                self.output.put((self.shard, 'released', product))
+        self.unsubscribe(products)
+
+    def on_gap(self, disconnected_at, reconnected_at):
+        self.flush()
+        self.output.put((self.shard, 'gap', (list(self.products), disconnected_at, reconnected_at)))
+
+    def on_error(self, e, data=None):
+        super(_ShardClient, self).on_error(e, data)
+        self.output.put((self.shard, 'error', repr(e)))
+
+
+def _run_shard(shard: int, products: list, commands, output, batch_size: int, linger: float, kwargs: dict):
+    """ Shard process: run one connection and apply assign/release commands
+    until told to stop
+    """
+    client = _ShardClient(shard, output, batch_size, linger, products=products, **kwargs)
+    client.start()
+    try:
+        while not client.stop:
+            try:
+                command = commands.get(timeout=linger)
+            except queue.Empty:
+                client.flush()
+                continue
+            if command is None:
+                break
+            action, products = command
+            getattr(client, action)(products)
+    finally:
+        client.close()
+        client.flush()
+        output.put((shard, 'closed', client.metrics()))
+
+
+class FeedManager(object):
+    """ Spread products over several websocket connections and merge them
+
+    Each connection runs in its own process, so reading the sockets and
+    decoding JSON run in parallel across cores. Everything after that does
+    not: the shards send their messages back in batches and `on_message` is
+    called on one merge thread, with each product's messages in the order
+    that product's connection received them, so that thread caps the total
+    rate. Messages are also checked there against the feed's per-product
+    `sequence`, so nothing already delivered is delivered again.
+
+    A shard process that exits while the feed is running is started again
+    with its products, which are reported through `on_gap`.
+
+    Every `rebalance_interval` seconds products are moved off connections
+    that carry more than their share of messages (see `plan_moves`). A
+    moving product is subscribed on its new connection first; messages from
+    the new connection are held back until the old connection has
+    unsubscribed and flushed, then replayed after it, skipping the overlap.
+
+    Args:
+        products (list): Product ids to follow
+        connections (int): Number of websocket connections, at most one per
+            product
+        channels (list): Feed channels, e.g. ['full']
+        batch_size (int): Messages a shard sends back at once
+        linger (float): Seconds a shard holds a partial batch
+        rebalance_interval (float): Seconds between rebalances, None to
+            keep the initial round-robin assignment
+        tolerance (float): See `plan_moves`
+        should_print (bool): Print connection events, as WebsocketClient does
+        **kwargs: Passed to each shard's WebsocketClient, e.g. `url` or auth
+
+    Attributes:
+        assignment (dict): Product id to connection index
+        moves (int): Products moved by rebalancing
+        respawns (int): Shard processes started again after exiting
+        duplicates (int): Messages skipped by the sequence check
+    """
+
+    def __init__(self, products: list, connections: int = None, channels: list = None, batch_size: int = 100,
+                 linger: float = 0.05, rebalance_interval: float = REBALANCE_INTERVAL,
+                 tolerance: float = REBALANCE_TOLERANCE, should_print: bool = True, **kwargs):
+        if not products:
+            raise ValueError("FeedManager needs at least one product")
+        self.products = list(products)
+        self.connections = min(connections or multiprocessing.cpu_count(), len(self.products))
+        self.channels = channels
+        self.batch_size = batch_size
+        self.linger = linger
+        self.rebalance_interval = rebalance_interval
+        self.tolerance = tolerance
+        self.should_print = should_print
+        self.kwargs = kwargs
+        self.assignment = {product: i % self.connections for i, product in enumerate(self.products)}
+        self.stop = True
+        self.moves = 0
+        self.respawns = 0
+        self.duplicates = 0
+        self.received = 0
+        self.rates = {}
+        self.shard_metrics = {}
+        self.thread = None
+        self._processes = []
+        self._commands = []
+        self._output = None
+        # product -> {"to": shard, "buffer": [...], "started": bool}
+        self._migrating = {}
+        # (product, type) -> last delivered sequence
+        self._sequences = {}
+        self._counts = defaultdict(int)
+        self._window = None
+        self._checked = None
+
+    def start(self):
+        self.stop = False
+        self._output = multiprocessing.Queue()
+        self._processes = [None] * self.connections
+        self._commands = [None] * self.connections
+        for shard in range(self.connections):
+            self._spawn(shard, self._products_of(shard))
+        self.on_open()
+        self.thread = Thread(target=self._merge, name='feed-merge')
+        self.thread.start()
+
+    def close(self):
+        self.stop = True
+        self.thread.join()
+        for commands in self._commands:
+            commands.put(None)
+        closing = {shard for shard, process in enumerate(self._processes) if process.is_alive()}
+        deadline = time.monotonic() + 10
+        while closing and time.monotonic() < deadline:
+            try:
+                shard, kind, payload = self._output.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if kind == 'closed':
+                closing.discard(shard)
+            self._dispatch(shard, kind, payload)
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.on_close()
+
+    def _products_of(self, shard: int) -> list:
+        return [product for product, owner in self.assignment.items() if owner == shard]
+
+    def _spawn(self, shard: int, products: list):
+        commands = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run_shard, name=f'feed-shard-{shard}', daemon=True,
+            args=(shard, products, commands, self._output, self.batch_size, self.linger,
+                  {**self.kwargs, 'channels': self.channels}))
+        process.start()
+        self._commands[shard] = commands
+        self._processes[shard] = process
+
+    def _check_shards(self):
+        """ Start again any shard process that has exited """
+        self._checked = time.monotonic()
+        for shard, process in enumerate(self._processes):
+            if not process.is_alive():
+                self._respawn(shard)
+
+    def _respawn(self, shard: int):
+        disconnected_at = time.time()
+        products = self._products_of(shard)
+        for product, migration in list(self._migrating.items()):
+            if migration["to"] == shard:
+                # Its assign command died with the shard; subscribe it again
+                products.append(product)
+            elif product in products:
+                # The old connection is gone, so there is nothing left to release
+                products.remove(product)
+                self._dispatch(shard, 'released', product)
+        self._spawn(shard, products)
+        self.respawns += 1
+        if products:
+            self.on_gap(products, disconnected_at, time.time())
+
+    def _merge(self):
+        self._window = self._checked = time.monotonic()
+        while not self.stop:
+            try:
+                shard, kind, payload = self._output.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            else:
+                self._dispatch(shard, kind, payload)
+            if time.monotonic() - self._checked >= SHARD_CHECK_INTERVAL:
+                self._check_shards()
+            if self.rebalance_interval and time.monotonic() - self._window >= self.rebalance_interval:
+                self.rebalance()
+
+    def _dispatch(self, shard: int, kind: str, payload):
+        if kind == 'messages':
+            for msg in payload:
+                product = msg.get('product_id')
+                migration = self._migrating.get(product)
+                if migration is not None and migration["to"] == shard:
+                    if not migration["started"]:
+                        # The new connection is live, so the old one can let go
+                        migration["started"] = True
+                        self._commands[self.assignment[product]].put(('release', [product]))
+                    migration["buffer"].append(msg)
+                else:
+                    self._deliver(msg)
+        elif kind == 'released':
+            migration = self._migrating.pop(payload, None)
+            if migration is None:
+                # Already settled when the releasing shard exited
+                return
+            self.assignment[payload] = migration["to"]
+            for msg in migration["buffer"]:
+                self._deliver(msg)
+        elif kind == 'gap':
+            self.on_gap(*payload)
+        elif kind == 'error':
+            self.on_error(shard, payload)
+        elif kind == 'closed':
+            self.shard_metrics[shard] = payload
+
+    def _deliver(self, msg: dict):
+        product = msg.get('product_id')
+        sequence = msg.get('sequence')
+        if product is not None and sequence is not None and msg.get('type') not in UNORDERED_TYPES:
+            key = (product, msg.get('type'))
+            if sequence <= self._sequences.get(key, -1):
+                self.duplicates += 1
+                return
+            self._sequences[key] = sequence
+        if product is not None:
+            self._counts[product] += 1
+        self.received += 1
+        self.on_message(msg)
+
+    def rebalance(self) -> list:
+        """ Move products according to the message rates seen since the last
+        rebalance. Products still moving stay where they are, and only
+        connections whose process is running receive products.
+
+        Returns:
+            list: (product_id, from, to) moves started
+        """
+        now = time.monotonic()
+        elapsed = max(now - self._window, 1e-9)
+        self.rates = {product: count / elapsed for product, count in self._counts.items()}
+        self._counts = defaultdict(int)
+        self._window = now
+
+        settled = {product: shard for product, shard in self.assignment.items() if product not in self._migrating}
+        alive = [shard for shard, process in enumerate(self._processes) if process.is_alive()]
+        moves = plan_moves(settled, self.rates, self.connections, self.tolerance, targets=alive)
+        for product, _, target in moves:
+            self._migrating[product] = {"to": target, "buffer": [], "started": False}
+            self._commands[target].put(('assign', [product]))
+        self.moves += len(moves)
+        return moves
+
+    def metrics(self) -> dict:
+        """ Message rate per connection, rebalancing and duplicate counts """
+        loads = [0.0] * self.connections
+        for product, shard in self.assignment.items():
+            loads[shard] += self.rates.get(product, 0.0)
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "moves": self.moves,
+            "respawns": self.respawns,
+            "migrating": len(self._migrating),
+            "connection_rates": loads,
+        }
+
+    def on_open(self):
+        if self.should_print:
+            print("-- Subscribed over {} connections --\n".format(self.connections))
+
+    def on_close(self):
+        if self.should_print:
+            print("\n-- Feed closed --")
+
+    def on_message(self, msg: dict):
+        pass
+
+    def on_gap(self, products: list, disconnected_at: float, reconnected_at: float):
+        """ One connection reconnected; `products` may have missed messages """
+        if self.should_print:
+            print('-- {} reconnected after {:.1f}s --'.format(', '.join(products), reconnected_at - disconnected_at))
+
+    def on_error(self, shard: int, error: str):
+        if self.should_print:
+            print('Connection {} failed: {}'.format(shard, error))
+
+
+if __name__ == "__main__":
+    import sys
+
+    class CountingFeed(FeedManager):
+        def on_message(self, msg):
+            pass
+
+    feed = CountingFeed(sys.argv[1:] or ["BTC-USD", "ETH-USD", "LTC-USD", "BCH-USD"], channels=['full'],
+                        rebalance_interval=10)
+    feed.start()
+    try:
+        while True:
+            time.sleep(10)
+            print(feed.metrics())
+    except KeyboardInterrupt:
+        feed.close()
@@ -6,23 +6,125 @@
 
 from sortedcontainers import SortedDict
 from decimal import Decimal
+from threading import Lock, Thread
 import pickle
+import time
+
+import numpy as np
 
 from plotr_signal.modules.cbpro.public_client import PublicClient
 from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
 
 
+RESYNC_RETRY = 1.0
+""" float: Seconds to wait before retrying a failed snapshot fetch
+"""
+
+
+class Order(object):
+    """ Resting order, linked to its neighbours at the same price
+
+    Item access (`order['size']`) is kept for code written against the
+    per-order dicts the book used to store.
+    """
+    __slots__ = ('id', 'side', 'price', 'size', 'prev', 'next')
+
+    def __init__(self, order_id, side, price, size):
+        self.id = order_id
+        self.side = side
+        self.price = price
+        self.size = size
+        self.prev = None
+        self.next = None
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+
+class OrderQueue(object):
+    """ Orders at one price level, oldest first. The queue is linked through
+    the orders themselves, so any order is unlinked in O(1). `size` is the
+    level's total size, kept up to date as orders come, go and change.
+    """
+    __slots__ = ('head', 'tail', 'count', 'size')
+
+    def __init__(self):
+        self.head = None
+        self.tail = None
+        self.count = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        order = self.head
+        while order is not None:
+            # Read the link first so the current order can be unlinked while iterating
+            following = order.next
+            yield order
+            order = following
+
+    def append(self, order):
+        order.prev, order.next = self.tail, None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next = order
+        self.tail = order
+        self.count += 1
+        self.size += order.size
+
+    def remove(self, order):
+        if order.prev is None:
+            self.head = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            self.tail = order.prev
+        else:
+            order.next.prev = order.prev
+        order.prev = order.next = None
+        self.count -= 1
+        self.size -= order.size
+
+    def resize(self, order, size):
+        self.size += size - order.size
+        order.size = size
+
+
 class OrderBook(WebsocketClient):
-    def __init__(self, product_id='BTC-USD', log_to=None):
-        super(OrderBook, self).__init__(products=product_id)
+    def __init__(self, product_id='BTC-USD', log_to=None, client=None):
+        super(OrderBook, self).__init__(products=[product_id])
         self._asks = SortedDict()
         self._bids = SortedDict()
-        self._client = PublicClient()
+        # REST client for snapshots; several books may share one
+        self._client = client or PublicClient()
+        # order id -> resting Order, which knows its side, price and place in its level
+        self._orders = {}
         self._sequence = -1
         self._log_to = log_to
         if self._log_to:
             assert hasattr(self._log_to, 'write')
         self._current_ticker = None
+        # Live messages held while a snapshot is fetched off the receive thread
+        self._lock = Lock()
+        self._resyncing = False
+        self._buffer = []
+        self._resync_thread = None
+        self._resync_started = None
+        self.resyncs = 0
+        self.resync_seconds = 0.0
+        self.last_resync_seconds = None
+        self.buffered = 0
+        self.buffered_max = 0
+        self.replayed = 0
+        self.stale = 0
+        # side -> (prices, cumulative sizes) from the top of book, rebuilt after the side changes
+        self._depth_cache = {'buy': None, 'sell': None}
 
     @property
     def product_id(self):
@@ -37,9 +139,11 @@ class OrderBook(WebsocketClient):
         print("\n-- OrderBook Socket Closed! --")
 
     def reset_book(self):
+        res = self._client.get_product_order_book(product_id=self.product_id, level=3)
         self._asks = SortedDict()
         self._bids = SortedDict()
-        res = self._client.get_product_order_book(product_id=self.product_id, level=3)
+        self._orders = {}
+        self._depth_cache = {'buy': None, 'sell': None}
         for bid in res['bids']:
             self.add({
                 'id': bid[2],
@@ -60,16 +164,28 @@ class OrderBook(WebsocketClient):
         if self._log_to:
             pickle.dump(message, self._log_to)
 
+        with self._lock:
+            if self._resyncing:
+                self._hold(message)
+                return
+            if self._sequence == -1:
+                self._start_resync(message)
+                return
+        if not self._apply(message):
+            with self._lock:
+                self._start_resync(message)
+
+    def _apply(self, message):
+        """ Apply one message in sequence. Returns False, leaving the book
+        untouched, when messages are missing before it.
+        """
         sequence = message.get('sequence', -1)
-        if self._sequence == -1:
-            self.reset_book()
-            return
         if sequence <= self._sequence:
             # ignore older messages (e.g. before order book initialization from getProductOrderBook)
-            return
+            return True
         elif sequence > self._sequence + 1:
             self.on_sequence_gap(self._sequence, sequence)
-            return
+            return False
 
         msg_type = message['type']
         if msg_type == 'open':
@@ -83,78 +199,146 @@ class OrderBook(WebsocketClient):
             self.change(message)
 
         self._sequence = sequence
+        return True
+
+    def _hold(self, message):
+        self._buffer.append(message)
+        self.buffered += 1
+        self.buffered_max = max(self.buffered_max, len(self._buffer))
+
+    def _start_resync(self, message):
+        """ Buffer `message` and fetch a snapshot on another thread. Called
+        with the lock held.
+        """
+        self._resyncing = True
+        self._resync_started = time.time()
+        self.resyncs += 1
+        self._hold(message)
+        self._resync_thread = Thread(target=self._resync, name='order-book-resync', daemon=True)
+        self._resync_thread.start()
+
+    def _resync(self):
+        """ Load a snapshot, then replay the buffered messages newer than it
+        until the buffer is drained. A gap in the buffer starts over from a
+        new snapshot.
+        """
+        pending = []
+        while True:
+            try:
+                self.reset_book()
+            except Exception as e:
+                if self.stop:
+                    break
+                print('Error: snapshot fetch failed ({}), retrying'.format(e))
+                time.sleep(RESYNC_RETRY)
+                continue
 
-    def on_sequence_gap(self, gap_start, gap_end):
-        self.reset_book()
-        print('Error: messages missing ({} - {}). Re-initializing  book at sequence.'.format(
-            gap_start, gap_end, self._sequence))
+            while True:
+                with self._lock:
+                    batch, self._buffer, pending = pending + self._buffer, [], []
+                    if not batch:
+                        self._resyncing = False
+                        self.last_resync_seconds = time.time() - self._resync_started
+                        self.resync_seconds += self.last_resync_seconds
+                        return
+                for i, message in enumerate(batch):
+                    if message.get('sequence', -1) <= self._sequence:
+                        # Already part of the snapshot
+                        self.stale += 1
+                    elif self._apply(message):
+                        self.replayed += 1
+                    else:
+                        pending = batch[i:]
+                        break
+                if pending:
+                    break
+
+        with self._lock:
+            self._resyncing = False
+            self._sequence = -1
+
+    def wait_for_resync(self, timeout=None):
+        """ Block until a running resync has replayed its buffer """
+        thread = self._resync_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def metrics(self):
+        """ Connection metrics plus resync count and time in seconds, and the
+        messages buffered while resyncing, split into those replayed on the
+        snapshot and those it already contained
+        """
+        return {
+            **super(OrderBook, self).metrics(),
+            "resyncing": self._resyncing,
+            "resyncs": self.resyncs,
+            "resync_seconds": self.resync_seconds,
+            "last_resync_seconds": self.last_resync_seconds,
+            "buffered": self.buffered,
+            "buffered_max": self.buffered_max,
+            "buffer_depth": len(self._buffer),
+            "replayed": self.replayed,
+            "stale": self.stale,
+        }
+
+    def on_gap(self, disconnected_at, reconnected_at):
+        # Updates were missed while reconnecting; rebuild from a fresh snapshot on the next message.
+        # A resync already running finds the gap in its buffer and starts over by itself.
+        with self._lock:
+            if not self._resyncing:
+                self._sequence = -1
+        print('-- Reconnected after {:.1f}s, re-initializing book --'.format(reconnected_at - disconnected_at))
 
+    def on_sequence_gap(self, gap_start, gap_end):
+        print('Error: messages missing ({} - {}). Re-initializing book from a snapshot.'.format(gap_start, gap_end))
 
     def add(self, order):
-        order = {
-            'id': order.get('order_id') or order['id'],
-            'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
-        }
-        if order['side'] == 'buy':
-            bids = self.get_bids(order['price'])
-            if bids is None:
-                bids = [order]
+        order = Order(order.get('order_id') or order['id'], order['side'], Decimal(order['price']),
+                      Decimal(order.get('size') or order['remaining_size']))
+        level = self.get_bids(order.price) if order.side == 'buy' else self.get_asks(order.price)
+        if level is None:
+            level = OrderQueue()
+            if order.side == 'buy':
+                self.set_bids(order.price, level)
             else:
-                bids.append(order)
-            self.set_bids(order['price'], bids)
+                self.set_asks(order.price, level)
+            self._depth_changed(order.side, order.price)
         else:
-            asks = self.get_asks(order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(order['price'], asks)
+            self._depth_changed(order.side, order.price, order.size)
+        level.append(order)
+        self._orders[order.id] = order
+
+    def _unlink(self, order):
+        del self._orders[order.id]
+        level = self.get_bids(order.price) if order.side == 'buy' else self.get_asks(order.price)
+        level.remove(order)
+        if level:
+            self._depth_changed(order.side, order.price, -order.size)
+        elif order.side == 'buy':
+            self.remove_bids(order.price)
+            self._depth_changed(order.side, order.price)
+        else:
+            self.remove_asks(order.price)
+            self._depth_changed(order.side, order.price)
 
     def remove(self, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(price, bids)
-                else:
-                    self.remove_bids(price)
-        else:
-            asks = self.get_asks(price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(price, asks)
-                else:
-                    self.remove_asks(price)
+        order = self._orders.get(order['order_id'])
+        if order is not None:
+            self._unlink(order)
 
     def match(self, order):
         size = Decimal(order['size'])
-        price = Decimal(order['price'])
+        maker = self._orders.get(order['maker_order_id'])
+        if maker is None:
+            return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(price, bids)
+        level = self.get_bids(maker.price) if maker.side == 'buy' else self.get_asks(maker.price)
+        assert level.head is maker
+        if maker.size == size:
+            self._unlink(maker)
         else:
-            asks = self.get_asks(price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(price, asks[1:])
-            else:
-                asks[0]['size'] -= size
-                self.set_asks(price, asks)
+            level.resize(maker, maker.size - size)
+            self._depth_changed(maker.side, maker.price, -size)
 
     def change(self, order):
         try:
@@ -167,26 +351,12 @@ class OrderBook(WebsocketClient):
         except KeyError:
             return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(price, bids)
-        else:
-            asks = self.get_asks(price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(price, asks)
-
-        tree = self._asks if order['side'] == 'sell' else self._bids
-        node = tree.get(price)
-
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
+        resting = self._orders.get(order['order_id'])
+        if resting is None or resting.price != price:
             return
+        level = self.get_bids(price) if resting.side == 'buy' else self.get_asks(price)
+        self._depth_changed(resting.side, price, new_size - resting.size)
+        level.resize(resting, new_size)
 
     def get_current_ticker(self):
         return self._current_ticker
@@ -218,6 +388,122 @@ class OrderBook(WebsocketClient):
                 result['bids'].append([order['price'], order['size'], order['id']])
         return result
 
+    # Aggregated (L2) views. Prices and sizes come back as floats; levels
+    # report their total size and order count without touching the orders.
+    _price_divisor = 1
+    _size_divisor = 1
+
+    def _side(self, side):
+        return self._bids if side == 'buy' else self._asks
+
+    def _top(self, tree, index):
+        if not tree:
+            return None, 0.0, 0
+        price, level = tree.peekitem(index)
+        return float(price) / self._price_divisor, float(level.size) / self._size_divisor, len(level)
+
+    def top_of_book(self):
+        """ Best bid and ask with their level size and order count, None
+        prices for an empty side
+        """
+        bid, bid_size, bid_orders = self._top(self._bids, -1)
+        ask, ask_size, ask_orders = self._top(self._asks, 0)
+        return {
+            'bid': bid, 'bid_size': bid_size, 'bid_orders': bid_orders,
+            'ask': ask, 'ask_size': ask_size, 'ask_orders': ask_orders,
+        }
+
+    def depth(self, levels=10):
+        """ Top `levels` price levels of each side, best first
+
+        Returns:
+            tuple: (bids, asks), each a (levels x 3) float array of price,
+            total size and order count; shorter when a side has fewer levels
+        """
+        result = []
+        for tree, reverse in ((self._bids, True), (self._asks, False)):
+            count = min(levels, len(tree))
+            prices = list(tree.islice(len(tree) - count, reverse=True) if reverse else tree.islice(stop=count))
+            book = np.empty((count, 3))
+            book[:, 0] = np.array(prices, dtype=float) / self._price_divisor
+            book[:, 1] = np.array([tree[price].size for price in prices], dtype=float) / self._size_divisor
+            book[:, 2] = [len(tree[price]) for price in prices]
+            result.append(book)
+        return tuple(result)
+
+    def _depth_changed(self, side, price, delta=None):
+        """ Keep the cumulative depth cache of `side` in step with the book:
+        a level whose size moved by `delta` is patched in place, while a
+        level appearing or disappearing (no `delta`) drops the cache
+        """
+        cache = self._depth_cache[side]
+        if cache is None:
+            return
+        if delta is None:
+            self._depth_cache[side] = None
+            return
+        tree = self._side(side)
+        index = tree.index(price)
+        cache[1][len(tree) - 1 - index if side == 'buy' else index] += float(delta) / self._size_divisor
+        cache[2] = None
+
+    def _cumulative(self, side):
+        cache = self._depth_cache[side]
+        if cache is None:
+            tree = self._side(side)
+            prices = np.fromiter(tree.keys(), dtype=float, count=len(tree)) / self._price_divisor
+            sizes = np.fromiter((level.size for level in tree.values()), dtype=float, count=len(tree))
+            sizes /= self._size_divisor
+            if side == 'buy':
+                # Bids run downwards from the top, so search them negated
+                prices, sizes = -prices[::-1], sizes[::-1].copy()
+            cache = self._depth_cache[side] = [prices, sizes, None]
+        if cache[2] is None:
+            cache[2] = np.cumsum(cache[1])
+        return cache[0], cache[2]
+
+    def cumulative_depth(self, side, price):
+        """ Total size resting from the top of `side` ('buy' or 'sell') up
+        to and including `price`. Level sizes are cached per side and patched
+        as orders change; the running totals are recomputed only after that
+        side changes, and the cache is rebuilt only when a level appears or
+        disappears.
+        """
+        prices, sizes = self._cumulative(side)
+        index = np.searchsorted(prices, -price if side == 'buy' else price, side='right')
+        return float(sizes[index - 1]) if index else 0.0
+
+    def mid(self):
+        top = self.top_of_book()
+        if top['bid'] is None or top['ask'] is None:
+            return None
+        return (top['bid'] + top['ask']) / 2
+
+    def microprice(self):
+        """ Mid weighted towards the side with less size at the touch; the
+        plain mid when neither touch has any size
+        """
+        top = self.top_of_book()
+        if top['bid'] is None or top['ask'] is None:
+            return None
+        total = top['bid_size'] + top['ask_size']
+        if not total:
+            return (top['bid'] + top['ask']) / 2
+        return (top['bid'] * top['ask_size'] + top['ask'] * top['bid_size']) / total
+
+    def imbalance(self, levels=1):
+        """ (bid size - ask size) / (bid size + ask size) over the top
+        `levels` of each side, between -1 and 1
+        """
+        if levels == 1:
+            top = self.top_of_book()
+            bid_size, ask_size = top['bid_size'], top['ask_size']
+        else:
+            bids, asks = self.depth(levels)
+            bid_size, ask_size = bids[:, 1].sum(), asks[:, 1].sum()
+        total = bid_size + ask_size
+        return float((bid_size - ask_size) / total) if total else 0.0
+
     def get_ask(self):
         return self._asks.peekitem(0)[0]
 
@@ -263,14 +549,13 @@ if __name__ == '__main__':
 
         def on_message(self, message):
             super(OrderBookConsole, self).on_message(message)
+            if self._resyncing:
+                return
 
             # Calculate newest bid-ask spread
-            bid = self.get_bid()
-            bids = self.get_bids(bid)
-            bid_depth = sum([b['size'] for b in bids])
-            ask = self.get_ask()
-            asks = self.get_asks(ask)
-            ask_depth = sum([a['size'] for a in asks])
+            top = self.top_of_book()
+            bid, bid_depth = top['bid'], top['bid_size']
+            ask, ask_depth = top['ask'], top['ask_size']
 
             if self._bid == bid and self._ask == ask and self._bid_depth == bid_depth and self._ask_depth == ask_depth:
                 # If there are no changes to the bid-ask spread since the last update, no need to print
@@ -0,0 +1,171 @@
+#
+# cbpro/order_book_manager.py
+#
+# Order books for many products kept live from one websocket connection
+
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from plotr_signal.modules.cbpro.order_book import OrderBook
+from plotr_signal.modules.cbpro.public_client import PublicClient
+from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
+
+TOP_COLUMNS = ('bid', 'bid_size', 'bid_orders', 'ask', 'ask_size', 'ask_orders')
+""" tuple: Columns of `OrderBookManager.top_table`, as in `OrderBook.top_of_book`
+"""
+
+
+class RateLimitedClient(object):
+    """ PublicClient whose requests share one request budget, so a burst of
+    resyncs across products stays under the public rate limit. The product
+    list is fetched once and shared by every book that looks up its
+    increments.
+    """
+
+    def __init__(self, client, limiter):
+        self.client = client
+        self.limiter = limiter
+        self._products = None
+        self._products_lock = Lock()
+
+    def get_products(self):
+        with self._products_lock:
+            if self._products is None:
+                self.limiter.acquire()
+                self._products = self.client.get_products()
+            return self._products
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def throttled(*args, **kwargs):
+            self.limiter.acquire()
+            return attr(*args, **kwargs)
+        return throttled
+
+
+class OrderBookManager(WebsocketClient):
+    """ One `full` channel subscription feeding an order book per product
+
+    Messages are routed by `product_id` to that product's book, which
+    tracks its own sequence and resyncs on its own; a gap on one product
+    never stalls the others. Every book makes its REST requests through one
+    shared, rate-limited client.
+
+    `top_table` keeps a (products x `TOP_COLUMNS`) array of the best bid and
+    ask. Routing a message only marks its product as changed, and a call
+    refreshes just the changed rows from the books' level aggregates, so no
+    book is walked or copied.
+
+    Args:
+        products (list): Product ids to follow
+        book_class: OrderBook class built per product, e.g. TickOrderBook;
+            called with `product_id` and the shared `client`
+        limiter (TokenBucket): Budget for snapshot requests; the backfill
+            module's process-wide public limiter when omitted
+        **kwargs: Passed to WebsocketClient
+
+    Attributes:
+        books (dict): Product id to its order book
+    """
+
+    def __init__(self, products: list, book_class=OrderBook, limiter=None, channels: list = None,
+                 should_print: bool = False, **kwargs):
+        super(OrderBookManager, self).__init__(products=list(products), channels=channels or ['full'],
+                                               should_print=should_print, **kwargs)
+        if limiter is None:
+            from plotr_signal.modules.backfill import public_rate_limiter
+            limiter = public_rate_limiter
+        self._client = RateLimitedClient(PublicClient(), limiter)
+        self.books = {}
+        for product_id in self.products:
+            self.books[product_id] = book_class(product_id=product_id, client=self._client)
+        self._rows = {product_id: i for i, product_id in enumerate(self.products)}
+        self._top = np.full((len(self.products), len(TOP_COLUMNS)), np.nan)
+        self._dirty = set(self.products)
+        self._dirty_lock = Lock()
+
+    def on_open(self):
+        for book in self.books.values():
+            book.stop = False
+        super(OrderBookManager, self).on_open()
+
+    def on_close(self):
+        for book in self.books.values():
+            book.stop = True
+        super(OrderBookManager, self).on_close()
+
+    def on_message(self, msg):
+        book = self.books.get(msg.get('product_id'))
+        if book is None:
+            if msg.get('type') == 'error':
+                print('{} - data: {}'.format(msg.get('message'), msg))
+            return
+        book.on_message(msg)
+        with self._dirty_lock:
+            self._dirty.add(book.product_id)
+
+    def on_gap(self, disconnected_at, reconnected_at):
+        for book in self.books.values():
+            book.on_gap(disconnected_at, reconnected_at)
+
+    def top_of_book(self) -> np.ndarray:
+        """ (products x `TOP_COLUMNS`) array of each product's touch, rows in
+        `products` order. Rows of books still loading a snapshot are NaN.
+        The array is updated in place by the next call.
+        """
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        for product_id in dirty:
+            book = self.books[product_id]
+            row = self._top[self._rows[product_id]]
+            if book._resyncing or book._sequence == -1:
+                # Stays marked until the replay of buffered messages has finished
+                row[:] = np.nan
+                with self._dirty_lock:
+                    self._dirty.add(product_id)
+                continue
+            top = book.top_of_book()
+            row[:] = [np.nan if top[column] is None else top[column] for column in TOP_COLUMNS]
+        return self._top
+
+    def top_table(self) -> pd.DataFrame:
+        """ `top_of_book` as a DataFrame indexed by product, with mid and
+        spread columns
+        """
+        table = pd.DataFrame(self.top_of_book().copy(), index=pd.Index(self.products, name='product_id'),
+                             columns=list(TOP_COLUMNS))
+        table['mid'] = (table['bid'] + table['ask']) / 2
+        table['spread'] = table['ask'] - table['bid']
+        return table
+
+    def metrics(self) -> dict:
+        """ Connection metrics plus resync and buffering totals across books """
+        books = [book.metrics() for book in self.books.values()]
+        return {
+            **super(OrderBookManager, self).metrics(),
+            "books": len(books),
+            "resyncing": sum(metrics["resyncing"] for metrics in books),
+            "resyncs": sum(metrics["resyncs"] for metrics in books),
+            "resync_seconds": sum(metrics["resync_seconds"] for metrics in books),
+            "buffered": sum(metrics["buffered"] for metrics in books),
+            "buffer_depth": sum(metrics["buffer_depth"] for metrics in books),
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    manager = OrderBookManager(sys.argv[1:] or ["BTC-USD", "ETH-USD", "LTC-USD"])
+    manager.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(manager.top_table())
+    except KeyboardInterrupt:
+        manager.close()
@@ -0,0 +1,221 @@
+#
+# cbpro/tick_order_book.py
+#
+# OrderBook that keeps prices and sizes as integer ticks and lots of the
+# product's quote and base increments
+
+from decimal import Decimal
+
+from sortedcontainers import SortedDict
+
+from plotr_signal.modules.cbpro.order_book import OrderBook
+
+
+def parse_increment(increment: str) -> tuple:
+    """ (decimals, step) of an increment such as "0.01" or "0.05", where
+    the increment is step * 10 ** -decimals
+    """
+    whole, _, fraction = increment.partition('.')
+    fraction = fraction.rstrip('0')
+    return len(fraction), int(whole + fraction)
+
+
+def to_units(value: str, decimals: int) -> int:
+    """ Integer count of 10 ** -decimals in a decimal string, parsed without
+    going through Decimal or float
+    """
+    whole, _, fraction = value.partition('.')
+    if len(fraction) > decimals and fraction[decimals:].strip('0'):
+        raise ValueError(f"{value} has more than {decimals} decimals")
+    return int(whole + (fraction + '0' * decimals)[:decimals])
+
+
+class Level(object):
+    """ One price level: orders in arrival order and their total size
+
+    Attributes:
+        side (str): 'buy' or 'sell'
+        price (int): Price in ticks
+        size (int): Total size in lots
+        orders (dict): Order id to size in lots, oldest first
+    """
+    __slots__ = ('side', 'price', 'size', 'orders')
+
+    def __init__(self, side: str, price: int):
+        self.side = side
+        self.price = price
+        self.size = 0
+        self.orders = {}
+
+    def __len__(self):
+        return len(self.orders)
+
+
+class TickOrderBook(OrderBook):
+    """ OrderBook on integer ticks and lots
+
+    Prices and sizes are converted once, straight from the feed's strings,
+    to integer multiples of the product's `quote_increment` and
+    `base_increment`. Levels are `Level`s keyed by tick in a SortedDict per
+    side, and every resting order is indexed by id, so removing, matching or
+    changing an order never scans its level. No Decimal is created while
+    applying messages.
+
+    The public accessors keep the OrderBook contract and convert back to
+    Decimal, so both classes report the same book for the same messages.
+
+    Args:
+        product_id (str): Product to follow
+        quote_increment (str): Price increment, e.g. "0.01"; looked up with
+            `get_products` when omitted
+        base_increment (str): Size increment, e.g. "0.00000001"; looked up
+            when omitted
+        log_to: File the raw messages are pickled to
+        client: REST client for snapshots and increments; a new
+            PublicClient when omitted
+    """
+
+    def __init__(self, product_id='BTC-USD', quote_increment: str = None, base_increment: str = None, log_to=None,
+                 client=None):
+        super(TickOrderBook, self).__init__(product_id=product_id, log_to=log_to, client=client)
+        self._orders = {}
+        self.quote_increment = quote_increment
+        self.base_increment = base_increment
+        if quote_increment is not None and base_increment is not None:
+            self._set_increments(quote_increment, base_increment)
+
+    def _set_increments(self, quote_increment: str, base_increment: str):
+        self.quote_increment = quote_increment
+        self.base_increment = base_increment
+        self._price_decimals, self._price_step = parse_increment(quote_increment)
+        self._size_decimals, self._size_step = parse_increment(base_increment)
+        self._price_divisor = 10 ** self._price_decimals / self._price_step
+        self._size_divisor = 10 ** self._size_decimals / self._size_step
+
+    def _load_increments(self):
+        for product in self._client.get_products():
+            if product['id'] == self.product_id:
+                self._set_increments(self.quote_increment or product['quote_increment'],
+                                     self.base_increment or product['base_increment'])
+                return
+        raise ValueError(f"Unknown product {self.product_id}")
+
+    def ticks(self, price: str) -> int:
+        units = to_units(price, self._price_decimals)
+        return units if self._price_step == 1 else units // self._price_step
+
+    def lots(self, size: str) -> int:
+        units = to_units(size, self._size_decimals)
+        return units if self._size_step == 1 else units // self._size_step
+
+    def price(self, ticks: int) -> Decimal:
+        return Decimal(ticks * self._price_step).scaleb(-self._price_decimals)
+
+    def size(self, lots: int) -> Decimal:
+        return Decimal(lots * self._size_step).scaleb(-self._size_decimals)
+
+    def reset_book(self):
+        if self.quote_increment is None or self.base_increment is None:
+            self._load_increments()
+        res = self._client.get_product_order_book(product_id=self.product_id, level=3)
+        self._asks = SortedDict()
+        self._bids = SortedDict()
+        self._orders = {}
+        self._depth_cache = {'buy': None, 'sell': None}
+        for price, size, order_id in res['bids']:
+            self._add(self._bids, 'buy', order_id, self.ticks(price), self.lots(size))
+        for price, size, order_id in res['asks']:
+            self._add(self._asks, 'sell', order_id, self.ticks(price), self.lots(size))
+        self._sequence = res['sequence']
+
+    def _add(self, tree: SortedDict, side: str, order_id: str, price: int, size: int):
+        level = tree.get(price)
+        if level is None:
+            level = tree[price] = Level(side, price)
+            self._depth_changed(side, price)
+        else:
+            self._depth_changed(side, price, size)
+        level.orders[order_id] = size
+        level.size += size
+        self._orders[order_id] = level
+
+    def _drop(self, order_id: str, level: Level):
+        size = level.orders.pop(order_id)
+        level.size -= size
+        del self._orders[order_id]
+        if level.orders:
+            self._depth_changed(level.side, level.price, -size)
+        else:
+            del (self._bids if level.side == 'buy' else self._asks)[level.price]
+            self._depth_changed(level.side, level.price)
+
+    def add(self, order):
+        side = order['side']
+        self._add(self._bids if side == 'buy' else self._asks, side, order.get('order_id') or order['id'],
+                  self.ticks(order['price']), self.lots(order.get('size') or order['remaining_size']))
+
+    def remove(self, order):
+        level = self._orders.get(order['order_id'])
+        if level is not None:
+            self._drop(order['order_id'], level)
+
+    def match(self, order):
+        maker = order['maker_order_id']
+        level = self._orders.get(maker)
+        if level is None:
+            return
+        # Matches always take the oldest order at the level
+        assert next(iter(level.orders)) == maker
+        size = self.lots(order['size'])
+        if level.orders[maker] == size:
+            self._drop(maker, level)
+        else:
+            # A match larger than the resting order means the book is out of step with the feed
+            assert level.orders[maker] > size
+            level.orders[maker] -= size
+            level.size -= size
+            self._depth_changed(level.side, level.price, -size)
+
+    def change(self, order):
+        if 'new_size' not in order or 'price' not in order:
+            return
+        order_id = order['order_id']
+        level = self._orders.get(order_id)
+        if level is None or level.price != self.ticks(order['price']):
+            return
+        size = self.lots(order['new_size'])
+        self._depth_changed(level.side, level.price, size - level.orders[order_id])
+        level.size += size - level.orders[order_id]
+        level.orders[order_id] = size
+
+    def _orders_at(self, level: Level) -> list:
+        price = self.price(level.price)
+        return [{'id': order_id, 'side': level.side, 'price': price, 'size': self.size(size)}
+                for order_id, size in level.orders.items()]
+
+    def get_current_book(self):
+        result = {
+            'sequence': self._sequence,
+            'asks': [],
+            'bids': [],
+        }
+        for key, tree in (('asks', self._asks), ('bids', self._bids)):
+            for level in list(tree.values()):
+                price = self.price(level.price)
+                for order_id, size in list(level.orders.items()):
+                    result[key].append([price, self.size(size), order_id])
+        return result
+
+    def get_ask(self):
+        return self.price(self._asks.peekitem(0)[0])
+
+    def get_asks(self, price):
+        level = self._asks.get(self.ticks(format(Decimal(price), 'f')))
+        return self._orders_at(level) if level is not None else None
+
+    def get_bid(self):
+        return self.price(self._bids.peekitem(-1)[0])
+
+    def get_bids(self, price):
+        level = self._bids.get(self.ticks(format(Decimal(price), 'f')))
+        return self._orders_at(level) if level is not None else None
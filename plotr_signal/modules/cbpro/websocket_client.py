@@ -9,15 +9,34 @@ import json
 import base64
 import hmac
 import hashlib
+import random
 import time
 from threading import Thread
 from websocket import create_connection, WebSocketConnectionClosedException
 from plotr_signal.modules.cbpro.cbpro_auth import get_auth_headers
 
+PING_INTERVAL = 30
+""" int: Seconds between keepalive pings
+"""
+
+HEARTBEAT_TIMEOUT = 30
+""" int: Seconds without any message before the connection counts as stalled
+"""
+
+RECONNECT_BACKOFF = 1.0
+""" float: Base reconnect delay in seconds, doubled per failed attempt
+"""
+
+MAX_RECONNECT_BACKOFF = 60.0
+""" float: Cap on the reconnect delay in seconds
+"""
+
+
 
 class WebsocketClient(object):
     def __init__(self, url="wss://ws-feed.pro.coinbase.com", products=None, message_type="subscribe", 
-                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None):
+                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None,
+                 reconnect=True, heartbeat=True, ping_interval=PING_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT):
         self.url = url
         self.products = products
         self.channels = channels
@@ -31,12 +50,26 @@ class WebsocketClient(object):
         self.api_secret = api_secret
         self.api_passphrase = api_passphrase
         self.should_print = should_print
+        self.reconnect = reconnect
+        self.heartbeat = heartbeat
+        self.ping_interval = ping_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.reconnects = 0
+        self.downtime = 0.0
+        self.disconnected_at = None
+        self._last_ping = 0.0
+        self._hide_heartbeats = False
 
     def start(self):
         def _go():
-            self._connect()
-            self._listen()
-            self._disconnect()
+            try:
+                try:
+                    self._connect()
+                except Exception as e:
+                    self._connection_lost(e)
+                self._listen()
+            finally:
+                self._disconnect()
 
         self.stop = False
         self.on_open()
@@ -52,10 +85,23 @@ class WebsocketClient(object):
         if self.url[-1] == "/":
             self.url = self.url[:-1]
 
+        sub_params = self._subscription('subscribe', self.products)
+
+        self.ws = create_connection(self.url, timeout=self.heartbeat_timeout)
+
+        self.ws.send(json.dumps(sub_params))
+        self._last_ping = time.time()
+
+    def _subscription(self, message_type, products):
         if self.channels is None:
-            sub_params = {'type': 'subscribe', 'product_ids': self.products}
+            sub_params = {'type': message_type, 'product_ids': products}
         else:
-            sub_params = {'type': 'subscribe', 'product_ids': self.products, 'channels': self.channels}
+            channels = list(self.channels)
+            # The heartbeat channel keeps quiet subscriptions talking, so silence means a stall
+            self._hide_heartbeats = self.heartbeat and 'heartbeat' not in channels
+            if self._hide_heartbeats:
+                channels.append('heartbeat')
+            sub_params = {'type': message_type, 'product_ids': products, 'channels': channels}
 
         if self.auth:
             timestamp = str(time.time())
@@ -65,27 +111,94 @@ class WebsocketClient(object):
             sub_params['key'] = auth_headers['CB-ACCESS-KEY']
             sub_params['passphrase'] = auth_headers['CB-ACCESS-PASSPHRASE']
             sub_params['timestamp'] = auth_headers['CB-ACCESS-TIMESTAMP']
+        return sub_params
 
-        self.ws = create_connection(self.url)
+    def subscribe(self, products):
+        """ Add products to the running subscription. Reconnects resubscribe them too. """
+        products = [product for product in products if product not in (self.products or [])]
+        self.products = (self.products or []) + products
+        if products and self.ws is not None and self.ws.connected:
+            self.ws.send(json.dumps(self._subscription('subscribe', products)))
 
-        self.ws.send(json.dumps(sub_params))
+    def unsubscribe(self, products):
+        """ Remove products from the running subscription """
+        products = [product for product in products if product in (self.products or [])]
+        self.products = [product for product in self.products or [] if product not in products]
+        if products and self.ws is not None and self.ws.connected:
+            self.ws.send(json.dumps(self._subscription('unsubscribe', products)))
+
+    def _recv(self):
+        """ Next frame from the socket, pinging first when one is due. Raises
+        a WebSocketTimeoutException after `heartbeat_timeout` seconds of silence.
+        """
+        if time.time() - self._last_ping >= self.ping_interval:
+            self.ws.ping("keepalive")
+            self._last_ping = time.time()
+        return self.ws.recv()
 
     def _listen(self):
         while not self.stop:
+            # Only failures of the socket itself count as a lost connection
+            try:
+                data = self._recv()
+            except Exception as e:
+                self._connection_lost(e)
+                continue
             try:
-                start_t = 0
-                if time.time() - start_t >= 30:
-                    # Set a 30 second ping to keep connection alive
-                    self.ws.ping("keepalive")
-                    start_t = time.time()
-                data = self.ws.recv()
                 msg = json.loads(data)
             except ValueError as e:
-                self.on_error(e)
-            except Exception as e:
-                self.on_error(e)
-            else:
+                self.on_error(e, data)
+                continue
+            if self._hide_heartbeats and msg.get('type') == 'heartbeat':
+                continue
+            try:
                 self.on_message(msg)
+            except Exception as e:
+                self.on_error(e, msg)
+
+    def _connection_lost(self, e):
+        """ Reconnect after a dropped or stalled connection, or report it
+        through `on_error` when reconnecting is off
+        """
+        if self.stop:
+            return
+        if not self.reconnect:
+            self.on_error(e)
+            return
+        if self.should_print:
+            print('-- Connection lost ({}), reconnecting --'.format(e))
+        self._reconnect()
+
+    def _reconnect(self):
+        """ Resubscribe with jittered exponential backoff until connected or
+        stopped, then report the outage through `on_gap`
+        """
+        self.disconnected_at = time.time()
+        attempt = 0
+        while not self.stop:
+            delay = random.uniform(0, min(MAX_RECONNECT_BACKOFF, RECONNECT_BACKOFF * 2 ** attempt))
+            attempt += 1
+            deadline = time.time() + delay
+            while not self.stop and time.time() < deadline:
+                time.sleep(min(0.1, delay))
+            if self.stop:
+                return
+            try:
+                if self.ws:
+                    self.ws.shutdown()
+                self._connect()
+            except Exception:
+                continue
+
+            reconnected_at = time.time()
+            self.reconnects += 1
+            self.downtime += reconnected_at - self.disconnected_at
+            self._report_gap(self.disconnected_at, reconnected_at)
+            self.disconnected_at = None
+            return
+
+    def _report_gap(self, disconnected_at, reconnected_at):
+        self.on_gap(disconnected_at, reconnected_at)
 
     def _disconnect(self):
         try:
@@ -98,6 +211,9 @@ class WebsocketClient(object):
 
     def close(self):
         self.stop = True
+        if self.ws:
+            # Unblock a pending recv instead of waiting out the heartbeat timeout
+            self.ws.shutdown()
         self.thread.join()
 
     def on_open(self):
@@ -112,6 +228,24 @@ class WebsocketClient(object):
         if self.should_print:
             print(msg)
 
+    def on_gap(self, disconnected_at, reconnected_at):
+        """ Called after a reconnect. Messages sent between the two epoch
+        times were missed, so stateful consumers should resync.
+        """
+        if self.should_print:
+            print('-- Reconnected after {:.1f}s --'.format(reconnected_at - disconnected_at))
+
+    def metrics(self):
+        """ Connection health: reconnect count and total downtime in seconds """
+        downtime = self.downtime
+        if self.disconnected_at is not None:
+            downtime += time.time() - self.disconnected_at
+        return {
+            "connected": self.ws is not None and self.ws.connected and self.disconnected_at is None,
+            "reconnects": self.reconnects,
+            "downtime": downtime,
+        }
+
     def on_error(self, e, data=None):
         self.error = e
         self.stop = True
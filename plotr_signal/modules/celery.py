@@ -1,7 +1,9 @@
-from celery import Celery
+from celery import Celery, chord, group
 from flask import current_app as app
-from plotr_signal.modules.cbpro import public_client
-from pandas import DataFrame, to_datetime
+from requests.exceptions import RequestException
+from plotr_signal.modules import crypto
+from plotr_signal.modules.backfill import CandleBackfill, candle_window, split_windows
+from plotr_signal.modules.candle_store import CandleStore, from_epoch, to_epoch
 from datetime import datetime, timedelta
 
 def make_celery(app):
@@ -22,22 +24,76 @@ def make_celery(app):
 
 celery = make_celery(app)
 
+def _window_seconds(delta) -> int:
+    """ Request window length as integer seconds, which survive JSON task serialization """
+    return int(delta.total_seconds()) if isinstance(delta, timedelta) else int(delta)
+
+@celery.task()
+def get_crypto_price_history(product:str, start:datetime, end:datetime, interval=60, delta=None) -> dict:
+    """
+    Fan a price history backfill out over the workers.
+
+    The range is split into chunks of `BACKFILL_WINDOWS_PER_TASK` request
+    windows, each fetched by its own `fetch_price_window` subtask, and a
+    chord callback ingests the merged range into Druid once every chunk
+    is checkpointed. Only small summaries travel through the result
+    backend; the candles themselves live in the candle store.
+
+    `delta` is the request window length, as a timedelta or in seconds;
+    the largest window holding a full page of candles when omitted.
+    """
+    if isinstance(start, str):
+        start, end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+    window = _window_seconds(delta or candle_window(interval))
+    chunks = split_windows(start, end, timedelta(seconds=window) * app.config['BACKFILL_WINDOWS_PER_TASK'])
+
+    header = group(fetch_price_window.s(product, to_epoch(chunk_start), to_epoch(chunk_end), interval, window)
+                   for chunk_start, chunk_end in chunks)
+    result = chord(header)(ingest_price_history.s(product, to_epoch(start), to_epoch(end), interval))
+
+    return {"product": product, "chunks": len(chunks), "chord_id": result.id}
+
+@celery.task(bind=True, autoretry_for=(RequestException,), retry_backoff=True, retry_jitter=True, max_retries=5)
+def fetch_price_window(self, product:str, start:int, end:int, interval=60, window:int=None) -> dict:
+    """
+    Fetch one chunk of a backfill into the candle store, in request windows
+    of `window` seconds (a full page of candles when omitted).
+
+    Each request window is checkpointed to the store as soon as it lands,
+    so a retried or redelivered task only fetches the windows still missing.
+    """
+    delta = timedelta(seconds=window) if window else candle_window(interval)
+    store = CandleStore(app.config['CANDLE_STORE_DIR'])
+    backfill = CandleBackfill()
+
+    windows = []
+    for gap_start, gap_end in store.gaps(product, interval, from_epoch(start), from_epoch(end)):
+        windows.extend(split_windows(gap_start, gap_end, delta))
+
+    candles = 0
+    for (window_start, window_end), page in zip(windows, backfill.iter_windows(product, windows, granularity=interval)):
+        store.write(product, interval, page, start=window_start, end=window_end)
+        candles += len(page)
+
+    return {"start": start, "end": end, "windows": len(windows), "candles": candles}
+
 @celery.task()
-def get_crypto_price_history(product:str, start:datetime, end:datetime, interval=60, delta:timedelta=timedelta(minutes=300)) -> DataFrame:
-    results = []
-    current_dt = start
-    while start < end:
-        end_datetime = current_dt + delta
-        results.extend(public_client.get_product_historic_rates(
-            product_id=product, start=current_dt, end=end_datetime, granularity=interval))
-        current_dt = current_dt + delta
-
-    df = DataFrame(data=results, columns=['time', 'low', 'high', 'open', 'close', 'volume'])
-    df['time'] = to_datetime(df['time'], unit='s')
-    df.set_index(df['time'], drop=True, inplace=True)
-    for column in ['low', 'high', 'open', 'close', 'volume']:
-        df[column] = df[column].astype(float)
-
-    df['price'] = df[['low', 'high', 'open', 'close']].mean(axis=1)
-
-    return df
+def ingest_price_history(results:list, product:str, start:int, end:int, interval=60) -> dict:
+    """
+    Chord callback: stream the checkpointed range from the candle store
+    into Druid and return a summary instead of the data.
+    """
+    from plotr_signal.modules.druid import PlotrDruid
+
+    store = CandleStore(app.config['CANDLE_STORE_DIR'])
+    frames = crypto.iter_crypto_price_history(product=product, start=from_epoch(start), end=from_epoch(end),
+                                              interval=interval, chunk_size=app.config['DRUID_INGESTION_CHUNK_ROWS'],
+                                              store=store)
+    responses = PlotrDruid(druid_host=app.config['DRUID_HOST']).submit_ingestion_stream(product=product, frames=frames)
+
+    return {
+        "product": product,
+        "fetched_windows": sum(result['windows'] for result in results),
+        "fetched_candles": sum(result['candles'] for result in results),
+        "ingestion_tasks": responses
+    }
@@ -1,28 +1,89 @@
-from pandas import DataFrame, to_datetime
+from pandas import DataFrame
 from datetime import date, datetime, timedelta
 
-from plotr_signal.modules import cbpro
+from plotr_signal.modules.backfill import CandleBackfill, candle_window, split_windows
+from plotr_signal.modules.candle_store import CandleStore, to_epoch
+from plotr_signal.modules.candles import CandleBuffer
 
 
-def get_crypto_price_history(product: str, start: datetime, end: datetime, interval=60, delta: timedelta = timedelta(minutes=300)) -> DataFrame:
-    public_client = cbpro.PublicClient()
-    results = []
-    try:
-        while start < end:
-            end_datetime = start + delta
-            results.extend(public_client.get_product_historic_rates(
-                product_id=product, start=start, end=end_datetime, granularity=interval))
-            start = start + delta
-    except Exception as e:
-        raise e
+def get_crypto_price_history(product: str, start: datetime, end: datetime, interval=60, delta: timedelta = None,
+                             backfill: CandleBackfill = None, store: CandleStore = None) -> DataFrame:
+    backfill = backfill or CandleBackfill()
+    if store is None:
+        candles = backfill.fetch(product=product, start=start, end=end, granularity=interval, delta=delta)
+    else:
+        # Only fetch what the local store hasn't seen, then serve the range from it
+        for gap_start, gap_end in store.gaps(product, interval, start, end):
+            fetched = backfill.fetch(product=product, start=gap_start, end=gap_end, granularity=interval, delta=delta)
+            store.write(product, interval, fetched, start=gap_start, end=gap_end)
+        candles = store.read(product, interval, start, end)
 
-    df = DataFrame(data=results, columns=[
-                   'time', 'low', 'high', 'open', 'close', 'volume'])
-    df['time'] = to_datetime(df['time'], unit='s')
-    df.set_index(df['time'], drop=True, inplace=True)
-    for column in ['low', 'high', 'open', 'close', 'volume']:
-        df[column] = df[column].astype(float)
+    return candles.to_dataframe()
 
-    df['price'] = df[['low', 'high', 'open', 'close']].mean(axis=1)
 
-    return df
+def iter_crypto_price_history(product: str, start: datetime, end: datetime, interval=60, delta: timedelta = None,
+                              chunk_size: int = None, backfill: CandleBackfill = None, store: CandleStore = None):
+    """ Stream price history as a sequence of small DataFrames in time order
+
+    Pages are yielded as soon as they arrive while later windows are still
+    being fetched, so consumers can start writing before the range is done.
+    When a store is given, covered ranges are served from disk and fetched
+    pages are written back as they go.
+
+    Args:
+        product (str): Product id, e.g. BTC-USD
+        start (datetime): Start of the range
+        end (datetime): End of the range
+        interval (int): Candle size in seconds
+        delta (timedelta): Length of each request window
+        chunk_size (int): Yield frames of at least this many rows instead of
+            one frame per page
+        backfill (CandleBackfill): Engine used to fetch missing windows
+        store (CandleStore): Local candle store to consult first
+
+    Yields:
+        DataFrame: Price history frames shaped like get_crypto_price_history
+    """
+    backfill = backfill or CandleBackfill()
+    delta = delta or candle_window(interval)
+
+    # (window_start, window_end, cached) in time order
+    windows = []
+    cursor = start
+    gaps = store.gaps(product, interval, start, end) if store is not None else [(start, end)]
+    for gap_start, gap_end in gaps:
+        if cursor < gap_start:
+            windows.extend((s, e - timedelta(seconds=1), True) for s, e in split_windows(cursor, gap_start, delta))
+        windows.extend((s, e, False) for s, e in split_windows(gap_start, gap_end, delta))
+        cursor = gap_end
+    if cursor < end:
+        windows.extend((s, e, True) for s, e in split_windows(cursor, end, delta))
+
+    pages = backfill.iter_windows(product, [(s, e) for s, e, cached in windows if not cached], granularity=interval)
+    first, last = to_epoch(start), to_epoch(end)
+    latest = None
+    chunk = CandleBuffer(capacity=chunk_size or 1)
+    for window_start, window_end, cached in windows:
+        if cached:
+            page = store.read(product, interval, window_start, window_end)
+        else:
+            page = next(pages)
+            if store is not None:
+                store.write(product, interval, page, start=window_start, end=window_end)
+
+        time, values = page.sorted_columns()
+        # Neighbouring windows share an edge candle and gaps may overrun the range
+        mask = (time >= first) & (time <= last)
+        if latest is not None:
+            mask &= time > latest
+        if not mask.any():
+            continue
+        latest = time[mask][-1]
+        chunk.append_columns(time[mask], values[mask])
+
+        if chunk_size is None or len(chunk) >= chunk_size:
+            yield chunk.to_dataframe()
+            chunk = CandleBuffer(capacity=chunk_size or 1)
+
+    if len(chunk):
+        yield chunk.to_dataframe()
@@ -52,6 +52,21 @@ class PlotrDruid(PyDruid):
         except TypeError as e:
             raise e
 
+    def submit_ingestion_stream(self, product: str, frames, timestamp_column: str = "time") -> list:
+        """ Submit one inline ingestion task per DataFrame in `frames`,
+        appending to the product's datasource as each chunk arrives.
+        """
+        if isinstance(frames, DataFrame):
+            frames = [frames]
+
+        responses = []
+        for frame in frames:
+            frame = frame.assign(**{timestamp_column: frame[timestamp_column].dt.strftime("%Y-%m-%dT%H:%M:%S.%f")})
+            spec = build_task_ingestion_spec(product=product, data=frame.to_dict(orient='records'),
+                                             timstamp_column=timestamp_column)
+            responses.append(self.submit_ingestion_task(json.dumps(spec)))
+        return responses
+
     def submit_web_socket_stream_kafka_spec(self, stream_name: str):
         wsStreamSpec = [
             {
@@ -0,0 +1,139 @@
+""" Indicator computation graph
+
+This module is used to evaluate many indicators over the same price
+series without repeating shared work. Indicators are declared as small
+graphs of primitives (column, EMA, diff, rolling max/min, ...). Each
+primitive node is keyed by its operation, inputs and parameters, so two
+indicators asking for the same 26-period EMA or the same 14-bar rolling
+high share one node, and every distinct node is evaluated exactly once.
+
+Example:
+    graph = IndicatorGraph()
+    graph.macd(12, 26, 9)
+    graph.macd(5, 26, 9)
+    graph.rsi(14)
+    graph.stoch(14)
+    frame = graph.evaluate(price_data)
+"""
+import numpy as np
+from pandas import DataFrame, Series
+
+from plotr_signal.modules.quantlib import rolling_extrema, wilder_smoothing
+
+
+def _ewm(params, src):
+    return src.ewm(span=params['span'], adjust=params['adjust']).mean()
+
+
+def _wilder(params, src):
+    """ Wilder smoothing seeded with the mean of the first `n` values after
+    the leading NaN, matching QuantLib.RSI
+    """
+    n = params['n']
+    values = src.to_numpy(dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) > n:
+        out[n] = np.nansum(values[:n + 1]) / n
+        out[n + 1:] = wilder_smoothing(values[n + 1:], n, initial=out[n])
+    return Series(out, index=src.index)
+
+
+def _rolling(params, src, reduce):
+    window = params['window']
+    return Series(rolling_extrema(src.to_numpy(dtype=float), [window], reduce)[window], index=src.index)
+
+
+OPERATIONS = {
+    'column': lambda params, frame: frame[params['name']].astype(float),
+    'ewm': _ewm,
+    'sub': lambda params, a, b: a - b,
+    'diff': lambda params, src: src.diff(),
+    'gain': lambda params, src: src.mask(src < 0, 0.0),
+    'loss': lambda params, src: -src.mask(src > 0, -0.0),
+    'wilder': _wilder,
+    'rsi': lambda params, gain, loss: 100 - (100 / (1 + gain / loss)),
+    'rolling_max': lambda params, src: _rolling(params, src, np.maximum),
+    'rolling_min': lambda params, src: _rolling(params, src, np.minimum),
+    'stoch': lambda params, close, high, low: (close - low) / (high - low) * 100,
+}
+""" dict: Primitive name to implementation mapping. Implementations take
+the node parameters followed by the evaluated inputs
+"""
+
+
+class IndicatorGraph(object):
+    """ Declarative set of indicators evaluated with shared intermediates
+
+    Attributes:
+        outputs (dict): Output column name to node key mapping
+        evaluations (int): Distinct nodes evaluated by the last `evaluate`
+    """
+    FRAME = ('frame', (), ())
+    """ tuple: Key of the source node holding the price DataFrame
+    """
+
+    def __init__(self):
+        self.outputs = {}
+        self.evaluations = 0
+
+    def node(self, op: str, *inputs, **params) -> tuple:
+        """ Key for primitive `op` applied to `inputs` with `params`.
+        Identical declarations produce identical keys.
+        """
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown indicator primitive {op}")
+        return (op, tuple(inputs), tuple(sorted(params.items())))
+
+    def output(self, name: str, key: tuple) -> tuple:
+        """ Expose node `key` as output column `name` """
+        self.outputs[name] = key
+        return key
+
+    def column(self, name: str = 'close') -> tuple:
+        return self.node('column', self.FRAME, name=name)
+
+    def ema(self, span: int, column: str = 'close', adjust: bool = True) -> tuple:
+        return self.node('ewm', self.column(column), span=span, adjust=adjust)
+
+    def macd(self, span_short: int = 12, span_long: int = 26, signal_span: int = 9,
+             column: str = 'close', adjust: bool = True) -> tuple:
+        """ Declare MACD and its signal line, as QuantLib.MACD computes them """
+        macd = self.node('sub', self.ema(span_short, column, adjust), self.ema(span_long, column, adjust))
+        signal = self.node('ewm', macd, span=signal_span, adjust=adjust)
+        suffix = f"{span_short}_{span_long}_{signal_span}"
+        return self.output(f"macd_{suffix}", macd), self.output(f"signal_{suffix}", signal)
+
+    def rsi(self, time_period: int = 14, column: str = 'close') -> tuple:
+        """ Declare RSI, as QuantLib.RSI computes it """
+        change = self.node('diff', self.column(column))
+        avg_gain = self.node('wilder', self.node('gain', change), n=time_period)
+        avg_loss = self.node('wilder', self.node('loss', change), n=time_period)
+        return self.output(f"rsi_{time_period}", self.node('rsi', avg_gain, avg_loss))
+
+    def stoch(self, period: int = 14) -> tuple:
+        """ Declare the stochastic oscillator %K, as QuantLib.STOCH computes it """
+        highest_high = self.node('rolling_max', self.column('high'), window=period)
+        lowest_low = self.node('rolling_min', self.column('low'), window=period)
+        return self.output(f"stoch_{period}", self.node('stoch', self.column('close'), highest_high, lowest_low))
+
+    def evaluate(self, price_data: DataFrame) -> DataFrame:
+        """ Evaluate every declared output, computing each distinct node once
+
+        Args:
+            price_data (DataFrame): Price series with the columns the
+                declared indicators read
+
+        Returns:
+            DataFrame: One column per declared output
+        """
+        cache = {self.FRAME: price_data}
+
+        def _evaluate(key):
+            if key not in cache:
+                op, inputs, params = key
+                cache[key] = OPERATIONS[op](dict(params), *[_evaluate(i) for i in inputs])
+            return cache[key]
+
+        result = DataFrame({name: _evaluate(key) for name, key in self.outputs.items()}, index=price_data.index)
+        self.evaluations = len(cache) - 1
+        return result
@@ -29,11 +29,16 @@ class Influx(object):
         self.write_api.write(bucket=bucket, record=price)
 
     def write_dataframe(self, dataframe:DataFrame=None, bucket:str=None, measurement:str=None):
+        """ Write a DataFrame, or each DataFrame of an iterator, to `bucket`.
+        Frames are handed to the batching write api as they arrive.
+        """
         if self.client.buckets_api().find_bucket_by_name(bucket) is None:
             description = f'time series pricing data for {bucket} securities'
             self.client.buckets_api().create_bucket(bucket_name=bucket, retention_rules=None, description=description, org_id=app.config['INFLUXDB_V2_ORG_ID'])
 
-        self.write_api.write(record=dataframe, bucket=bucket, data_frame_measurement_name=measurement)
+        frames = [dataframe] if isinstance(dataframe, DataFrame) else dataframe
+        for frame in frames:
+            self.write_api.write(record=frame, bucket=bucket, data_frame_measurement_name=measurement)
 
     def get_equity_field_dataframe(self, symbol, from_, to, interval:str='1m', field:str='close', index:list=['_time']):
         query = f'''
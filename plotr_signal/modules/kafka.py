@@ -12,6 +12,7 @@ class KafkaProducer(object):
         self.conf = conf
         self.producer = SerializingProducer(conf=self.conf)
         self.admin = KafkaAdmin(self.conf)
+        self.topics = set()
 
     def write_msg(self, topic, msg, timestamp: pandas.Timestamp):
         self.admin.create_topic(topics=[topic])
@@ -20,6 +21,39 @@ class KafkaProducer(object):
         epoch = timestamp_to_epoch(timestamp)
         self.producer.produce(topic=topic, value=msg, timestamp=epoch)
 
+    def write_dataframes(self, topic, frames, time_column: str = 'time'):
+        """
+            Produce every row of a DataFrame, or of each DataFrame in an
+            iterator of them, as a JSON message timestamped by `time_column`.
+            Frames are produced as they arrive so writes overlap the fetch.
+        """
+        if isinstance(frames, pandas.DataFrame):
+            frames = [frames]
+
+        self.admin.create_topic(topics=[topic])
+        for frame in frames:
+            epochs = frame[time_column].values.astype('datetime64[ms]').astype('int64')
+            records = frame.to_json(orient='records', lines=True, date_format='iso').splitlines()
+            for epoch, record in zip(epochs, records):
+                self.producer.produce(topic=topic, value=record, timestamp=int(epoch))
+            self.producer.poll(0)
+        self.producer.flush()
+
+    def write_batch(self, topic, records: list, timestamps: list = None, keys: list = None):
+        """
+            Produce a batch of already serialized records without waiting
+            for delivery. The topic is created on first use, and librdkafka
+            groups the messages into as few requests as it can.
+        """
+        if topic not in self.topics:
+            self.admin.create_topic(topics=[topic])
+            self.topics.add(topic)
+        for i, record in enumerate(records):
+            self.producer.produce(topic=topic, value=record,
+                                  key=keys[i] if keys is not None else None,
+                                  timestamp=int(timestamps[i]) if timestamps is not None else 0)
+        self.producer.poll(0)
+
 
 class KafkaConsumer(object):
     def __init__(self, conf):
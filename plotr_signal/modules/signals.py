@@ -0,0 +1,184 @@
+""" Real-time signal engine
+
+This module is used to evaluate indicator rules on the live Coinbase
+feed. `SignalEngine` subscribes to the `matches` and `ticker` channels,
+aggregates trades into bars per product through `bars.BarFeed`, updates
+each product's incremental indicators when a bar closes and emits
+crossover and threshold events through `on_signal`.
+
+Every event carries its latency from the exchange timestamp of the
+message that closed the bar to the moment it was emitted. All products
+share one thread and each message costs O(1) per rule, so one process
+follows hundreds of products.
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+from plotr_signal.modules.bars import BarFeed
+from plotr_signal.modules.quantlib import IncrementalMACD, IncrementalRSI
+
+LATENCY_SAMPLES = 10000
+""" int: Recent event latencies kept for `SignalEngine.latency_stats`
+"""
+
+
+class CrossoverRule(object):
+    """ Fires when the first line of an indicator crosses the second, e.g.
+    MACD crossing its signal line
+
+    Args:
+        name (str): Rule name reported in events
+        indicator (IncrementalIndicator): Prototype whose `update` returns a
+            (line, signal) pair. Each product gets its own copy.
+        inputs (tuple): Bar fields passed to `update`
+    """
+
+    def __init__(self, name: str, indicator, inputs: tuple = ('close',)):
+        self.name = name
+        self.indicator = indicator
+        self.inputs = inputs
+
+    def new_state(self) -> dict:
+        return {"indicator": type(self.indicator).from_dict(self.indicator.to_dict()), "previous": None}
+
+    def evaluate(self, state: dict, bar) -> tuple:
+        """ (direction or None, value) after feeding `bar` """
+        line, signal = state["indicator"].update(*[getattr(bar, field) for field in self.inputs])
+        spread = line - signal
+        previous, state["previous"] = state["previous"], spread
+        if previous is None or spread != spread or previous != previous:
+            return None, line
+        if previous <= 0 < spread:
+            return 'above', line
+        if previous >= 0 > spread:
+            return 'below', line
+        return None, line
+
+
+class ThresholdRule(object):
+    """ Fires when an indicator crosses above `upper` or below `lower`
+
+    Args:
+        name (str): Rule name reported in events
+        indicator (IncrementalIndicator): Prototype whose `update` returns
+            one value. Each product gets its own copy.
+        lower (float): Level that fires 'below' when crossed downwards
+        upper (float): Level that fires 'above' when crossed upwards
+        inputs (tuple): Bar fields passed to `update`
+    """
+
+    def __init__(self, name: str, indicator, lower: float = None, upper: float = None, inputs: tuple = ('close',)):
+        self.name = name
+        self.indicator = indicator
+        self.lower = lower
+        self.upper = upper
+        self.inputs = inputs
+
+    def new_state(self) -> dict:
+        return {"indicator": type(self.indicator).from_dict(self.indicator.to_dict()), "previous": None}
+
+    def evaluate(self, state: dict, bar) -> tuple:
+        value = state["indicator"].update(*[getattr(bar, field) for field in self.inputs])
+        previous, state["previous"] = state["previous"], value
+        if previous is None or value != value or previous != previous:
+            return None, value
+        if self.upper is not None and previous <= self.upper < value:
+            return 'above', value
+        if self.lower is not None and previous >= self.lower > value:
+            return 'below', value
+        return None, value
+
+
+def default_rules() -> list:
+    """ MACD(12, 26, 9) signal-line crossovers and RSI(14) 30/70 levels """
+    return [CrossoverRule('macd', IncrementalMACD()), ThresholdRule('rsi', IncrementalRSI(), lower=30, upper=70)]
+
+
+class SignalEngine(BarFeed):
+    """ Evaluate indicator rules on live bars for many products
+
+    Args:
+        products (list): Product ids to follow
+        interval (int): Bar length in seconds the rules run on
+        rules (list): `CrossoverRule`/`ThresholdRule`s evaluated on every
+            finished bar, `default_rules()` when omitted
+        channels (list): Feed channels carrying trades
+        **kwargs: Passed to `BarFeed`, e.g. `grace` or a `publisher`
+
+    Attributes:
+        latencies (deque): Recent exchange-to-emission latencies in seconds
+    """
+
+    def __init__(self, products=None, interval: int = 60, rules: list = None, channels: list = None,
+                 should_print: bool = False, **kwargs):
+        kwargs.setdefault('intervals', [interval])
+        kwargs.setdefault('grace', 0.0)
+        super(SignalEngine, self).__init__(products=products, channels=channels or ['matches', 'ticker'],
+                                           should_print=should_print, **kwargs)
+        self.interval = interval
+        self.rules = rules if rules is not None else default_rules()
+        self.states = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def on_bars(self, bars: list, now: float):
+        if self.publisher is not None:
+            self.publisher.add(bars)
+        for bar in bars:
+            if bar.interval == self.interval:
+                self.on_bar(bar, now)
+
+    def on_bar(self, bar, now: float):
+        """ Update the product's indicators with a finished bar and emit any
+        rule that fired. `now` is the exchange time that finished the bar.
+        """
+        states = self.states.get(bar.product_id)
+        if states is None:
+            states = self.states[bar.product_id] = [rule.new_state() for rule in self.rules]
+
+        for rule, state in zip(self.rules, states):
+            direction, value = rule.evaluate(state, bar)
+            if direction is None:
+                continue
+            latency = time.time() - now
+            self.latencies.append(latency)
+            self.on_signal({
+                "product_id": bar.product_id,
+                "rule": rule.name,
+                "direction": direction,
+                "value": float(value),
+                "close": bar.close,
+                "bar_start": bar.start,
+                "exchange_time": now,
+                "latency": latency,
+            })
+
+    def on_signal(self, event: dict):
+        if self.should_print:
+            print(event)
+
+    def latency_stats(self) -> dict:
+        """ Count, median, 99th percentile and max of recent event latencies """
+        if not self.latencies:
+            return {"count": 0}
+        latencies = np.fromiter(self.latencies, dtype=float)
+        return {
+            "count": len(latencies),
+            "p50": float(np.percentile(latencies, 50)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    engine = SignalEngine(products=sys.argv[1:] or ["BTC-USD", "ETH-USD"], should_print=True)
+    engine.start()
+    try:
+        while True:
+            time.sleep(10)
+            print(engine.latency_stats())
+    except KeyboardInterrupt:
+        engine.close()
@@ -0,0 +1,151 @@
+""" Indicator parameter sweeps
+
+This module is used to tune indicator parameters. Instead of calling
+`QuantLib.MACD`/`QuantLib.RSI` once per parameter set, a sweep computes
+every variant of a price series as one (time x parameter set) NumPy
+array. All variants advance through time together in one batched
+recursion, and an EMA span shared by several MACD variants is computed
+once. Large grids can be split into chunks across a process pool that
+reads the prices from, and writes results into, shared memory.
+"""
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from plotr_signal.modules.quantlib import ewm_mean, recursive_filter
+
+
+def macd_grid(span_short: list, span_long: list, signal_span: list) -> list:
+    """ Every (short, long, signal) combination with short < long """
+    return [(short, long, signal) for short, long, signal in product(span_short, span_long, signal_span)
+            if short < long]
+
+
+def macd_columns(close: np.ndarray, grid: list, adjust: bool) -> tuple:
+    """ (macd, signal) of `close` as (time x parameter set) arrays, one
+    column per (short, long, signal) in `grid`
+    """
+    spans = sorted({span for short, long, _ in grid for span in (short, long)})
+    column = {span: i for i, span in enumerate(spans)}
+    emas = ewm_mean(np.broadcast_to(close[:, None], (len(close), len(spans))), np.array(spans, dtype=float), adjust)
+
+    macd = emas[:, [column[short] for short, _, _ in grid]] - emas[:, [column[long] for _, long, _ in grid]]
+    signal = ewm_mean(macd, np.array([signal for _, _, signal in grid], dtype=float), adjust)
+    return macd, signal
+
+
+def rsi_columns(close: np.ndarray, periods: list) -> np.ndarray:
+    """ RSI of `close` as a (time x period) array, one column per period,
+    as `QuantLib.RSI` computes it
+    """
+    n = np.array(periods, dtype=float)
+    change = np.diff(close)[:, None]
+    step = np.arange(len(change))[:, None]
+    decay = (n - 1) / n
+
+    rsi = np.full((len(close), len(periods)), np.nan)
+    averages = []
+    for moves in (np.clip(change, 0.0, None), np.clip(-change, 0.0, None)):
+        # Each column starts from the mean of its first n moves, then smooths the rest
+        seed = np.cumsum(moves[:, 0])[np.minimum(n.astype(int), len(moves)) - 1] / n
+        inputs = np.where(step < n - 1, 0.0, np.where(step == n - 1, seed, moves / n))
+        averages.append(recursive_filter(inputs, decay))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi[1:] = np.where(step >= n - 1, 100 - 100 / (1 + averages[0] / averages[1]), np.nan)
+    return rsi
+
+
+def attach_shared(name: str, shape: tuple) -> tuple:
+    """ (memory, array) view of the float64 shared memory block `name`;
+    the caller closes `memory` when done
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def _sweep_chunk(kind: str, names: list, rows: int, columns: int, params: list, offset: int, adjust: bool):
+    """ Process pool worker: compute one chunk of the grid straight into
+    the shared output arrays
+    """
+    memories = []
+    try:
+        memory, close = attach_shared(names[0], (rows,))
+        memories.append(memory)
+        outputs = []
+        for name in names[1:]:
+            memory, output = attach_shared(name, (rows, columns))
+            memories.append(memory)
+            outputs.append(output)
+
+        results = macd_columns(close, params, adjust) if kind == 'macd' else (rsi_columns(close, params),)
+        for output, result in zip(outputs, results):
+            output[:, offset:offset + len(params)] = result
+    finally:
+        for memory in memories:
+            memory.close()
+
+
+def _sweep_processes(kind: str, close: np.ndarray, params: list, outputs: int, processes: int, adjust: bool) -> list:
+    rows, columns = len(close), len(params)
+    memories = [shared_memory.SharedMemory(create=True, size=max(close.nbytes, 1))]
+    memories += [shared_memory.SharedMemory(create=True, size=max(rows * columns * 8, 1)) for _ in range(outputs)]
+    try:
+        np.ndarray(close.shape, dtype=np.float64, buffer=memories[0].buf)[:] = close
+        names = [memory.name for memory in memories]
+        chunks = [chunk for chunk in np.array_split(np.arange(columns), processes * 4) if len(chunk)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_sweep_chunk, kind, names, rows, columns, [params[i] for i in chunk],
+                                   int(chunk[0]), adjust) for chunk in chunks]
+            for future in futures:
+                future.result()
+        return [np.array(np.ndarray((rows, columns), dtype=np.float64, buffer=memory.buf)) for memory in memories[1:]]
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+
+def sweep_macd(close, grid: list, adjust: bool = True, processes: int = None) -> dict:
+    """ MACD and signal lines for every parameter set in `grid`
+
+    Args:
+        close: Close prices as a 1-D array or Series
+        grid (list): (span_short, span_long, signal_span) tuples, e.g. from
+            `macd_grid`
+        adjust (bool): Same meaning as in `QuantLib.MACD`
+        processes (int): Spread grid chunks over this many processes
+
+    Returns:
+        dict: "params" as given, plus "macd" and "signal" arrays of shape
+        (time, len(grid)) whose columns match `QuantLib.MACD` per parameter set
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    grid = [tuple(params) for params in grid]
+    if processes:
+        macd, signal = _sweep_processes('macd', close, grid, 2, processes, adjust)
+    else:
+        macd, signal = macd_columns(close, grid, adjust)
+    return {"params": grid, "macd": macd, "signal": signal}
+
+
+def sweep_rsi(close, periods: list, processes: int = None) -> dict:
+    """ RSI for every period in `periods`
+
+    Args:
+        close: Close prices as a 1-D array or Series
+        periods (list): RSI time periods
+        processes (int): Spread grid chunks over this many processes
+
+    Returns:
+        dict: "params" as given and "rsi", an array of shape
+        (time, len(periods))
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    periods = list(periods)
+    if processes:
+        rsi, = _sweep_processes('rsi', close, periods, 1, processes, True)
+    else:
+        rsi = rsi_columns(close, periods)
+    return {"params": periods, "rsi": rsi}
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 
 from flask import current_app as app, Blueprint
-from flask import jsonify, json
+from flask import Response, json
 from flask.globals import request
-from pandas.core.tools.datetimes import to_datetime
 
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from requests.exceptions import HTTPError
@@ -89,9 +88,9 @@ def crypto_import_price_history():
     Import price history for a given product.
     @params = ?product=BTC-USD
     '''
-    from plotr_signal.modules.crypto import get_crypto_price_history
-    from plotr_signal.modules.druid import PlotrDruid, build_task_ingestion_spec
-    from pandas import DataFrame
+    from plotr_signal.modules.crypto import iter_crypto_price_history
+    from plotr_signal.modules.candle_store import CandleStore
+    from plotr_signal.modules.druid import PlotrDruid
     from datetime import date, datetime
 
     druid = PlotrDruid(druid_host=app.config['DRUID_HOST'])
@@ -100,14 +99,11 @@ def crypto_import_price_history():
     start = datetime.combine(date.fromisoformat(data['from_']), datetime.min.time())
     end = datetime.combine(date.fromisoformat(data['to']), datetime.max.time())
 
-    app.logger.info(f"Fetching price history for {request.args['product']}")
-    results = get_crypto_price_history(product=request.args['product'], start=start, end=end)
-    results['time'] = results['time'].dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
-
-    app.logger.info(f"Building task ingestion spec for {request.args['product']}")
-    spec = build_task_ingestion_spec(product=request.args['product'], data=results.to_dict(orient='records'))
-    app.logger.info("Submitting task spec to Druid")
-    response = druid.submit_ingestion_task(json.dumps(spec))
+    app.logger.info(f"Streaming price history for {request.args['product']} to Druid")
+    store = CandleStore(app.config['CANDLE_STORE_DIR'])
+    frames = iter_crypto_price_history(product=request.args['product'], start=start, end=end,
+                                       chunk_size=app.config['DRUID_INGESTION_CHUNK_ROWS'], store=store)
+    response = druid.submit_ingestion_stream(product=request.args['product'], frames=frames)
 
     return json.dumps(response)
 
@@ -185,42 +181,29 @@ def crypto_load_price_history(product):
     @body : { "from_": "yyyy-mm-ddThh:mm:ss.xxx", "to": "yyyy-mm-ddThh:mm:ss.xxx", "interval": "60|300|900|3600|21600|86400" }
     """
     # from plotr_signal.modules.influx import Influx
-    from pandas import DataFrame
-    from plotr_signal.modules.kafka import KafkaProducer, KafkaError
-    from datetime import date, datetime, timedelta
+    from plotr_signal.modules.crypto import iter_crypto_price_history
+    from plotr_signal.modules.candle_store import CandleStore
+    from datetime import date, datetime
 
-    public_client = cbpro.PublicClient()
-    producer = KafkaProducer(conf=app.config['KAFKA_CONF'])
     body = json.loads(request.get_data())
 
-    response = []
     current_dt = datetime.combine(date.fromisoformat(body['from_']), datetime.min.time())
     to_dt = datetime.combine(date.fromisoformat(body['to']), datetime.max.time())
-    delta = timedelta(minutes=300)
-    
-    while current_dt < to_dt:
-        end_datetime = current_dt + delta
-        response.extend(public_client.get_product_historic_rates(
-            product_id=product, start=current_dt, end=end_datetime, granularity=body['interval']))
-        current_dt = current_dt + delta
-
-    df = DataFrame(data=response, columns=['time', 'low', 'high', 'open', 'close', 'volume'])
-    df['time'] = to_datetime(df['time'], unit='s')
-    df.set_index(df['time'], drop=True, inplace=True)
-    for column in ['low', 'high', 'open', 'close', 'volume']:
-        df[column] = df[column].astype(float)
-
-    df['price'] = df[['low', 'high', 'open', 'close']].mean(axis=1)
-
-    # try:
-    #     for idx, row in df.iterrows():
-    #         app.logger.info(f"{idx}: {row.to_json()}")
-    #         producer.write_msg(
-    #             topic=product, msg=row.to_json(), timestamp=row['time'])
-    # except KafkaError as e:
-    #     app.logger.error("Generic error writing to Kafka: {}".format(e))
-
-    return jsonify(df.to_dict(orient='index'))
+
+    store = CandleStore(app.config['CANDLE_STORE_DIR'])
+    frames = iter_crypto_price_history(product=product, start=current_dt, end=to_dt, interval=int(body['interval']),
+                                       store=store)
+
+    def stream():
+        # One JSON object keyed by candle time, written out a frame at a time
+        opening = '{'
+        for frame in frames:
+            if len(frame):
+                yield opening + frame.to_json(orient='index', date_format='iso')[1:-1]
+                opening = ','
+        yield '{}' if opening == '{' else '}'
+
+    return Response(stream(), mimetype='application/json')
 
 
 @v1_supervise_product.route('/crypto/<product>/supervise', methods=['POST'])
@@ -143,29 +143,79 @@ def load_equity_price(symbol):
         "body": f"Successfully loaded {str(response.resultsCount)} price records for {symbol} from {body['from_']} to {body['to']} into  time series database"
     }
 
+def _resume(indicator_class, body:dict):
+    """
+    Indicator resumed from the request's `state`, or None when there is none.
+    Raises ValueError for a state that is not a valid `indicator_class` state.
+    """
+    if 'state' not in body.keys():
+        return None
+    try:
+        return indicator_class.from_dict(body['state'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"state is not a {indicator_class.__name__} state: {e!r}")
+
+
+def _new_bars(df, indicator):
+    """ Rows of `df` after the last bar `indicator` has already been fed """
+    from pandas import Timestamp
+
+    if indicator.last is None:
+        return df
+    return df[df.index > Timestamp(indicator.last)]
+
+
+def _bad_state(e:ValueError):
+    return {"status": 400, "body": str(e)}, 400
+
+
 @v1_equity_macd.route('/equities/<symbol>/macd', methods=['POST'])
 def load_equity_macd(symbol):
+    """
+    Computes MACD for the requested range and writes it to the time series database.
+    @body : { "from_": "...", "to": "...", "interval": "15m", "state": {...} }
+
+    Passing back the `state` returned by a previous call resumes the indicator,
+    so only bars after that call need to be queried. Bars up to the last one
+    the state has seen are skipped.
+    """
+    from pandas import DataFrame
     from plotr_signal.modules.influx import Influx
-    from plotr_signal.modules.quantlib import QuantLib
+    from plotr_signal.modules.quantlib import IncrementalMACD, QuantLib
 
     body = json.loads(request.get_data())
+    try:
+        indicator = _resume(IncrementalMACD, body)
+    except ValueError as e:
+        return _bad_state(e)
+
     influx_client = Influx()
     df = influx_client.get_equity_field_dataframe(symbol=symbol, from_=body['from_'], to=body['to'], interval=body['interval'])
-    macd = QuantLib.MACD(price_data=df)
-    influx_client.write_dataframe(dataframe=macd, bucket=symbol, measurement='macd')
+
+    if indicator is None:
+        macd = QuantLib.MACD(df)
+        indicator = IncrementalMACD.from_history(df['close'])
+    else:
+        df = _new_bars(df, indicator)
+        macd = DataFrame(indicator.update_many(df['close']), index=df.index, columns=['macd', 'signal'])
+    if len(df):
+        indicator.last = df.index[-1].isoformat()
+        influx_client.write_dataframe(dataframe=macd, bucket=symbol, measurement='macd')
 
     return {
         "status": 200,
         "body": {
             "macd": macd['macd'].to_json(),
-            "signal": macd['signal'].to_json()
+            "signal": macd['signal'].to_json(),
+            "state": indicator.to_dict()
         }
     }
 
 @v1_equity_rsi.route('/equities/<symbol>/rsi', methods=['POST'])
 def load_relative_strength_index(symbol):
+    from pandas import DataFrame
     from plotr_signal.modules.influx import Influx
-    from plotr_signal.modules.quantlib import QuantLib
+    from plotr_signal.modules.quantlib import IncrementalRSI, QuantLib
 
     body = json.loads(request.get_data())
     time_period = int
@@ -175,12 +225,24 @@ def load_relative_strength_index(symbol):
     else:
         time_period = 14
 
-    equity_df = Influx().get_equity_field_dataframe(symbol, from_=body['from_'], to=body['to'], interval='15m')
-    df = QuantLib.RSI(price_data=equity_df, time_period=time_period)
+    try:
+        indicator = _resume(IncrementalRSI, body)
+    except ValueError as e:
+        return _bad_state(e)
 
-    Influx().write_dataframe(dataframe=df, bucket=symbol, measurement='rsi')
+    equity_df = Influx().get_equity_field_dataframe(symbol, from_=body['from_'], to=body['to'], interval='15m')
+    if indicator is None:
+        df = QuantLib.RSI(equity_df, time_period=time_period)
+        indicator = IncrementalRSI.from_history(equity_df['close'], time_period=time_period)
+    else:
+        equity_df = _new_bars(equity_df, indicator)
+        df = DataFrame({'rsi_period': indicator.update_many(equity_df['close'])}, index=equity_df.index)
+    if len(equity_df):
+        indicator.last = equity_df.index[-1].isoformat()
+        Influx().write_dataframe(dataframe=df, bucket=symbol, measurement='rsi')
 
     return {
         "status": 200,
-        "body": f"Successfully wrote RSI values for {symbol}"
+        "body": f"Successfully wrote RSI values for {symbol}",
+        "state": indicator.to_dict()
     }
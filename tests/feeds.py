@@ -0,0 +1,159 @@
+""" Synthetic feeds
+
+This module is used to generate the market data the tests and the
+benchmarks replay: random-walk indicator panels, historic candles and
+level 3 order book feeds, plus offline clients to serve them.
+"""
+import time
+import threading
+
+
+def random_walk_panel(bars: int, symbols: int, seed: int = 0):
+    """ Synthetic (time x symbol) high/low/close panels with ragged starts """
+    import numpy as np
+    from pandas import DataFrame
+
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=(bars, symbols)), axis=0)
+    starts = rng.integers(0, bars // 10, size=symbols)
+    close[np.arange(bars)[:, None] < starts] = np.nan
+    spread = rng.random((bars, symbols))
+    columns = [f"SYM{i}" for i in range(symbols)]
+    return (DataFrame(close + spread, columns=columns), DataFrame(close - spread, columns=columns),
+            DataFrame(close, columns=columns))
+
+
+def full_feed(messages: int, orders: int = 5000, seed: int = 0) -> tuple:
+    """ Level 3 snapshot and `full` channel messages for one synthetic
+    product priced in cents with sizes in 1e-8 lots
+
+    Returns:
+        tuple: (snapshot as returned by `get_product_order_book(level=3)`,
+        list of open/done/match/change messages)
+    """
+    import random
+
+    rng = random.Random(seed)
+    price = lambda ticks: f"{ticks // 100}.{ticks % 100:02d}"
+    size = lambda lots: f"{lots // 10 ** 8}.{lots % 10 ** 8:08d}"
+    # side -> price -> resting order ids, oldest first
+    levels = {'buy': {}, 'sell': {}}
+    resting = {}
+    ids = []
+
+    def place(side, ticks, lots):
+        order_id = f"{len(resting) + len(ids)}-{rng.getrandbits(32):08x}"
+        levels[side].setdefault(ticks, []).append(order_id)
+        resting[order_id] = [side, ticks, lots]
+        ids.append(order_id)
+        return order_id
+
+    def forget(order_id):
+        side, ticks, _ = resting.pop(order_id)
+        levels[side][ticks].remove(order_id)
+        if not levels[side][ticks]:
+            del levels[side][ticks]
+
+    def quote(side):
+        return 10000 - rng.randint(1, 200) if side == 'buy' else 10000 + rng.randint(1, 200)
+
+    snapshot = {'sequence': 0, 'bids': [], 'asks': []}
+    for _ in range(orders):
+        side = rng.choice(('buy', 'sell'))
+        ticks, lots = quote(side), rng.randint(1, 10 ** 8)
+        order_id = place(side, ticks, lots)
+        snapshot['bids' if side == 'buy' else 'asks'].append([price(ticks), size(lots), order_id])
+
+    feed = []
+    while len(feed) < messages:
+        sequence = len(feed) + 1
+        action = rng.random()
+        if action < 0.4 or len(resting) < 100:
+            side = rng.choice(('buy', 'sell'))
+            ticks, lots = quote(side), rng.randint(1, 10 ** 8)
+            order_id = place(side, ticks, lots)
+            feed.append({'type': 'open', 'sequence': sequence, 'side': side, 'order_id': order_id,
+                         'price': price(ticks), 'remaining_size': size(lots)})
+            continue
+        if action < 0.55:
+            side = rng.choice(('buy', 'sell'))
+            ticks = (max if side == 'buy' else min)(levels[side])
+            order_id = levels[side][ticks][0]
+            lots = resting[order_id][2]
+            filled = rng.choice((lots, rng.randint(1, lots)))
+            feed.append({'type': 'match', 'sequence': sequence, 'side': side, 'maker_order_id': order_id,
+                         'taker_order_id': 'taker', 'price': price(ticks), 'size': size(filled)})
+            if filled < lots:
+                resting[order_id][2] -= filled
+                continue
+            forget(order_id)
+            feed.append({'type': 'done', 'sequence': sequence + 1, 'side': side, 'order_id': order_id,
+                         'reason': 'filled', 'price': price(ticks), 'remaining_size': size(0)})
+            continue
+        # Pick a random resting order, discarding ids that already left the book
+        index = rng.randrange(len(ids))
+        order_id = ids[index]
+        ids[index] = ids[-1]
+        ids.pop()
+        if order_id not in resting:
+            continue
+        side, ticks, lots = resting[order_id]
+        if action < 0.9:
+            forget(order_id)
+            feed.append({'type': 'done', 'sequence': sequence, 'side': side, 'order_id': order_id,
+                         'reason': 'canceled', 'price': price(ticks), 'remaining_size': size(lots)})
+        else:
+            ids.append(order_id)
+            lots = resting[order_id][2] = rng.randint(1, lots)
+            feed.append({'type': 'change', 'sequence': sequence, 'side': side, 'order_id': order_id,
+                         'price': price(ticks), 'new_size': size(lots)})
+    return snapshot, feed
+
+
+def candle(t: int) -> list:
+    """ Synthetic [time, low, high, open, close, volume] candle for `t`,
+    or None when no trade happened in that interval
+    """
+    if t % 660 == 300:
+        return None
+    level = 100 + (t // 60) % 97
+    return [t, level - 1.0, level + 1.0, float(level), level + 0.5, float(t % 13 + 1)]
+
+
+class CountingClient(object):
+    """ Offline stand-in for PublicClient that counts candle requests and
+    answers each one with synthetic candles, newest first like the exchange
+    """
+    calls = 0
+    _lock = threading.Lock()
+
+    def get_product_historic_rates(self, product_id, start=None, end=None, granularity=None):
+        with CountingClient._lock:
+            CountingClient.calls += 1
+        first = -(-int(start.timestamp()) // granularity) * granularity
+        last = int(end.timestamp()) // granularity * granularity
+        page = [candle(t) for t in range(last, first - 1, -granularity)]
+        return [row for row in page if row is not None]
+
+
+class SnapshotClient(object):
+    """ Offline stand-in for PublicClient that serves one level 3 snapshot """
+
+    def __init__(self, snapshot: dict):
+        self.snapshot = snapshot
+
+    def get_product_order_book(self, product_id, level=1):
+        return self.snapshot
+
+
+def replay(book, snapshot: dict, feed: list) -> float:
+    """ Seconds to apply `feed` to `book` after loading `snapshot` """
+    book._client = SnapshotClient(snapshot)
+    book._sequence = -1
+    # The first message only triggers the snapshot load
+    book.on_message({'type': 'heartbeat', 'sequence': 0})
+    book.wait_for_resync()
+    started = time.perf_counter()
+    for message in feed:
+        book.on_message(message)
+    return time.perf_counter() - started
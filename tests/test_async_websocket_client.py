@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+from mock import patch
+from pytest import raises
+
+from plotr_signal.modules.cbpro import websocket_client
+from plotr_signal.modules.cbpro.async_websocket_client import AsyncWebsocketClient, MessageQueue
+from tests.test_websocket_client import FakeSocket, ticker
+
+
+def drain(queue):
+    async def _drain():
+        items = []
+        while len(queue):
+            items.extend(await queue.get_batch())
+        return items
+    return _drain()
+
+
+def test_block_waits_for_room_and_keeps_order():
+    async def _run():
+        queue = MessageQueue(maxsize=4, policy='block')
+        received = []
+
+        async def consume():
+            while len(received) < 50:
+                received.extend(await queue.get_batch(limit=3))
+                await asyncio.sleep(0)
+
+        consumer = asyncio.ensure_future(consume())
+        for item in range(50):
+            await queue.put(item)
+            assert len(queue) <= 4
+        await consumer
+        return received
+
+    assert asyncio.run(_run()) == list(range(50))
+
+
+def test_unknown_policy_is_rejected():
+    with raises(ValueError):
+        MessageQueue(policy='drop_newest')
+
+
+def test_drop_oldest_keeps_markers():
+    async def _run():
+        queue = MessageQueue(maxsize=3, policy='drop_oldest')
+        await queue.put(1)
+        await queue.put('gap', keep=True)
+        for item in range(2, 6):
+            await queue.put(item)
+        return queue.dropped, await drain(queue)
+
+    dropped, items = asyncio.run(_run())
+    assert items == ['gap', 4, 5]
+    assert dropped == 3
+
+
+def test_coalesce_does_not_move_messages_past_a_marker():
+    async def _run():
+        queue = MessageQueue(maxsize=10, policy='coalesce')
+        await queue.put('a1', key='a')
+        await queue.put('b1', key='b')
+        await queue.put('gap', keep=True)
+        await queue.put('a2', key='a')
+        await queue.put('a3', key='a')
+        return await drain(queue)
+
+    assert asyncio.run(_run()) == ['a1', 'b1', 'gap', 'a3']
+
+
+def test_coalesce_keeps_arrival_order_across_products():
+    async def _run():
+        queue = MessageQueue(maxsize=10, policy='coalesce')
+        await queue.put('a1', key='a')
+        await queue.put('b1', key='b')
+        await queue.put('heartbeat')
+        await queue.put('a2', key='a')
+        return queue.coalesced, await drain(queue)
+
+    coalesced, items = asyncio.run(_run())
+    assert items == ['a2', 'b1', 'heartbeat']
+    assert coalesced == 1
+
+
+def test_equal_items_are_not_mistaken_for_markers():
+    async def _run():
+        queue = MessageQueue(maxsize=2, policy='drop_oldest')
+        await queue.put(7, keep=True)
+        # The same object again, this time without keep, is an ordinary message
+        await queue.put(7)
+        await asyncio.wait_for(queue.put(8), 1)
+        return queue.dropped, await drain(queue)
+
+    dropped, items = asyncio.run(_run())
+    assert items == [7, 8]
+    assert dropped == 1
+
+
+def test_gap_is_delivered_in_order_on_the_handle_thread():
+    class SlowClient(AsyncWebsocketClient):
+        def __init__(self, **kwargs):
+            super(SlowClient, self).__init__(should_print=False, channels=['ticker'], **kwargs)
+            self.events = []
+            self.threads = set()
+
+        def on_message(self, msg):
+            # Slow enough that the reconnect happens while messages are queued
+            time.sleep(0.05)
+            self.threads.add(threading.current_thread().name)
+            self.events.append(msg['sequence'])
+            if msg['sequence'] == 4:
+                self.stop = True
+
+        def on_gap(self, disconnected_at, reconnected_at):
+            self.threads.add(threading.current_thread().name)
+            self.events.append('gap')
+
+    client = SlowClient()
+    sockets = [FakeSocket([ticker(1), ticker(2)]), FakeSocket([ticker(3), ticker(4)])]
+    with patch.object(websocket_client, 'create_connection', side_effect=sockets), \
+            patch.object(websocket_client, 'RECONNECT_BACKOFF', 0.0):
+        client.start()
+        client.thread.join(5)
+
+    assert client.events == [1, 2, 'gap', 3, 4]
+    assert len(client.threads) == 1 and client.threads.pop().startswith('ws-handle')
+    assert client.handled == 4
@@ -0,0 +1,138 @@
+import time
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+from mock import patch
+from pytest import fixture, raises
+from requests.exceptions import HTTPError
+
+from plotr_signal.modules import backfill as backfill_module
+from plotr_signal.modules.backfill import CandleBackfill, TokenBucket
+from plotr_signal.modules.candle_store import to_epoch
+from tests.feeds import CountingClient, candle
+
+END = datetime(2021, 1, 1)
+
+
+class ShuffledClient(CountingClient):
+    """ Answers after a random delay so pages complete out of order """
+
+    def get_product_historic_rates(self, *args, **kwargs):
+        time.sleep(random.uniform(0, 0.005))
+        return super().get_product_historic_rates(*args, **kwargs)
+
+
+class ScriptedClient(object):
+    """ Answers candle requests from a list of canned responses """
+    responses = []
+
+    def get_product_historic_rates(self, product_id, start=None, end=None, granularity=None):
+        return ScriptedClient.responses.pop(0)
+
+
+def unlimited():
+    return TokenBucket(rate=1e9, capacity=1e9)
+
+
+@fixture
+def backfill():
+    CountingClient.calls = 0
+    return CandleBackfill(client_factory=ShuffledClient, limiter=unlimited())
+
+
+def expected_candles(start, end, granularity):
+    first = -(-to_epoch(start) // granularity) * granularity
+    rows = [candle(t) for t in range(first, to_epoch(end) + 1, granularity)]
+    return np.array([row for row in rows if row is not None])
+
+
+def test_fetch_returns_every_candle_in_the_range_once(backfill):
+    start = END - timedelta(days=2)
+    time_, values = backfill.fetch('BTC-USD', start, END, granularity=60).sorted_columns()
+
+    expected = expected_candles(start, END, 60)
+    np.testing.assert_array_equal(time_, expected[:, 0])
+    np.testing.assert_array_equal(values, expected[:, 1:])
+
+
+def test_iter_windows_yields_pages_in_window_order(backfill):
+    windows = backfill_module.split_windows(END - timedelta(days=1), END, timedelta(hours=1))
+    pages = list(backfill.iter_windows('BTC-USD', windows, granularity=60))
+
+    assert len(pages) == len(windows)
+    for (start, end), page in zip(windows, pages):
+        time_, _ = page.sorted_columns()
+        np.testing.assert_array_equal(time_, expected_candles(start, end, 60)[:, 0])
+
+
+def test_iter_windows_stays_bounded_ahead_of_the_consumer(backfill):
+    windows = backfill_module.split_windows(END - timedelta(days=10), END, timedelta(hours=1))
+    pages = backfill.iter_windows('BTC-USD', windows, granularity=60)
+
+    next(pages)
+    time.sleep(0.05)
+    assert CountingClient.calls <= backfill.max_workers * 2 + 1
+    pages.close()
+
+
+def test_fetch_window_retries_when_rate_limited():
+    ScriptedClient.responses = [{'message': 'Slow down'}]
+    backfill = CandleBackfill(client_factory=ScriptedClient, limiter=unlimited(), max_retries=3)
+    with raises(HTTPError):
+        backfill.fetch_window('BTC-USD', END - timedelta(hours=1), END, 60)
+
+    page = [candle(to_epoch(END))]
+    ScriptedClient.responses = [{'message': 'Public rate limit exceeded'}] * 2 + [page]
+    with patch.object(backfill_module.time, 'sleep') as sleep:
+        assert backfill.fetch_window('BTC-USD', END - timedelta(hours=1), END, 60) == page
+    assert sleep.call_count == 2
+
+    ScriptedClient.responses = [{'message': 'Public rate limit exceeded'}] * 3
+    with patch.object(backfill_module.time, 'sleep'), raises(HTTPError):
+        backfill.fetch_window('BTC-USD', END - timedelta(hours=1), END, 60)
+
+
+def test_token_bucket_paces_past_the_burst():
+    bucket = TokenBucket(rate=200, capacity=5)
+    started = time.monotonic()
+    for _ in range(25):
+        bucket.acquire()
+
+    # The burst is free, the other 20 tokens refill at 200 per second
+    assert time.monotonic() - started >= 0.09
+
+
+class PageSizeClient(CountingClient):
+    """ Records the size of every page served """
+    sizes = []
+
+    def get_product_historic_rates(self, *args, **kwargs):
+        page = super().get_product_historic_rates(*args, **kwargs)
+        PageSizeClient.sizes.append(len(page))
+        return page
+
+
+def test_split_windows_tile_the_range():
+    start = END - timedelta(hours=10, minutes=7)
+    windows = backfill_module.split_windows(start, END, timedelta(hours=1))
+
+    assert windows[0][0] == start and windows[-1][1] == END
+    assert all(previous[1] == window[0] for previous, window in zip(windows, windows[1:]))
+    assert windows[-1][1] - windows[-1][0] == timedelta(minutes=7)
+    assert backfill_module.split_windows(END, END, timedelta(hours=1)) == []
+
+
+def test_sized_windows_request_full_pages_only():
+    backfill = CandleBackfill(client_factory=PageSizeClient, limiter=unlimited())
+    start = END - timedelta(days=30)
+    for granularity in (60, 300, 900, 3600, 21600, 86400):
+        CountingClient.calls = 0
+        PageSizeClient.sizes = []
+        # A candle in every interval, so full windows return full pages
+        with patch('tests.feeds.candle', lambda t: [t, 1.0, 1.0, 1.0, 1.0, 1.0]):
+            backfill.fetch('BTC-USD', start, END, granularity=granularity)
+
+        intervals = int((END - start).total_seconds()) // granularity
+        assert CountingClient.calls == -(-intervals // (backfill_module.MAX_CANDLES - 1))
+        assert max(PageSizeClient.sizes) == min(backfill_module.MAX_CANDLES, intervals + 1)
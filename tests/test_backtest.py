@@ -0,0 +1,120 @@
+import numpy as np
+from pandas import DataFrame
+from pytest import approx, fixture, mark, raises
+
+from plotr_signal.modules.backtest import backtest, crossover, crossunder, positions, sweep_backtest
+from plotr_signal.modules.quantlib import QuantLib
+from plotr_signal.modules.sweep import macd_grid
+from tests.feeds import random_walk_panel
+
+
+@fixture(scope='module')
+def prices():
+    _, _, close = random_walk_panel(2000, 4, seed=15)
+    close = close.iloc[250:].to_numpy() + 200
+    open_ = np.vstack([close[:1], close[:-1]]) + np.random.default_rng(15).normal(scale=0.1, size=close.shape)
+    return open_, close
+
+
+def reference(open_, close, entries, exits, fee, initial):
+    """ One strategy bar by bar: decide at the close, fill at the next open """
+    equity, target, held = initial, False, False
+    curve, position = [], []
+    for t in range(len(close)):
+        previous, held = held, target
+        if previous and t:
+            gap = open_[t] / close[t - 1]
+            equity *= 1.0 if gap != gap else gap
+        if held != previous:
+            equity *= 1 - fee
+        if held:
+            intrabar = close[t] / open_[t]
+            equity *= 1.0 if intrabar != intrabar else intrabar
+        if exits[t]:
+            target = False
+        elif entries[t]:
+            target = True
+        curve.append(equity)
+        position.append(held)
+    return np.array(position), np.array(curve)
+
+
+def test_crossings():
+    a = np.array([1, 2, 2, 1, 3, 3])
+    np.testing.assert_array_equal(crossover(a, 2), [False, False, False, False, True, False])
+    np.testing.assert_array_equal(crossunder(a, 2), [False, False, False, True, False, False])
+
+
+def test_exit_wins_over_entry_on_the_same_bar():
+    entries = np.array([1, 0, 1, 0, 1, 0], dtype=bool)
+    exits = np.array([0, 0, 1, 0, 0, 1], dtype=bool)
+    np.testing.assert_array_equal(positions(entries, exits), [1, 1, 0, 0, 1, 0])
+
+
+@mark.parametrize('fee', [0.0, 0.005])
+def test_backtest_matches_bar_by_bar_loop(prices, fee):
+    open_, close = prices
+    open_, close = open_.copy(), close.copy()
+    close[[300, 900], [1, 2]] = np.nan
+    rng = np.random.default_rng(16)
+    entries, exits = rng.random(close.shape) < 0.05, rng.random(close.shape) < 0.05
+
+    result = backtest(open_, close, entries, exits, fee=fee, initial=100.0)
+
+    for column in range(close.shape[1]):
+        held, equity = reference(open_[:, column], close[:, column], entries[:, column], exits[:, column], fee, 100.0)
+        np.testing.assert_array_equal(result["position"][:, column], held)
+        np.testing.assert_allclose(result["equity"][:, column], equity, rtol=1e-9)
+        assert result["total_return"][column] == approx(equity[-1] / 100.0 - 1, rel=1e-9)
+        np.testing.assert_allclose(result["max_drawdown"][column],
+                                   (equity / np.maximum.accumulate(equity) - 1).min(), rtol=1e-9)
+        assert result["trades"][column] == (held[1:] & ~held[:-1]).sum()
+        assert result["exposure"][column] == held.mean()
+
+
+def test_one_dimensional_signals_squeeze(prices):
+    open_, close = prices
+    entries = crossover(close[:, 0], np.roll(close[:, 0], 5))
+    exits = crossunder(close[:, 0], np.roll(close[:, 0], 5))
+
+    single = backtest(open_[:, 0], close[:, 0], entries, exits, fee=0.001)
+    batch = backtest(open_[:, :1], close[:, :1], entries[:, None], exits[:, None], fee=0.001)
+
+    assert single["equity"].shape == (len(close),)
+    np.testing.assert_array_equal(single["equity"], batch["equity"][:, 0])
+    assert single["trades"] == batch["trades"][0]
+
+
+@mark.parametrize('processes', [None, 2])
+def test_macd_sweep_matches_single_backtests(prices, processes):
+    open_, close = prices[0][:, 0], prices[1][:, 0]
+    grid = macd_grid((3, 8, 12), (21, 26), (5, 9))
+
+    swept = sweep_backtest('macd_crossover', open_, close, grid, fee=0.002, processes=processes)
+
+    assert swept["params"] == grid
+    for i, params in enumerate(grid):
+        macd = QuantLib.MACD(DataFrame({"close": close}), *params)
+        single = backtest(open_, close, crossover(macd["macd"], macd["signal"]),
+                          crossunder(macd["macd"], macd["signal"]), fee=0.002)
+        for name in ("total_return", "max_drawdown", "exposure"):
+            np.testing.assert_allclose(swept[name][i], single[name], rtol=1e-9)
+        assert swept["trades"][i] == single["trades"]
+
+
+def test_rsi_sweep_matches_single_backtests(prices):
+    open_, close = prices[0][:, 1], prices[1][:, 1]
+    grid = [(7, 30, 70), (14, 30, 70), (14, 20, 80)]
+
+    swept = sweep_backtest('rsi_threshold', open_, close, grid)
+
+    for i, (period, lower, upper) in enumerate(grid):
+        rsi = QuantLib.RSI(DataFrame({"close": close}), period)["rsi_period"].to_numpy()
+        single = backtest(open_, close, crossover(rsi, lower), crossunder(rsi, upper))
+        np.testing.assert_allclose(swept["total_return"][i], single["total_return"], rtol=1e-9)
+        assert swept["trades"][i] == single["trades"]
+
+
+def test_unknown_strategy_is_rejected(prices):
+    with raises(ValueError):
+        sweep_backtest('breakout', prices[0][:, 0], prices[1][:, 0], [(20,)])
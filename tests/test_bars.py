@@ -0,0 +1,126 @@
+import json
+
+import numpy as np
+from pandas import DataFrame, to_datetime
+from pytest import fixture, raises
+
+from plotr_signal.modules.bars import INTERVALS, BarAggregator, BarPublisher
+
+START = 1609459200
+PRODUCTS = ["BTC-USD", "ETH-USD"]
+
+
+@fixture(scope='module')
+def trades():
+    """ Three hours of trades over two products, with a quiet spell long
+    enough to leave whole minutes and a 5 minute bar without trades
+    """
+    rng = np.random.default_rng(17)
+    times = START + 0.5 + np.cumsum(rng.exponential(1.5, size=7000))
+    times[times > START + 3600] += 720
+    return DataFrame({
+        "time": times,
+        "product": rng.integers(0, len(PRODUCTS), size=len(times)),
+        "price": 100 + np.cumsum(rng.normal(scale=0.05, size=len(times))),
+        "size": rng.random(len(times)),
+    })
+
+
+def aggregate(trades, order, grace=0.0):
+    aggregator = BarAggregator(INTERVALS, grace=grace)
+    finished = []
+    for i in order:
+        trade = trades.iloc[i]
+        finished.extend(aggregator.add_trade(PRODUCTS[int(trade["product"])], trade["time"], trade["price"],
+                                             trade["size"]))
+    finished.extend(aggregator.flush(float('inf')))
+    return aggregator, finished
+
+
+def assert_bars_match_resample(trades, finished):
+    bars = {}
+    for bar in finished:
+        key = (bar.product_id, bar.interval, bar.start)
+        assert key not in bars
+        bars[key] = bar
+
+    for index, product in enumerate(PRODUCTS):
+        product_trades = trades[trades["product"] == index]
+        frame = DataFrame({"price": product_trades["price"].to_numpy(), "size": product_trades["size"].to_numpy(),
+                           "notional": (product_trades["price"] * product_trades["size"]).to_numpy()},
+                          index=to_datetime(product_trades["time"].to_numpy(), unit='s'))
+        for interval in INTERVALS:
+            resampled = frame.resample(f"{interval}s")
+            expected = DataFrame({
+                "open": resampled["price"].first(), "high": resampled["price"].max(),
+                "low": resampled["price"].min(), "close": resampled["price"].last(),
+                "volume": resampled["size"].sum(), "notional": resampled["notional"].sum(),
+                "trades": resampled["price"].count(),
+            })
+            expected = expected[expected["trades"] > 0]
+            starts = expected.index.asi8 // 10 ** 9
+            actual = [bars.pop((product, interval, start)) for start in starts]
+
+            for name in ("open", "high", "low", "close", "trades"):
+                np.testing.assert_array_equal([getattr(bar, name) for bar in actual], expected[name])
+            for name in ("volume", "notional"):
+                np.testing.assert_allclose([getattr(bar, name) for bar in actual], expected[name], rtol=1e-9)
+            np.testing.assert_allclose([bar.vwap for bar in actual], expected["notional"] / expected["volume"],
+                                       rtol=1e-9)
+    assert not bars
+
+
+def test_rollups_match_pandas_resample(trades):
+    _, finished = aggregate(trades, range(len(trades)))
+    assert_bars_match_resample(trades, finished)
+
+
+def test_out_of_order_trades_within_grace(trades):
+    arrival = np.argsort(trades["time"].to_numpy() + np.random.default_rng(18).uniform(0, 0.9, len(trades)),
+                         kind='stable')
+    aggregator, finished = aggregate(trades, arrival, grace=1.0)
+
+    assert aggregator.late == 0
+    assert_bars_match_resample(trades, finished)
+
+
+def test_trades_for_finished_bars_are_dropped():
+    aggregator = BarAggregator((1, 60))
+    aggregator.add_trade("BTC-USD", START + 0.5, 100.0, 1.0)
+    finished = aggregator.add_trade("BTC-USD", START + 1.5, 101.0, 1.0)
+    assert [(bar.interval, bar.start) for bar in finished] == [(1, START)]
+
+    assert aggregator.add_trade("BTC-USD", START + 0.9, 99.0, 1.0) == []
+    assert aggregator.late == 1
+    minute = [bar for bar in aggregator.flush(START + 60) if bar.interval == 60]
+    assert (minute[0].low, minute[0].trades) == (100.0, 2)
+
+
+def test_intervals_must_divide_each_other():
+    with raises(ValueError):
+        BarAggregator((1, 60, 90))
+
+
+class RecordingProducer(object):
+    def __init__(self):
+        self.batches = []
+
+    def write_batch(self, topic, records, timestamps=None, keys=None):
+        self.batches.append((topic, [json.loads(record) for record in records], timestamps, keys))
+
+
+def test_publisher_batches_finished_bars(trades):
+    _, finished = aggregate(trades.iloc[:500], range(500))
+    producer = RecordingProducer()
+    publisher = BarPublisher(producer, batch_size=100, linger=3600)
+    for bar in finished:
+        publisher.add([bar])
+    publisher.flush()
+
+    assert [len(records) for _, records, _, _ in producer.batches[:-1]] == [100] * (len(producer.batches) - 1)
+    published = [record for _, records, _, _ in producer.batches for record in records]
+    assert published == [json.loads(json.dumps(bar.to_dict())) for bar in finished]
+    topic, records, timestamps, keys = producer.batches[0]
+    assert topic == 'bars'
+    assert timestamps[0] == records[0]["start"] * 1000
+    assert keys[0] == f"{records[0]['product_id']}:{records[0]['interval']}"
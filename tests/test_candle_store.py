@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from pandas.testing import assert_frame_equal
+from pytest import fixture
+
+from plotr_signal.modules.backfill import CandleBackfill, TokenBucket
+from plotr_signal.modules.candle_store import CandleStore, merge_intervals, to_epoch
+from plotr_signal.modules.candles import CandleBuffer
+from plotr_signal.modules.crypto import get_crypto_price_history
+from tests.feeds import CountingClient
+
+START = datetime(2021, 1, 1, 22)
+
+
+@fixture
+def store(tmp_path):
+    return CandleStore(str(tmp_path))
+
+
+@fixture
+def backfill():
+    CountingClient.calls = 0
+    return CandleBackfill(client_factory=CountingClient, limiter=TokenBucket(rate=1e9, capacity=1e9))
+
+
+def buffer_of(rows):
+    buffer = CandleBuffer()
+    buffer.append(rows)
+    return buffer
+
+
+def test_merge_intervals():
+    assert merge_intervals([[10, 20], [0, 5], [15, 30]]) == [[0, 5], [10, 30]]
+    assert merge_intervals([[0, 60], [120, 180]], step=60) == [[0, 180]]
+    assert merge_intervals([[0, 60], [180, 240]], step=60) == [[0, 60], [180, 240]]
+
+
+def test_gaps_skip_covered_ranges(store, backfill):
+    end = START + timedelta(hours=6)
+    assert store.gaps('BTC-USD', 60, START, end) == [(START, end + timedelta(minutes=1))]
+
+    middle = (START + timedelta(hours=2), START + timedelta(hours=3))
+    store.write('BTC-USD', 60, backfill.fetch('BTC-USD', *middle), *middle)
+
+    assert store.gaps('BTC-USD', 60, START, end) == [(START, middle[0]),
+                                                     (middle[1] + timedelta(minutes=1), end + timedelta(minutes=1))]
+    assert store.gaps('BTC-USD', 60, *middle) == []
+    assert store.gaps('BTC-USD', 300, *middle) == [(middle[0], middle[1] + timedelta(minutes=5))]
+
+
+def test_single_missing_candle_is_a_request_window(store):
+    end = START + timedelta(hours=1)
+    store.write('BTC-USD', 60, CandleBuffer(), START, START + timedelta(minutes=29))
+    store.write('BTC-USD', 60, CandleBuffer(), START + timedelta(minutes=31), end)
+
+    missing = START + timedelta(minutes=30)
+    assert store.gaps('BTC-USD', 60, START, end) == [(missing, missing + timedelta(minutes=1))]
+
+
+def test_coverage_stops_before_the_open_candle(store):
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    store.write('BTC-USD', 60, CandleBuffer(), now - timedelta(minutes=10), now + timedelta(minutes=10))
+
+    assert store.coverage('BTC-USD', 60) == [[to_epoch(now - timedelta(minutes=10)),
+                                              to_epoch(now - timedelta(minutes=1))]]
+
+
+def test_write_replaces_candles_and_reads_in_time_order(store):
+    first = to_epoch(START)
+    # Spans midnight, so the candles land in two day files
+    store.write('BTC-USD', 3600, buffer_of([[first + 3600 * i, i, i, i, i, i] for i in range(4, -1, -1)]),
+                START, START + timedelta(hours=4))
+    store.write('BTC-USD', 3600, buffer_of([[first + 3600 * 2, 9, 9, 9, 9, 9]]),
+                START + timedelta(hours=2), START + timedelta(hours=2))
+
+    time, values = store.read('BTC-USD', 3600, START, START + timedelta(hours=4)).columns()
+    np.testing.assert_array_equal(time, [first + 3600 * i for i in range(5)])
+    np.testing.assert_array_equal(values[:, 0], [0, 1, 9, 3, 4])
+    assert store.read('BTC-USD', 3600, START + timedelta(hours=1), START + timedelta(hours=3)).columns()[0].tolist() \
+        == time[1:4].tolist()
+
+
+def test_price_history_only_fetches_what_is_missing(store, backfill):
+    end = START + timedelta(days=2)
+    expected = get_crypto_price_history('BTC-USD', START, end, backfill=backfill)
+
+    CountingClient.calls = 0
+    head = get_crypto_price_history('BTC-USD', START, START + timedelta(days=1), backfill=backfill, store=store)
+    fetched = CountingClient.calls
+    assert_frame_equal(head, expected.loc[:START + timedelta(days=1)])
+
+    CountingClient.calls = 0
+    assert_frame_equal(get_crypto_price_history('BTC-USD', START, end, backfill=backfill, store=store), expected)
+    assert 0 < CountingClient.calls <= fetched + 1
+
+    CountingClient.calls = 0
+    assert_frame_equal(get_crypto_price_history('BTC-USD', START, end, backfill=backfill, store=store), expected)
+    assert CountingClient.calls == 0
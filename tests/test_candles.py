@@ -0,0 +1,56 @@
+import numpy as np
+from pandas import DataFrame, to_datetime
+from pandas.testing import assert_frame_equal
+
+from plotr_signal.modules.candles import CandleBuffer
+from tests.feeds import candle
+
+
+def legacy_frame(rows):
+    """ The price history frame as built from the list of rows before
+    CandleBuffer, with rows already sorted and unique on time
+    """
+    df = DataFrame(data=rows, columns=['time', 'low', 'high', 'open', 'close', 'volume'])
+    df['time'] = to_datetime(df['time'], unit='s')
+    df.set_index(df['time'], drop=True, inplace=True)
+    for column in ['low', 'high', 'open', 'close', 'volume']:
+        df[column] = df[column].astype(float)
+    df['price'] = df[['low', 'high', 'open', 'close']].mean(axis=1)
+    return df
+
+
+def pages(first, count, size):
+    """ Exchange pages of candles, newest first within each page """
+    rows = [row for row in (candle(first + 60 * i) for i in range(count)) if row is not None]
+    return rows, [rows[i:i + size][::-1] for i in range(0, len(rows), size)]
+
+
+def test_frame_matches_the_row_built_frame():
+    rows, paged = pages(1609459200, 5000, 200)
+    buffer = CandleBuffer(capacity=16)
+    for page in paged[::-1]:
+        buffer.append(page)
+
+    assert len(buffer) == len(rows)
+    assert_frame_equal(buffer.to_dataframe(), legacy_frame(rows))
+
+
+def test_later_pages_win_on_duplicate_times():
+    buffer = CandleBuffer()
+    buffer.append([[180, 1, 1, 1, 1, 1], [120, 1, 1, 1, 1, 1], [60, 1, 1, 1, 1, 1]])
+    buffer.append([[240, 2, 2, 2, 2, 2], [180, 2, 2, 2, 2, 2]])
+    buffer.append([[180, 3, 3, 3, 3, 3]])
+
+    time, values = buffer.sorted_columns()
+    np.testing.assert_array_equal(time, [60, 120, 180, 240])
+    np.testing.assert_array_equal(values[:, 0], [1, 1, 3, 2])
+
+
+def test_ordered_buffers_are_not_copied():
+    buffer = CandleBuffer(capacity=4)
+    buffer.append_columns(np.array([60, 120]), np.ones((2, 5)))
+    buffer.append([])
+
+    time, values = buffer.sorted_columns()
+    assert np.shares_memory(time, buffer.time) and np.shares_memory(values, buffer.values)
+    assert np.shares_memory(buffer.to_dataframe()['close'].to_numpy(), buffer.values)
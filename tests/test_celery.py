@@ -0,0 +1,58 @@
+import json
+from datetime import datetime, timedelta
+
+from mock import patch
+from pytest import fixture
+
+from plotr_signal.modules.candle_store import from_epoch, to_epoch
+
+START = datetime(2021, 1, 1)
+
+
+@fixture
+def tasks(app):
+    from plotr_signal.modules import celery
+    return celery
+
+
+def test_subtasks_get_the_callers_window_in_seconds(tasks, app):
+    with patch.object(tasks, 'chord') as chord:
+        summary = tasks.get_crypto_price_history('BTC-USD', START, START + timedelta(days=5), 60,
+                                                 timedelta(minutes=30))
+
+    header = chord.call_args[0][0]
+    signatures = list(header.tasks)
+    # 50 windows of 30 minutes per chunk
+    assert summary['chunks'] == len(signatures) == 5
+    for signature in signatures:
+        assert signature.args[-1] == 1800
+        json.dumps(list(signature.args))
+
+
+def test_window_seconds_are_accepted_directly(tasks):
+    with patch.object(tasks, 'chord') as chord:
+        tasks.get_crypto_price_history('BTC-USD', START.isoformat(), (START + timedelta(days=1)).isoformat(), 60, 900)
+
+    assert [signature.args[-1] for signature in chord.call_args[0][0].tasks] == [900, 900]
+
+
+def fetch(tasks, end, window=None):
+    with patch.object(tasks, 'CandleStore') as store, patch.object(tasks, 'CandleBackfill') as backfill:
+        store.return_value.gaps.side_effect = lambda product, interval, start, end: [(start, end)]
+        backfill.return_value.iter_windows.side_effect = lambda product, windows, granularity: [[]] * len(windows)
+        summary = tasks.fetch_price_window('BTC-USD', to_epoch(START), to_epoch(end), 60, window)
+    return summary, backfill.return_value.iter_windows.call_args[0][1]
+
+
+def test_fetch_splits_by_the_given_window(tasks):
+    summary, windows = fetch(tasks, START + timedelta(hours=2), window=1800)
+
+    assert summary['windows'] == 4
+    assert windows[0] == (from_epoch(to_epoch(START)), from_epoch(to_epoch(START)) + timedelta(minutes=30))
+
+
+def test_fetch_defaults_to_full_pages(tasks):
+    summary, _ = fetch(tasks, START + timedelta(hours=10))
+
+    # 200 candles of 60s per request
+    assert summary['windows'] == 4
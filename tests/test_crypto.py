@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timedelta
+
+from mock import patch
+from pandas import concat
+from pandas.testing import assert_frame_equal
+from pytest import fixture, mark
+
+from plotr_signal.modules.backfill import CandleBackfill, TokenBucket
+from plotr_signal.modules.candle_store import CandleStore
+from plotr_signal.modules.crypto import get_crypto_price_history, iter_crypto_price_history
+from tests.feeds import CountingClient
+
+START = datetime(2021, 1, 1, 0, 0, 30)
+END = START + timedelta(days=3)
+
+
+@fixture
+def backfill():
+    CountingClient.calls = 0
+    return CandleBackfill(client_factory=CountingClient, limiter=TokenBucket(rate=1e9, capacity=1e9))
+
+
+@fixture
+def expected(backfill):
+    return get_crypto_price_history('BTC-USD', START, END, backfill=backfill)
+
+
+@mark.parametrize('chunk_size', [None, 1000])
+def test_chunks_concatenate_to_the_full_frame(backfill, expected, chunk_size):
+    chunks = list(iter_crypto_price_history('BTC-USD', START, END, chunk_size=chunk_size, backfill=backfill))
+
+    assert len(chunks) > 1
+    if chunk_size:
+        assert all(len(chunk) >= chunk_size for chunk in chunks[:-1])
+    assert_frame_equal(concat(chunks), expected)
+
+
+def test_chunks_from_a_partly_filled_store(tmp_path, backfill, expected):
+    store = CandleStore(str(tmp_path))
+    middle = (START + timedelta(days=1), START + timedelta(days=1, hours=5))
+    get_crypto_price_history('BTC-USD', *middle, backfill=backfill, store=store)
+
+    chunks = list(iter_crypto_price_history('BTC-USD', START, END, chunk_size=500, backfill=backfill, store=store))
+    assert_frame_equal(concat(chunks), expected)
+
+    CountingClient.calls = 0
+    assert_frame_equal(concat(iter_crypto_price_history('BTC-USD', START, END, backfill=backfill, store=store)),
+                       expected)
+    assert CountingClient.calls == 0
+
+
+def test_history_route_streams_the_range(app, tmp_path, backfill):
+    app.config['CANDLE_STORE_DIR'] = str(tmp_path)
+    expected = get_crypto_price_history('BTC-USD', datetime(2021, 1, 1), datetime(2021, 1, 2, 23, 59, 59, 999999),
+                                        backfill=backfill)
+    with patch('plotr_signal.modules.crypto.CandleBackfill', return_value=backfill):
+        response = app.test_client().post('/v1/crypto/BTC-USD/price/history', data=json.dumps(
+            {"from_": "2021-01-01", "to": "2021-01-02", "interval": 60}))
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert json.loads(response.get_data()) == json.loads(expected.to_json(orient='index', date_format='iso'))
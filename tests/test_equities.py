@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+from mock import patch
+from pandas import DataFrame, date_range
+from pytest import fixture
+
+from plotr_signal.modules.quantlib import QuantLib
+from tests.feeds import random_walk_panel
+
+
+@fixture
+def client(app):
+    return app.test_client()
+
+
+@fixture(scope='module')
+def prices():
+    _, _, close = random_walk_panel(600, 1, seed=21)
+    close = close.iloc[:, 0].dropna().to_numpy() + 100
+    return DataFrame({"close": close}, index=date_range("2021-01-04", periods=len(close), freq="15min", tz="UTC"))
+
+
+@fixture
+def influx(prices):
+    with patch('plotr_signal.modules.influx.Influx') as influx:
+        influx.return_value.get_equity_field_dataframe.return_value = prices
+        yield influx.return_value
+
+
+def post(client, path, body):
+    response = client.post(path, data=json.dumps({"from_": "-30d", "to": "now()", "interval": "15m", **body}))
+    return response.status_code, response.get_json()
+
+
+def written(influx):
+    return influx.write_dataframe.call_args[1]['dataframe']
+
+
+def test_macd_resumes_after_the_last_bar_seen(client, influx, prices):
+    influx.get_equity_field_dataframe.return_value = prices.iloc[:400]
+    status, first = post(client, '/v1/equities/SPY/macd', {})
+    assert status == 200
+    state = first['body']['state']
+    assert state['type'] == 'IncrementalMACD'
+    assert state['last'] == prices.index[399].isoformat()
+    np.testing.assert_allclose(written(influx).to_numpy(), QuantLib.MACD(prices.iloc[:400]).to_numpy())
+
+    # The next range overlaps the first; the overlap is not fed again
+    influx.get_equity_field_dataframe.return_value = prices.iloc[300:]
+    status, second = post(client, '/v1/equities/SPY/macd', {"state": state})
+    assert status == 200
+    assert second['body']['state']['last'] == prices.index[-1].isoformat()
+    resumed = written(influx)
+    assert resumed.index[0] == prices.index[400]
+    np.testing.assert_allclose(resumed.to_numpy(), QuantLib.MACD(prices).iloc[400:].to_numpy(), rtol=1e-9)
+
+
+def test_rsi_resumes_after_the_last_bar_seen(client, influx, prices):
+    influx.get_equity_field_dataframe.return_value = prices.iloc[:400]
+    status, first = post(client, '/v1/equities/SPY/rsi', {"time_period": 10})
+    assert status == 200
+    np.testing.assert_allclose(written(influx).to_numpy(), QuantLib.RSI(prices.iloc[:400], 10).to_numpy())
+
+    influx.get_equity_field_dataframe.return_value = prices
+    status, second = post(client, '/v1/equities/SPY/rsi', {"state": first['state']})
+    assert status == 200
+    resumed = written(influx)
+    assert resumed.index[0] == prices.index[400]
+    np.testing.assert_allclose(resumed.to_numpy(), QuantLib.RSI(prices, 10)[['rsi_period']].iloc[400:].to_numpy(), rtol=1e-9)
+
+
+def test_wrong_or_malformed_state_is_rejected(client, influx):
+    _, rsi = post(client, '/v1/equities/SPY/rsi', {})
+    influx.reset_mock()
+
+    for path, state in (('/v1/equities/SPY/macd', rsi['state']),
+                        ('/v1/equities/SPY/macd', {"type": "IncrementalMACD"}),
+                        ('/v1/equities/SPY/rsi', {"type": "IncrementalRSI", "params": [], "state": {}}),
+                        ('/v1/equities/SPY/rsi', "IncrementalRSI")):
+        status, body = post(client, path, {"state": state})
+        assert status == 400
+        assert body['status'] == 400
+    influx.write_dataframe.assert_not_called()
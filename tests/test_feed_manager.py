@@ -0,0 +1,133 @@
+from mock import patch
+
+from plotr_signal.modules.cbpro.feed_manager import FeedManager, plan_moves
+
+
+class FakeProcess(object):
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+class FakeCommands(list):
+    def put(self, command):
+        self.append(command)
+
+
+class RecordingFeed(FeedManager):
+    """ FeedManager with fake shards, driven through `_dispatch` """
+
+    def __init__(self, products, connections):
+        super(RecordingFeed, self).__init__(products, connections=connections, rebalance_interval=None)
+        self.messages = []
+        self.gaps = []
+        self.spawned = []
+        self._processes = [FakeProcess() for _ in range(connections)]
+        self._commands = [FakeCommands() for _ in range(connections)]
+
+    def _spawn(self, shard, products):
+        self.spawned.append((shard, sorted(products)))
+        self._processes[shard] = FakeProcess()
+        self._commands[shard] = FakeCommands()
+
+    def on_message(self, msg):
+        self.messages.append((msg['product_id'], msg['sequence']))
+
+    def on_gap(self, products, disconnected_at, reconnected_at):
+        self.gaps.append(sorted(products))
+
+
+def msg(product, sequence):
+    return {'type': 'l2update', 'product_id': product, 'sequence': sequence}
+
+
+def test_plan_moves_leaves_balanced_shards_alone():
+    assignment = {'A': 0, 'B': 1}
+    assert plan_moves(assignment, {'A': 10.0, 'B': 11.0}, 2) == []
+
+
+def test_plan_moves_evens_out_the_busiest_shard():
+    assignment = {'A': 0, 'B': 0, 'C': 0, 'D': 1}
+    rates = {'A': 10.0, 'B': 5.0, 'C': 5.0, 'D': 1.0}
+    moves = plan_moves(assignment, rates, 2)
+    assert moves == [('A', 0, 1)]
+
+
+def test_plan_moves_only_targets_given_shards():
+    assignment = {'A': 0, 'B': 0, 'C': 1}
+    rates = {'A': 10.0, 'B': 10.0, 'C': 1.0}
+    assert plan_moves(assignment, rates, 3, targets=[0, 1]) == [('A', 0, 1)]
+    assert plan_moves(assignment, rates, 3, targets=[0]) == []
+
+
+def test_migration_replays_buffer_after_release_and_skips_overlap():
+    feed = RecordingFeed(['A', 'B'], 2)
+    feed._migrating['A'] = {"to": 1, "buffer": [], "started": False}
+
+    feed._dispatch(1, 'messages', [msg('A', 3), msg('A', 4)])
+    assert feed._commands[0] == [('release', ['A'])]
+    feed._dispatch(0, 'messages', [msg('A', 1), msg('A', 2), msg('A', 3)])
+    feed._dispatch(0, 'released', 'A')
+    feed._dispatch(1, 'messages', [msg('A', 5)])
+
+    assert feed.messages == [('A', 1), ('A', 2), ('A', 3), ('A', 4), ('A', 5)]
+    assert feed.duplicates == 1
+    assert feed.assignment['A'] == 1
+
+
+def test_dead_shard_is_respawned_with_its_products():
+    feed = RecordingFeed(['A', 'B', 'C', 'D'], 2)
+    feed._processes[1].alive = False
+
+    feed._check_shards()
+
+    assert feed.spawned == [(1, ['B', 'D'])]
+    assert feed.gaps == [['B', 'D']]
+    assert feed.respawns == 1
+    feed._check_shards()
+    assert feed.respawns == 1
+
+
+def test_respawn_settles_migrations_of_the_dead_shard():
+    feed = RecordingFeed(['A', 'B', 'C', 'D'], 2)
+    # A leaves the dead shard 0; B is moving onto it
+    feed._migrating['A'] = {"to": 1, "buffer": [msg('A', 7)], "started": True}
+    feed._migrating['B'] = {"to": 0, "buffer": [], "started": False}
+    feed._processes[0].alive = False
+
+    feed._check_shards()
+
+    assert feed.spawned == [(0, ['B', 'C'])]
+    assert feed.assignment['A'] == 1
+    assert 'A' not in feed._migrating and 'B' in feed._migrating
+    assert feed.messages == [('A', 7)]
+    # A late release marker from the old process is ignored
+    feed._dispatch(0, 'released', 'A')
+    assert feed.assignment['A'] == 1
+
+
+def test_rebalance_skips_dead_shards():
+    feed = RecordingFeed(['A', 'B', 'C'], 3)
+    feed.assignment = {'A': 0, 'B': 0, 'C': 1}
+    feed._counts.update({'A': 100, 'B': 100, 'C': 1})
+    feed._window = 0.0
+    feed._processes[2].alive = False
+
+    with patch('time.monotonic', return_value=10.0):
+        moves = feed.rebalance()
+
+    assert [target for _, _, target in moves] == [1]
+    assert feed._commands[1] == [('assign', [moves[0][0]])]
+
+
+def test_should_print_silences_connection_events(capsys):
+    feed = FeedManager(['A', 'B'], connections=2, should_print=False)
+    feed.on_open()
+    feed.on_gap(['A'], 0.0, 1.0)
+    feed.on_error(0, 'exited')
+    feed.on_close()
+
+    assert capsys.readouterr().out == ''
+    assert 'should_print' not in feed.kwargs
@@ -0,0 +1,65 @@
+import numpy as np
+from pandas import DataFrame
+from pytest import fixture, raises
+
+from plotr_signal.modules.indicator_graph import IndicatorGraph
+from plotr_signal.modules.quantlib import QuantLib
+from tests.feeds import random_walk_panel
+
+MACDS = [(short, long, 9) for short in (5, 12) for long in (21, 26)]
+RSIS = (7, 14)
+STOCHS = (5, 14)
+
+
+@fixture(scope='module')
+def frame():
+    high, low, close = random_walk_panel(5000, 1, seed=9)
+    return DataFrame({"high": high.iloc[:, 0], "low": low.iloc[:, 0], "close": close.iloc[:, 0]}).dropna() + 1000
+
+
+@fixture
+def graph():
+    graph = IndicatorGraph()
+    for params in MACDS:
+        graph.macd(*params)
+    for period in RSIS:
+        graph.rsi(period)
+    for period in STOCHS:
+        graph.stoch(period)
+    return graph
+
+
+def test_outputs_match_independent_quantlib_calls(frame, graph):
+    result = graph.evaluate(frame)
+
+    for short, long, signal in MACDS:
+        expected = QuantLib.MACD(frame, short, long, signal)
+        np.testing.assert_allclose(result[f"macd_{short}_{long}_{signal}"], expected["macd"], rtol=1e-12)
+        np.testing.assert_allclose(result[f"signal_{short}_{long}_{signal}"], expected["signal"], rtol=1e-12)
+    for period in RSIS:
+        np.testing.assert_allclose(result[f"rsi_{period}"], QuantLib.RSI(frame, period)["rsi_period"],
+                                   rtol=0, atol=1e-9)
+    for period in STOCHS:
+        np.testing.assert_allclose(result[f"stoch_{period}"], QuantLib.STOCH(frame, period), rtol=1e-12)
+
+
+def test_shared_nodes_are_evaluated_once(frame, graph):
+    graph.evaluate(frame)
+
+    # Per MACD the sub and signal nodes, plus ewm nodes for spans 5, 12, 21 and 26
+    macd = len(MACDS) * 2 + 4
+    # Per RSI the two wilder nodes and the rsi node, plus one shared diff, gain and loss
+    rsi = len(RSIS) * 3 + 3
+    # Per STOCH the rolling max, rolling min and stoch nodes
+    stoch = len(STOCHS) * 3
+    # close, high and low columns
+    assert graph.evaluations == macd + rsi + stoch + 3
+
+    graph.macd(12, 26, 9)
+    graph.evaluate(frame)
+    assert graph.evaluations == macd + rsi + stoch + 3
+
+
+def test_unknown_primitive_is_rejected(graph):
+    with raises(ValueError):
+        graph.node('median', graph.column())
@@ -0,0 +1,172 @@
+from decimal import Decimal
+
+import numpy as np
+from pytest import approx, fixture, mark
+
+from plotr_signal.modules.cbpro.order_book import OrderBook
+from plotr_signal.modules.cbpro.tick_order_book import TickOrderBook
+from tests.feeds import full_feed, replay
+
+BOOKS = [
+    lambda: OrderBook('SYN-USD'),
+    lambda: TickOrderBook('SYN-USD', quote_increment='0.01', base_increment='0.00000001'),
+]
+
+
+@fixture(scope='module')
+def feed():
+    return full_feed(20_000, orders=2000)
+
+
+def reference_book(snapshot, messages):
+    """ The book as a plain price -> [[id, size], ...] dict per side, oldest
+    order first, built the slow and obvious way
+    """
+    sides = {'buy': {}, 'sell': {}}
+    for side, key in (('buy', 'bids'), ('sell', 'asks')):
+        for price, size, order_id in snapshot[key]:
+            sides[side].setdefault(Decimal(price), []).append([order_id, Decimal(size)])
+
+    def find(order_id):
+        for side in sides.values():
+            for price, orders in side.items():
+                for order in orders:
+                    if order[0] == order_id:
+                        return side, price, orders, order
+        return None
+
+    for msg in messages:
+        if msg['type'] == 'open':
+            sides[msg['side']].setdefault(Decimal(msg['price']), []).append(
+                [msg['order_id'], Decimal(msg['remaining_size'])])
+            continue
+        order_id = msg.get('maker_order_id') or msg['order_id']
+        found = find(order_id)
+        if found is None:
+            continue
+        side, price, orders, order = found
+        if msg['type'] == 'match':
+            assert orders[0] is order
+            order[1] -= Decimal(msg['size'])
+            if not order[1]:
+                orders.remove(order)
+        elif msg['type'] == 'done':
+            orders.remove(order)
+        elif msg['type'] == 'change':
+            order[1] = Decimal(msg['new_size'])
+        if not orders:
+            del side[price]
+
+    return {
+        'asks': [[price, size, order_id] for price in sorted(sides['sell']) for order_id, size in sides['sell'][price]],
+        'bids': [[price, size, order_id] for price in sorted(sides['buy']) for order_id, size in sides['buy'][price]],
+    }
+
+
+def snapshot_of(book):
+    current = book.get_current_book()
+    return {'sequence': current['sequence'],
+            'bids': [[str(price), str(size), order_id] for price, size, order_id in current['bids']],
+            'asks': [[str(price), str(size), order_id] for price, size, order_id in current['asks']]}
+
+
+@mark.parametrize('make_book', BOOKS)
+def test_replay_matches_reference(feed, make_book):
+    snapshot, messages = feed
+    book = make_book()
+    replay(book, snapshot, messages)
+
+    current = book.get_current_book()
+    assert current['sequence'] == messages[-1]['sequence']
+    assert {'asks': current['asks'], 'bids': current['bids']} == reference_book(snapshot, messages)
+
+
+@mark.parametrize('make_book', BOOKS)
+def test_resync_after_gap_matches_full_replay(feed, make_book):
+    snapshot, messages = feed
+    reference = make_book()
+    replay(reference, snapshot, messages[:12_000])
+    later = snapshot_of(reference)
+    for message in messages[12_000:]:
+        reference.on_message(message)
+
+    book = make_book()
+    replay(book, snapshot, messages[:9_000])
+    # Dropping a message makes the book fetch `later`, and replay what follows it
+    book._client.snapshot = later
+    for message in messages[9_001:]:
+        book.on_message(message)
+    book.wait_for_resync()
+
+    assert book.resyncs == 2
+    assert book.stale > 0
+    assert book.get_current_book() == reference.get_current_book()
+
+
+@mark.parametrize('make_book', BOOKS)
+def test_depth_views_match_the_book(feed, make_book):
+    snapshot, messages = feed
+    book = make_book()
+    replay(book, snapshot, messages[:5_000])
+    # Warm the cumulative cache so the rest of the feed patches it
+    book.cumulative_depth('buy', 0.0)
+    book.cumulative_depth('sell', 1e9)
+    for message in messages[5_000:]:
+        book.on_message(message)
+
+    current = book.get_current_book()
+    levels = {'buy': {}, 'sell': {}}
+    for side, key in (('buy', 'bids'), ('sell', 'asks')):
+        for price, size, _ in current[key]:
+            level = levels[side].setdefault(float(price), [0.0, 0])
+            level[0] += float(size)
+            level[1] += 1
+    bids = sorted(levels['buy'].items(), reverse=True)
+    asks = sorted(levels['sell'].items())
+
+    depth_bids, depth_asks = book.depth(5)
+    np.testing.assert_allclose(depth_bids, [[price, size, count] for price, (size, count) in bids[:5]])
+    np.testing.assert_allclose(depth_asks, [[price, size, count] for price, (size, count) in asks[:5]])
+
+    top = book.top_of_book()
+    assert (top['bid'], top['bid_orders']) == (bids[0][0], bids[0][1][1])
+    assert (top['ask'], top['ask_orders']) == (asks[0][0], asks[0][1][1])
+
+    for side, side_levels in (('buy', bids), ('sell', asks)):
+        for index in (0, 3, len(side_levels) // 2, len(side_levels) - 1):
+            price = side_levels[index][0]
+            expected = sum(size for _, (size, _) in side_levels[:index + 1])
+            assert book.cumulative_depth(side, price) == approx(expected)
+
+    bid_size, ask_size = bids[0][1][0], asks[0][1][0]
+    assert book.microprice() == approx((bids[0][0] * ask_size + asks[0][0] * bid_size) / (bid_size + ask_size))
+    assert book.imbalance() == approx((bid_size - ask_size) / (bid_size + ask_size))
+    assert book.imbalance(5) == approx(
+        (depth_bids[:, 1].sum() - depth_asks[:, 1].sum()) / (depth_bids[:, 1].sum() + depth_asks[:, 1].sum()))
+
+
+@mark.parametrize('make_book', BOOKS)
+def test_microprice_with_empty_touch_is_the_mid(make_book):
+    book = make_book()
+    snapshot = {'sequence': 0, 'bids': [['100.00', '1.00000000', 'bid']], 'asks': [['101.00', '1.00000000', 'ask']]}
+    replay(book, snapshot, [
+        {'type': 'change', 'sequence': 1, 'side': 'buy', 'order_id': 'bid', 'price': '100.00',
+         'new_size': '0.00000000'},
+        {'type': 'change', 'sequence': 2, 'side': 'sell', 'order_id': 'ask', 'price': '101.00',
+         'new_size': '0.00000000'},
+    ])
+
+    assert book.microprice() == 100.5
+    assert book.imbalance() == 0.0
+
+
+@mark.parametrize('make_book', BOOKS)
+def test_empty_book_views(make_book):
+    book = make_book()
+    replay(book, {'sequence': 0, 'bids': [], 'asks': []}, [])
+
+    assert book.mid() is None and book.microprice() is None
+    bids, asks = book.depth(3)
+    assert bids.shape == (0, 3) and asks.shape == (0, 3)
+    assert book.cumulative_depth('buy', 100.0) == 0.0
+    assert book.top_of_book()['bid_size'] == 0.0
@@ -0,0 +1,141 @@
+from functools import partial
+from itertools import zip_longest
+
+import numpy as np
+from pytest import fixture, mark
+
+from plotr_signal.modules.cbpro.order_book import OrderBook
+from plotr_signal.modules.cbpro.order_book_manager import TOP_COLUMNS, OrderBookManager
+from plotr_signal.modules.cbpro.tick_order_book import TickOrderBook
+from tests.feeds import full_feed, replay
+
+PRODUCTS = ["AAA-USD", "BBB-USD", "CCC-USD"]
+
+
+class CountingLimiter(object):
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, tokens=1):
+        self.acquired += tokens
+
+
+class ProductSnapshotClient(object):
+    """ Offline stand-in for PublicClient serving a snapshot per product """
+
+    def __init__(self, snapshots: dict):
+        self.snapshots = snapshots
+        self.product_requests = 0
+
+    def get_product_order_book(self, product_id, level=1):
+        return self.snapshots[product_id]
+
+    def get_products(self):
+        self.product_requests += 1
+        return [{'id': product_id, 'quote_increment': '0.01', 'base_increment': '0.00000001'}
+                for product_id in self.snapshots]
+
+
+@fixture(scope='module')
+def feeds():
+    return {product_id: full_feed(3000, orders=300, seed=seed) for seed, product_id in enumerate(PRODUCTS)}
+
+
+def interleaved(feeds):
+    """ Every product's messages tagged with its id, round robin """
+    streams = [[{**message, 'product_id': product_id} for message in messages]
+               for product_id, (_, messages) in feeds.items()]
+    for batch in zip_longest(*streams):
+        yield from (message for message in batch if message is not None)
+
+
+def manager_for(feeds, book_class=OrderBook):
+    limiter = CountingLimiter()
+    manager = OrderBookManager(PRODUCTS, book_class=book_class, limiter=limiter)
+    manager._client.client = ProductSnapshotClient({product_id: snapshot for product_id, (snapshot, _) in feeds.items()})
+    for product_id in PRODUCTS:
+        manager.on_message({'type': 'heartbeat', 'product_id': product_id, 'sequence': 0})
+    for book in manager.books.values():
+        book.wait_for_resync()
+    return manager, limiter
+
+
+def reference(product_id, snapshot, messages):
+    book = OrderBook(product_id)
+    replay(book, snapshot, messages)
+    return book
+
+
+@mark.parametrize('book_class', [OrderBook,
+                                 partial(TickOrderBook, quote_increment='0.01', base_increment='0.00000001')])
+def test_messages_are_routed_to_their_product(feeds, book_class):
+    manager, limiter = manager_for(feeds, book_class)
+    for message in interleaved(feeds):
+        manager.on_message(message)
+
+    assert limiter.acquired == len(PRODUCTS)
+    for product_id, (snapshot, messages) in feeds.items():
+        assert manager.books[product_id].get_current_book() == \
+            reference(product_id, snapshot, messages).get_current_book()
+
+
+def test_gap_on_one_product_resyncs_only_that_book(feeds):
+    manager, limiter = manager_for(feeds)
+    dropped = feeds["BBB-USD"][1][1000]
+    messages = list(interleaved(feeds))
+    cut = messages.index({**dropped, 'product_id': "BBB-USD"})
+    for message in messages[:cut]:
+        manager.on_message(message)
+    # The resync snapshot is taken right after the dropped message
+    later = reference("BBB-USD", feeds["BBB-USD"][0], feeds["BBB-USD"][1][:1001]).get_current_book()
+    manager._client.client.snapshots["BBB-USD"] = {
+        'sequence': later['sequence'],
+        **{side: [[str(price), str(size), order_id] for price, size, order_id in later[side]]
+           for side in ('bids', 'asks')},
+    }
+    for message in messages[cut + 1:]:
+        manager.on_message(message)
+    manager.books["BBB-USD"].wait_for_resync()
+
+    assert [manager.books[product_id].resyncs for product_id in PRODUCTS] == [1, 2, 1]
+    assert limiter.acquired == len(PRODUCTS) + 1
+    assert manager.metrics()["resyncs"] == len(PRODUCTS) + 1
+    for product_id, (snapshot, messages) in feeds.items():
+        assert manager.books[product_id].get_current_book() == \
+            reference(product_id, snapshot, messages).get_current_book()
+
+
+def test_top_table_matches_each_books_touch(feeds):
+    manager, _ = manager_for(feeds)
+    messages = list(interleaved(feeds))
+    half = len(messages) // 2
+    for chunk in (messages[:half], messages[half:]):
+        for message in chunk:
+            manager.on_message(message)
+        table = manager.top_table()
+        for product_id in PRODUCTS:
+            top = manager.books[product_id].top_of_book()
+            np.testing.assert_allclose(table.loc[product_id, list(TOP_COLUMNS)].to_numpy(dtype=float),
+                                       [top[column] for column in TOP_COLUMNS])
+            assert table.loc[product_id, 'spread'] == top['ask'] - top['bid']
+
+
+def test_unknown_products_are_ignored(feeds):
+    manager, _ = manager_for(feeds)
+    before = manager.top_of_book().copy()
+    manager.on_message({'type': 'open', 'product_id': 'ZZZ-USD', 'sequence': 1})
+
+    np.testing.assert_array_equal(manager.top_of_book(), before)
+
+
+def test_books_share_one_client_and_one_product_lookup(feeds):
+    manager, limiter = manager_for(feeds, TickOrderBook)
+    for message in interleaved(feeds):
+        manager.on_message(message)
+
+    assert all(book._client is manager._client for book in manager.books.values())
+    assert manager._client.client.product_requests == 1
+    assert limiter.acquired == len(PRODUCTS) + 1
+    for product_id, (snapshot, messages) in feeds.items():
+        assert manager.books[product_id].get_current_book() == \
+            reference(product_id, snapshot, messages).get_current_book()
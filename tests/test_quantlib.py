@@ -0,0 +1,342 @@
+import json
+
+import numpy as np
+from pandas import DataFrame, date_range
+from pytest import fixture, mark
+
+from plotr_signal.modules import quantlib
+from plotr_signal.modules.quantlib import QuantLib
+from tests.feeds import random_walk_panel
+
+
+@fixture(scope='module')
+def frame():
+    high, low, close = random_walk_panel(5000, 1, seed=3)
+    frame = DataFrame({"high": high.iloc[:, 0], "low": low.iloc[:, 0], "close": close.iloc[:, 0]}).dropna() + 1000
+    frame["volume"] = np.random.default_rng(1).random(len(frame)) * 10
+    frame.index = date_range("2021-01-01", periods=len(frame), freq="min")
+    frame["time"] = np.asarray(frame.index, dtype="datetime64[s]").astype(np.int64)
+    return frame
+
+
+# name: (batch, streaming indicator, streaming input columns, batch output columns)
+STREAMING = {
+    "MACD": (lambda f: QuantLib.MACD(f), lambda: quantlib.IncrementalMACD(), ["close"], None),
+    "RSI": (lambda f: QuantLib.RSI(f), lambda: quantlib.IncrementalRSI(), ["close"], None),
+    "STOCH": (lambda f: QuantLib.STOCH(f), lambda: quantlib.IncrementalSTOCH(), ["high", "low", "close"], None),
+    "BBANDS": (lambda f: QuantLib.BBANDS(f), lambda: quantlib.IncrementalBBANDS(), ["close"], None),
+    "ATR": (lambda f: QuantLib.ATR(f), lambda: quantlib.IncrementalATR(), ["high", "low", "close"], None),
+    "ADX": (lambda f: QuantLib.ADX(f), lambda: quantlib.IncrementalADX(), ["high", "low", "close"], None),
+    "VWAP": (lambda f: QuantLib.VWAP(f, anchor=86400), lambda: quantlib.IncrementalVWAP(anchor=86400),
+             ["high", "low", "close", "volume", "time"], None),
+    "OBV": (lambda f: QuantLib.OBV(f), lambda: quantlib.IncrementalOBV(), ["close", "volume"], None),
+    "ICHIMOKU": (lambda f: QuantLib.ICHIMOKU(f), lambda: quantlib.IncrementalIchimoku(), ["high", "low"],
+                 ["tenkan", "kijun", "senkou_a", "senkou_b"]),
+}
+
+
+@mark.parametrize('name', STREAMING)
+def test_streaming_matches_batch(frame, name):
+    batch, make, inputs, outputs = STREAMING[name]
+    expected = batch(frame)
+    expected = (expected[outputs] if outputs else expected).to_numpy()
+
+    streamed = make().update_many(*[frame[column].to_numpy() for column in inputs])
+
+    np.testing.assert_allclose(streamed.reshape(expected.shape), expected, rtol=1e-9, atol=1e-9)
+
+
+@mark.parametrize('name', STREAMING)
+def test_streaming_resumes_from_json_state(frame, name):
+    _, make, inputs, _ = STREAMING[name]
+    columns = [frame[column].to_numpy() for column in inputs]
+    whole = make().update_many(*columns)
+
+    first = make()
+    head = first.update_many(*[column[:2500] for column in columns])
+    resumed = type(first).from_dict(json.loads(json.dumps(first.to_dict())))
+    tail = resumed.update_many(*[column[2500:] for column in columns])
+
+    np.testing.assert_array_equal(np.concatenate([head, tail]), whole)
+
+
+def test_bbands_skips_windows_with_missing_closes(frame):
+    close = frame["close"].to_numpy().copy()
+    close[[100, 101, 2000]] = np.nan
+    expected = QuantLib.BBANDS(DataFrame({"close": close})).to_numpy()
+
+    streamed = quantlib.IncrementalBBANDS().update_many(close)
+
+    np.testing.assert_allclose(streamed, expected, rtol=1e-9, atol=1e-9)
+    assert np.isnan(streamed[2000:2020]).all() and not np.isnan(streamed[2020]).any()
+
+
+def test_bbands_holds_precision_at_high_prices():
+    # Large level, tiny moves: a naive running sum of squares loses the variance
+    close = 50_000 + np.cumsum(np.random.default_rng(7).normal(scale=0.01, size=100_000))
+    expected = QuantLib.BBANDS(DataFrame({"close": close})).to_numpy()
+
+    streamed = quantlib.IncrementalBBANDS().update_many(close)
+
+    width = expected[:, 0] - expected[:, 2]
+    np.testing.assert_allclose(streamed[:, 0] - streamed[:, 2], width, rtol=1e-6)
+    np.testing.assert_allclose(streamed[:, 1], expected[:, 1], rtol=1e-12)
+
+
+@fixture(scope='module')
+def week():
+    """ A week of 1m random-walk bars for 300 symbols priced around 1000,
+    with ragged starts; more than one `COMPACT_CHUNK_COLUMNS` chunk wide
+    """
+    high, low, close = random_walk_panel(10_080, 300, seed=5)
+    return high + 1000, low + 1000, close + 1000
+
+
+# Bounds from the CompactPanel docstring: float32 rounding of inputs and outputs
+COMPACT_TOLERANCE = {"macd": 4e-5, "signal": 4e-5, "rsi": 1e-2, "stoch": 1e-2}
+
+
+def test_compact_panels_match_float64(week):
+    high, low, close = week
+    full = {**QuantLib.MACD_panel(close), "rsi": QuantLib.RSI_panel(close),
+            "stoch": QuantLib.STOCH_panel(high, low, close)}
+    compact_close = quantlib.CompactPanel.from_frame(close)
+    compact = {**QuantLib.MACD_panel(compact_close), "rsi": QuantLib.RSI_panel(compact_close),
+               "stoch": QuantLib.STOCH_panel(high, low, compact_close)}
+
+    for name, frame in full.items():
+        expected = frame.to_numpy()
+        values = compact[name].to_frame(full=True).to_numpy(dtype=float)
+        assert compact[name].values.dtype == np.float32
+        np.testing.assert_array_equal(np.isnan(values), np.isnan(expected))
+        np.testing.assert_allclose(values, expected, rtol=0, atol=COMPACT_TOLERANCE[name], equal_nan=True)
+
+
+def test_compact_flag_matches_compact_input(week):
+    _, _, close = week
+    by_flag = QuantLib.MACD_panel(close, compact=True)
+    by_input = QuantLib.MACD_panel(quantlib.CompactPanel.from_frame(close))
+
+    for name in ("macd", "signal"):
+        np.testing.assert_array_equal(by_flag[name].values, by_input[name].values)
+        assert by_flag[name].index is close.index
+    rsi = QuantLib.RSI_panel(close, compact=True)
+    assert rsi.offset == by_flag["macd"].offset + 14
+
+
+def reference_rsi(close, n):
+    """ Plain Python Wilder RSI of one column. Changes touching a missing
+    close are skipped, so the reading holds across the gap.
+    """
+    rsi = [float('nan')] * len(close)
+    count, avg_gain, avg_loss = 0, 0.0, 0.0
+    for t in range(1, len(close)):
+        change = close[t] - close[t - 1]
+        if change == change:
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            count += 1
+            if count <= n:
+                avg_gain += gain
+                avg_loss += loss
+                if count == n:
+                    avg_gain /= n
+                    avg_loss /= n
+            else:
+                avg_gain = (avg_gain * (n - 1) + gain) / n
+                avg_loss = (avg_loss * (n - 1) + loss) / n
+        if count >= n:
+            if avg_loss:
+                rsi[t] = 100 - 100 / (1 + avg_gain / avg_loss)
+            elif avg_gain:
+                rsi[t] = 100.0
+    return np.array(rsi)
+
+
+def test_rsi_matches_reference_loop_over_long_series():
+    _, _, close = random_walk_panel(200_000, 1, seed=11)
+    close = close.iloc[:, 0].dropna().to_numpy() + 1000
+
+    rsi = QuantLib.RSI(DataFrame({"close": close}))["rsi_period"].to_numpy()
+    expected = reference_rsi(close.tolist(), 14)
+
+    np.testing.assert_array_equal(np.isnan(rsi), np.isnan(expected))
+    np.testing.assert_allclose(rsi, expected, rtol=0, atol=1e-9, equal_nan=True)
+
+
+def test_rsi_panel_matches_reference_loop_with_ragged_starts_and_gaps():
+    _, _, close = random_walk_panel(3000, 8, seed=12)
+    values = close.to_numpy() + 1000
+    rng = np.random.default_rng(12)
+    # Interior gaps: single bars and a longer outage in a few symbols
+    values[rng.integers(500, 2900, size=40), rng.integers(0, 8, size=40)] = np.nan
+    values[1200:1260, 3] = np.nan
+    close = DataFrame(values, columns=close.columns)
+
+    for period in (2, 14):
+        rsi = QuantLib.RSI_panel(close, time_period=period).to_numpy()
+        for column in range(values.shape[1]):
+            expected = reference_rsi(values[:, column].tolist(), period)
+            np.testing.assert_array_equal(np.isnan(rsi[:, column]), np.isnan(expected))
+            np.testing.assert_allclose(rsi[:, column], expected, rtol=0, atol=1e-9, equal_nan=True)
+
+
+def test_rsi_panel_column_matches_per_symbol_rsi():
+    _, _, close = random_walk_panel(3000, 6, seed=13)
+    panel = QuantLib.RSI_panel(close)
+
+    for symbol in close.columns:
+        series = close[symbol].dropna()
+        expected = QuantLib.RSI(DataFrame({"close": series}))["rsi_period"]
+        np.testing.assert_allclose(panel[symbol].loc[series.index], expected, rtol=0, atol=1e-9)
+        assert panel[symbol].loc[:series.index[0]].iloc[:-1].isna().all()
+
+
+@mark.parametrize('decay', [0.0, 0.5, 13 / 14, 0.9999, 1.0])
+def test_recursive_filter_matches_loop(decay):
+    x = np.random.default_rng(14).normal(size=(20_000, 2))
+    expected = np.empty_like(x)
+    previous = np.array([3.0, -1.0])
+    for t in range(len(x)):
+        previous = decay * previous + x[t]
+        expected[t] = previous
+
+    filtered = quantlib.recursive_filter(x, decay, initial=[3.0, -1.0])
+
+    np.testing.assert_allclose(filtered, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_wilder_smoothing_matches_loop():
+    values = np.abs(np.random.default_rng(15).normal(size=50_000))
+    expected, average = [], 0.5
+    for value in values:
+        average = (average * 13 + value) / 14
+        expected.append(average)
+
+    np.testing.assert_allclose(quantlib.wilder_smoothing(values, 14, initial=0.5), expected, rtol=1e-12)
+
+
+@mark.parametrize('adjust', [True, False])
+def test_from_history_matches_bar_by_bar_state(frame, adjust):
+    close = frame["close"].to_numpy().copy()
+    close[[0, 1, 50, 51, 52, 900]] = np.nan
+    head, tail = close[:1000], frame["close"].to_numpy()[1000:1200]
+
+    for fed, seeded in ((quantlib.IncrementalEMA(12, adjust), quantlib.IncrementalEMA.from_history(head, 12, adjust)),
+                        (quantlib.IncrementalMACD(adjust=adjust), quantlib.IncrementalMACD.from_history(head, adjust=adjust))):
+        fed.update_many(head)
+        np.testing.assert_allclose(seeded.update_many(tail), fed.update_many(tail), rtol=1e-12, atol=1e-10)
+
+
+@mark.parametrize('bars', [0, 1, 10, 14, 15, 16, 1000])
+def test_rsi_from_history_matches_bar_by_bar_state(frame, bars):
+    close = frame["close"].to_numpy()
+    fed = quantlib.IncrementalRSI()
+    fed.update_many(close[:bars])
+    seeded = quantlib.IncrementalRSI.from_history(close[:bars])
+
+    np.testing.assert_allclose(seeded.update_many(close[bars:bars + 100]), fed.update_many(close[bars:bars + 100]),
+                               rtol=1e-12)
+
+
+def test_from_dict_rejects_other_states():
+    state = quantlib.IncrementalRSI().to_dict()
+    for data in (state, {"type": "IncrementalMACD"}, None):
+        try:
+            quantlib.IncrementalMACD.from_dict(data)
+        except (KeyError, TypeError, ValueError):
+            continue
+        raise AssertionError(f"accepted {data!r}")
+
+
+@fixture(scope='module')
+def panel():
+    high, low, close = random_walk_panel(3000, 6, seed=16)
+    # Interior gaps on top of the ragged starts
+    close.iloc[[700, 701, 1500], [1, 4]] = np.nan
+    return high, low, close
+
+
+@mark.parametrize('adjust', [True, False])
+def test_macd_panel_columns_match_per_symbol_macd(panel, adjust):
+    _, _, close = panel
+    macd = QuantLib.MACD_panel(close, adjust=adjust)
+
+    for symbol in close.columns:
+        expected = QuantLib.MACD(DataFrame({"close": close[symbol]}), adjust=adjust)
+        for name in ("macd", "signal"):
+            np.testing.assert_allclose(macd[name][symbol], expected[name], rtol=1e-9, atol=1e-9)
+
+
+def test_stoch_panel_columns_match_per_symbol_stoch(panel):
+    high, low, close = panel
+    stoch = QuantLib.STOCH_panel(high, low, close)
+
+    for symbol in close.columns:
+        frame = DataFrame({"high": high[symbol], "low": low[symbol], "close": close[symbol]})
+        np.testing.assert_allclose(stoch[symbol], QuantLib.STOCH(frame), rtol=1e-12)
+
+
+def test_to_long_stacks_panels_by_time_and_symbol(panel):
+    _, _, close = panel
+    panels = {"rsi": QuantLib.RSI_panel(close), **QuantLib.MACD_panel(close)}
+    long = QuantLib.to_long(panels)
+
+    assert list(long.columns) == ["rsi", "macd", "signal"]
+    assert len(long) == close.size
+    for name, frame in panels.items():
+        np.testing.assert_array_equal(long[name].unstack("symbol")[close.columns].to_numpy(), frame.to_numpy())
+
+
+def test_rolling_extrema_matches_pandas_rolling():
+    values = np.random.default_rng(17).normal(size=(2000, 3))
+    values[[10, 500, 501], [0, 1, 1]] = np.nan
+    windows = [1, 2, 3, 7, 14, 16, 55, 100, 1999, 2000, 2001]
+
+    for reduce, rolling in ((np.maximum, 'max'), (np.minimum, 'min')):
+        result = quantlib.rolling_extrema(values, windows, reduce)
+        flat = quantlib.rolling_extrema(values[:, 2], windows, reduce)
+        for window in windows:
+            expected = getattr(DataFrame(values).rolling(window), rolling)().to_numpy()
+            np.testing.assert_array_equal(result[window], expected)
+            np.testing.assert_array_equal(flat[window], expected[:, 2])
+
+
+def test_channels_match_pandas_rolling(frame):
+    channels = QuantLib.CHANNELS(frame, (14, 20, 55))
+
+    for window in (14, 20, 55):
+        high = frame["high"].rolling(window).max()
+        low = frame["low"].rolling(window).min()
+        stoch = (frame["close"] - low) / (high - low) * 100
+        np.testing.assert_array_equal(channels[f"donchian_upper_{window}"], high)
+        np.testing.assert_array_equal(channels[f"donchian_lower_{window}"], low)
+        np.testing.assert_allclose(channels[f"stoch_{window}"], stoch, rtol=1e-12)
+        np.testing.assert_allclose(channels[f"willr_{window}"], (high - frame["close"]) / (high - low) * -100,
+                                   rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(QuantLib.DONCHIAN(frame, 20)["upper"], channels["donchian_upper_20"])
+    np.testing.assert_allclose(QuantLib.WILLR(frame, 14), channels["willr_14"], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(QuantLib.STOCH(frame, 14), channels["stoch_14"], rtol=1e-12)
+
+
+def test_incremental_extrema_match_rolling_extrema(frame):
+    windows = [3, 14, 55]
+    high, low = frame["high"].to_numpy()[:3000], frame["low"].to_numpy()[:3000]
+    extrema = quantlib.IncrementalExtrema(windows)
+    highs, lows = zip(*(extrema.update(h, l) for h, l in zip(high, low)))
+
+    expected_highs = quantlib.rolling_extrema(high, windows, np.maximum)
+    expected_lows = quantlib.rolling_extrema(low, windows, np.minimum)
+    for i, window in enumerate(windows):
+        np.testing.assert_array_equal(np.array(highs)[:, i], expected_highs[window])
+        np.testing.assert_array_equal(np.array(lows)[:, i], expected_lows[window])
+
+
+def test_vwap_sessions_follow_utc_for_naive_and_aware_times(frame):
+    rows = frame.iloc[:3000]
+    columns = [rows[column].to_numpy() for column in ("high", "low", "close", "volume")]
+    expected = quantlib.IncrementalVWAP(anchor=86400).update_many(*columns, rows["time"].to_numpy())
+
+    for index in (rows.index, rows.index.tz_localize("UTC"), rows.index.tz_localize("UTC").tz_convert("US/Eastern")):
+        vwap = quantlib.IncrementalVWAP(anchor=86400)
+        streamed = [vwap.update(*bar, time) for *bar, time in zip(*columns, index.to_pydatetime())]
+        np.testing.assert_array_equal(streamed, expected)
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from pandas import DataFrame, to_datetime
+from pytest import fixture
+
+from plotr_signal.modules.quantlib import QuantLib
+from plotr_signal.modules.signals import SignalEngine
+
+START = 1609459200
+
+
+@fixture(scope='module')
+def trades():
+    """ Two hours of trades for one product, a few per second """
+    rng = np.random.default_rng(16)
+    times = START + np.cumsum(rng.exponential(0.4, size=18_000))
+    prices = 100 + np.cumsum(rng.normal(scale=0.05, size=len(times)))
+    sizes = rng.random(len(times))
+    return times, prices, sizes
+
+
+def match(trade_id, time, price, size, channel='match'):
+    stamp = datetime.fromtimestamp(time, timezone.utc).isoformat()
+    if channel == 'ticker':
+        return {"type": "ticker", "product_id": "BTC-USD", "trade_id": trade_id, "time": stamp,
+                "price": str(price), "last_size": str(size)}
+    return {"type": "match", "product_id": "BTC-USD", "trade_id": trade_id, "time": stamp,
+            "price": str(price), "size": str(size)}
+
+
+def without_latency(event):
+    return {name: value for name, value in event.items() if name != "latency"}
+
+
+def expected_events(times, prices, interval):
+    """ Rule events from batch indicators over closes resampled with pandas """
+    trades = DataFrame({"price": prices}, index=to_datetime(times, unit='s'))
+    close = trades["price"].resample(f"{interval}s").last().dropna()
+    # The bar in progress never finishes
+    close = close.iloc[:-1]
+    frame = DataFrame({"close": close.to_numpy()})
+    macd = QuantLib.MACD(frame)
+    spread = (macd["macd"] - macd["signal"]).to_numpy()
+    rsi = QuantLib.RSI(frame)["rsi_period"].to_numpy()
+    starts = close.index.asi8 // 10 ** 9
+
+    events = []
+    for t in range(1, len(close)):
+        if spread[t - 1] <= 0 < spread[t]:
+            events.append((starts[t], 'macd', 'above'))
+        elif spread[t - 1] >= 0 > spread[t]:
+            events.append((starts[t], 'macd', 'below'))
+        if rsi[t - 1] <= 70 < rsi[t]:
+            events.append((starts[t], 'rsi', 'above'))
+        elif rsi[t - 1] >= 30 > rsi[t]:
+            events.append((starts[t], 'rsi', 'below'))
+    return events
+
+
+def test_events_match_batch_indicators_on_resampled_bars(trades):
+    times, prices, sizes = trades
+    engine = SignalEngine(products=["BTC-USD"], interval=60)
+    events = []
+    engine.on_signal = events.append
+    for trade_id, (time, price, size) in enumerate(zip(times, prices, sizes)):
+        engine.on_message(match(trade_id, time, price, size))
+
+    expected = expected_events(times, prices, 60)
+    assert len(expected) > 10
+    assert [(event["bar_start"], event["rule"], event["direction"]) for event in events] == expected
+    assert engine.latency_stats()["count"] == len(events)
+
+
+def test_trades_seen_on_both_channels_count_once(trades):
+    times, prices, sizes = trades
+    engines = [SignalEngine(products=["BTC-USD"], interval=60) for _ in range(2)]
+    events = [[], []]
+    for engine, collected in zip(engines, events):
+        engine.on_signal = collected.append
+
+    for trade_id, (time, price, size) in enumerate(zip(times[:6000], prices, sizes)):
+        engines[0].on_message(match(trade_id, time, price, size))
+        engines[1].on_message(match(trade_id, time, price, size))
+        engines[1].on_message(match(trade_id, time, price, size, channel='ticker'))
+
+    assert events[0]
+    assert [without_latency(event) for event in events[0]] == [without_latency(event) for event in events[1]]
+    bars = [engine.aggregator.bars["BTC-USD"] for engine in engines]
+    assert [bar.to_dict() for bar in bars[0].values()] == [bar.to_dict() for bar in bars[1].values()]
@@ -0,0 +1,42 @@
+import numpy as np
+from pandas import DataFrame
+from pytest import fixture, mark
+
+from plotr_signal.modules.quantlib import QuantLib
+from plotr_signal.modules.sweep import macd_grid, sweep_macd, sweep_rsi
+from tests.feeds import random_walk_panel
+
+
+@fixture(scope='module')
+def close():
+    _, _, close = random_walk_panel(3000, 1, seed=10)
+    return close.iloc[:, 0].dropna().to_numpy() + 1000
+
+
+def test_macd_grid_keeps_short_below_long():
+    assert macd_grid((5, 12), (12, 26), (9,)) == [(5, 12, 9), (5, 26, 9), (12, 26, 9)]
+
+
+@mark.parametrize('processes', [None, 2])
+@mark.parametrize('adjust', [True, False])
+def test_macd_sweep_columns_match_quantlib(close, adjust, processes):
+    grid = macd_grid((3, 8, 12), (12, 26, 40), (5, 9))
+    swept = sweep_macd(close, grid, adjust=adjust, processes=processes)
+
+    assert swept["params"] == grid
+    for i, params in enumerate(grid):
+        expected = QuantLib.MACD(DataFrame({"close": close}), *params, adjust=adjust)
+        np.testing.assert_allclose(swept["macd"][:, i], expected["macd"], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(swept["signal"][:, i], expected["signal"], rtol=1e-9, atol=1e-9)
+
+
+@mark.parametrize('processes', [None, 2])
+def test_rsi_sweep_columns_match_quantlib(close, processes):
+    periods = [2, 5, 14, 30]
+    swept = sweep_rsi(close, periods, processes=processes)
+
+    assert swept["rsi"].shape == (len(close), len(periods))
+    for i, period in enumerate(periods):
+        expected = QuantLib.RSI(DataFrame({"close": close}), period)["rsi_period"].to_numpy()
+        np.testing.assert_array_equal(np.isnan(swept["rsi"][:, i]), np.isnan(expected))
+        np.testing.assert_allclose(swept["rsi"][:, i], expected, rtol=0, atol=1e-9, equal_nan=True)
@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from pytest import fixture, raises
+
+from plotr_signal.modules.cbpro.order_book import OrderBook
+from plotr_signal.modules.cbpro.tick_order_book import TickOrderBook, parse_increment, to_units
+from tests.feeds import full_feed, replay
+
+
+@fixture(scope='module')
+def feed():
+    return full_feed(20_000, orders=2000)
+
+
+def tick_book():
+    return TickOrderBook('SYN-USD', quote_increment='0.01', base_increment='0.00000001')
+
+
+def test_parse_increment():
+    assert parse_increment('0.01') == (2, 1)
+    assert parse_increment('0.05000000') == (2, 5)
+    assert parse_increment('1') == (0, 1)
+
+
+def test_to_units():
+    assert to_units('123.45', 2) == 12345
+    assert to_units('123.4', 2) == 12340
+    assert to_units('123.4500', 2) == 12345
+    with raises(ValueError):
+        to_units('123.455', 2)
+
+
+def test_replay_matches_order_book(feed):
+    snapshot, messages = feed
+    books = [OrderBook('SYN-USD'), tick_book()]
+    for book in books:
+        replay(book, snapshot, messages)
+
+    legacy, ticks = (book.get_current_book() for book in books)
+    assert legacy == ticks
+    assert legacy['sequence'] == messages[-1]['sequence']
+    assert books[0].get_bid() == books[1].get_bid()
+    assert books[0].get_ask() == books[1].get_ask()
+    best = [(order_id, price, size) for price, size, order_id in ticks['bids'] if price == books[0].get_bid()]
+    for book in books:
+        assert [(order['id'], order['price'], order['size']) for order in book.get_bids(book.get_bid())] == best
+
+
+def test_step_increments_round_trip():
+    book = TickOrderBook('SYN-USD', quote_increment='0.05', base_increment='0.001')
+    assert book.ticks('10.15') == 203
+    assert book.price(203) == Decimal('10.15')
+    assert book.size(book.lots('2.5')) == Decimal('2.500')
+
+
+def test_match_takes_the_oldest_order_at_the_level():
+    book = tick_book()
+    snapshot = {'sequence': 0, 'asks': [], 'bids': [['100.00', '1.00000000', 'first'],
+                                                     ['100.00', '2.00000000', 'second']]}
+    replay(book, snapshot, [])
+
+    with raises(AssertionError):
+        book.match({'maker_order_id': 'second', 'size': '1.00000000'})
+    book.match({'maker_order_id': 'first', 'size': '0.25000000'})
+    assert book.get_current_book()['bids'] == [[Decimal('100.00'), Decimal('0.75000000'), 'first'],
+                                               [Decimal('100.00'), Decimal('2.00000000'), 'second']]
+
+
+def test_match_larger_than_the_maker_is_rejected():
+    book = tick_book()
+    replay(book, {'sequence': 0, 'asks': [], 'bids': [['100.00', '1.00000000', 'first']]}, [])
+
+    with raises(AssertionError):
+        book.match({'maker_order_id': 'first', 'size': '1.50000000'})
+    book.match({'maker_order_id': 'first', 'size': '1.00000000'})
+    assert book.get_current_book()['bids'] == []
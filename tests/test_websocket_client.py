@@ -0,0 +1,115 @@
+import json
+from threading import Event
+
+from mock import patch
+from websocket import WebSocketConnectionClosedException
+
+from plotr_signal.modules.cbpro import websocket_client
+from plotr_signal.modules.cbpro.websocket_client import WebsocketClient
+
+
+class FakeSocket(object):
+    """ Socket that hands out queued frames, then reports a closed connection """
+
+    def __init__(self, frames):
+        self.frames = [json.dumps(frame) for frame in frames]
+        self.connected = True
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def ping(self, payload):
+        pass
+
+    def recv(self):
+        if not self.frames:
+            self.connected = False
+            raise WebSocketConnectionClosedException("closed")
+        return self.frames.pop(0)
+
+    def shutdown(self):
+        self.connected = False
+
+    def close(self):
+        self.connected = False
+
+
+class RecordingClient(WebsocketClient):
+    def __init__(self, fail_with=None, **kwargs):
+        super(RecordingClient, self).__init__(should_print=False, channels=['ticker'], **kwargs)
+        self.fail_with = fail_with
+        self.messages = []
+        self.errors = []
+        self.closed = Event()
+
+    def on_message(self, msg):
+        self.messages.append(msg)
+        if self.fail_with is not None and len(self.messages) == 1:
+            raise self.fail_with
+
+    def on_error(self, e, data=None):
+        self.errors.append((e, data))
+        super(RecordingClient, self).on_error(e, data)
+
+    def on_close(self):
+        self.closed.set()
+
+
+def ticker(sequence):
+    return {'type': 'ticker', 'product_id': 'BTC-USD', 'sequence': sequence}
+
+
+def run(client, sockets):
+    with patch.object(websocket_client, 'create_connection', side_effect=sockets) as connect:
+        client.start()
+        assert client.closed.wait(5)
+        client.thread.join(5)
+    return connect
+
+
+def test_handler_error_is_reported_and_closes():
+    client = RecordingClient(fail_with=KeyError('price'), reconnect=True)
+    run(client, [FakeSocket([ticker(1), ticker(2)])])
+
+    assert client.stop
+    assert isinstance(client.errors[0][0], KeyError)
+    assert client.errors[0][1] == ticker(1)
+    assert not client.thread.is_alive()
+    assert not client.metrics()['connected']
+
+
+def test_handler_oserror_is_not_a_lost_connection():
+    class KeepGoing(RecordingClient):
+        def on_error(self, e, data=None):
+            self.errors.append((e, data))
+            if not isinstance(e, OSError):
+                super(KeepGoing, self).on_error(e, data)
+
+    client = KeepGoing(fail_with=OSError('disk full'), reconnect=False)
+    connect = run(client, [FakeSocket([ticker(1), ticker(2)])])
+
+    assert connect.call_count == 1
+    assert client.reconnects == 0
+    assert [msg['sequence'] for msg in client.messages] == [1, 2]
+    assert isinstance(client.errors[0][0], OSError)
+    # The socket closing after the second frame is the only connection failure
+    assert isinstance(client.errors[-1][0], WebSocketConnectionClosedException)
+
+
+def test_recv_failure_reconnects_and_reports_gap():
+    gaps = []
+
+    class GapClient(RecordingClient):
+        def on_gap(self, disconnected_at, reconnected_at):
+            gaps.append((disconnected_at, reconnected_at))
+            self.stop = True
+
+    client = GapClient(reconnect=True)
+    with patch.object(websocket_client, 'RECONNECT_BACKOFF', 0.0):
+        connect = run(client, [FakeSocket([ticker(1)]), FakeSocket([ticker(2)])])
+
+    assert connect.call_count == 2
+    assert client.reconnects == 1
+    assert len(gaps) == 1 and gaps[0][0] <= gaps[0][1]
+    assert client.errors == []